@@ -1,48 +1,244 @@
-from flask import Flask, request, jsonify, render_template, redirect, url_for, session
+from flask import Flask, Blueprint, current_app, request, jsonify, render_template, redirect, url_for, session, make_response, g
+from flask import Response, abort, send_file, stream_with_context
+from flask import before_render_template, template_rendered
+from werkzeug.middleware.proxy_fix import ProxyFix
 from flask_mail import Mail, Message
+from contextlib import closing
 from datetime import datetime, timedelta
 from flask_cors import CORS
+import atexit
+import click
+import csv
+import hashlib
+import hmac
+import json
+import logging
 import random
-from reportlab.pdfgen import canvas
-from reportlab.lib.pagesizes import A4
-from reportlab.lib import colors
-from reportlab.lib.units import cm
-import qrcode
-from io import BytesIO
+import re
+import time
+import uuid
+from functools import wraps
 import os
-from reportlab.lib.utils import ImageReader
-from supabase import create_client
+from io import BytesIO
 from dotenv import load_dotenv
-from flask_wtf.csrf import CSRFProtect
-
-app = Flask(__name__)
-CORS(app)
+from flask_wtf.csrf import CSRFProtect, generate_csrf
+from availability import AvailabilityGrid
+from outbox import FileStatusStore, Outbox
+from slot_calendar import SlotCalendar, diff_slots
+from storage import Lazy, SupabaseStorage, SQLiteStorage, APPOINTMENT_COLUMNS
+from verifications import (Verification, MemoryVerificationStore, FileVerificationStore,
+                           VERIFIED, CONSUMED, LOCKED, EXPIRED)
+from dedupe import DedupeCache
+from holds import FileSlotHolds, SlotHolds, held_tag
+from logs import setup_logging, parse_levels
+from profiling import RequestProfiler, route_slug
+from ratelimit import TokenBucketLimiter, take_all
+from reminders import send_in_batches
+from resilience import CircuitBreaker, ResilientCalls
+from metrics import (registry, TimedCalls, REQUEST_SECONDS, STORAGE_SECONDS, EMAIL_SECONDS,
+                     TEMPLATE_SECONDS, CACHE_TOTAL, SLOT_CONFLICTS, RATE_LIMITED, DEDUPLICATED,
+                     VERIFICATION_FAILURES)
 
 # Charger les configurations depuis .env
 load_dotenv()
 
-app.secret_key = os.getenv('SECRET_KEY')
-app.config['MAIL_SERVER'] = os.getenv('MAIL_SERVER')
-app.config['MAIL_PORT'] = int(os.getenv('MAIL_PORT'))
-app.config['MAIL_USE_TLS'] = os.getenv('MAIL_USE_TLS') == 'True'
-app.config['MAIL_USERNAME'] = os.getenv('MAIL_USERNAME')
-app.config['MAIL_PASSWORD'] = os.getenv('MAIL_PASSWORD')
-app.config['MAIL_DEFAULT_SENDER'] = os.getenv('MAIL_DEFAULT_SENDER')
-
-mail = Mail(app)
-
-# Configuration Supabase
-supabase_url = os.getenv('SUPABASE_URL')
-supabase_key = os.getenv('SUPABASE_KEY')
-supabase_client = create_client(supabase_url, supabase_key)
-
-csrf = CSRFProtect(app)  # Activer la protection CSRF
+# Rien à l'import ne touche le réseau : les clients sont créés à leur première utilisation
+# et les bibliothèques du PDF (reportlab, qrcode, PIL) à la première confirmation
+bp = Blueprint('jlpt', __name__, cli_group=None)
+log = logging.getLogger('jlpt')
+
+EXPORT_PAGE_SIZE = int(os.getenv('EXPORT_PAGE_SIZE', 500))
+# Processus utilisés pour régénérer les confirmations en lot (vide = tous les cœurs)
+PDF_WORKERS = int(os.getenv('PDF_WORKERS') or 0) or None
+# Rappels de la veille : emails par lot enregistré et débit maximal (emails/s, 0 = sans limite)
+REMINDER_BATCH_SIZE = int(os.getenv('REMINDER_BATCH_SIZE', '50'))
+REMINDER_RATE = float(os.getenv('REMINDER_RATE', '0'))
+
+mail = Mail()
+csrf = CSRFProtect()  # Activer la protection CSRF
+
+# Limites d'envoi des codes de vérification, par email et par adresse IP
+RATE_LIMIT_WINDOW = int(os.getenv('RATE_LIMIT_WINDOW', '600'))
+email_limiter = TokenBucketLimiter(int(os.getenv('RATE_LIMIT_PER_EMAIL', '3')), RATE_LIMIT_WINDOW)
+ip_limiter = TokenBucketLimiter(int(os.getenv('RATE_LIMIT_PER_IP', '10')), RATE_LIMIT_WINDOW)
+# Nombre de proxys de confiance devant l'application (nginx, répartiteur de charge) : l'adresse
+# du client, limitée ci-dessus, est alors lue dans X-Forwarded-For. 0 = exposée directement
+PROXY_FIX_HOPS = int(os.getenv('PROXY_FIX_HOPS', '0'))
+# Au-delà de ce nombre d'emails en attente, les nouvelles demandes de code sont refusées
+MAIL_MAX_BACKLOG = int(os.getenv('MAIL_MAX_BACKLOG', '200'))
+
+# Demandes identiques rapprochées (double clic, POST renvoyé par le navigateur) : une seule exécution,
+# les répétitions reçoivent la même réponse pendant DEDUPE_TTL secondes
+DEDUPE_TTL = int(os.getenv('DEDUPE_TTL', '30'))
+submissions = DedupeCache(ttl=DEDUPE_TTL)
+# Clés de session rejouées avec la réponse d'origine
+DEDUPE_SESSION_KEYS = ('verification_id', 'email_id')
+
+# Demandes en attente de leur code, gardées côté serveur : le cookie ne contient que leur id.
+# 'file' (SQLite local) est partagé par les workers gunicorn ; 'memory' suffit avec un seul processus
+VERIFICATION_TTL = int(os.getenv('VERIFICATION_TTL', '600'))
+VERIFICATION_MAX_ATTEMPTS = int(os.getenv('VERIFICATION_MAX_ATTEMPTS', '5'))
+# Créneaux retenus entre l'envoi du code et sa saisie, et statuts des emails : même magasin
+if os.getenv('VERIFICATION_STORE', 'file') == 'memory':
+    verifications = MemoryVerificationStore(ttl=VERIFICATION_TTL, max_attempts=VERIFICATION_MAX_ATTEMPTS)
+    holds = SlotHolds()
+    email_statuses = None
+else:
+    verifications = Lazy(lambda: FileVerificationStore(
+        os.getenv('VERIFICATION_STORE_PATH', 'verifications.db'),
+        ttl=VERIFICATION_TTL, max_attempts=VERIFICATION_MAX_ATTEMPTS))
+    holds = Lazy(lambda: FileSlotHolds(os.getenv('VERIFICATION_STORE_PATH', 'verifications.db')))
+    email_statuses = Lazy(lambda: FileStatusStore(os.getenv('VERIFICATION_STORE_PATH', 'verifications.db')))
+
+# Envoi des emails en arrière-plan sur des connexions SMTP réutilisées
+outbox = Outbox(
+    None, mail,
+    workers=int(os.getenv('MAIL_OUTBOX_WORKERS', '2')),
+    max_retries=int(os.getenv('MAIL_OUTBOX_RETRIES', '3')),
+    statuses=email_statuses,
+)
+# Délai laissé aux emails encore en file quand le worker s'arrête
+MAIL_DRAIN_TIMEOUT = float(os.getenv('MAIL_DRAIN_TIMEOUT', '30'))
+
+@atexit.register
+def drain_outbox():
+    # Fin du worker (gunicorn, flask run) : les threads d'envoi sont des démons, coupés avec le processus
+    if not outbox.drain(MAIL_DRAIN_TIMEOUT):
+        log.warning("arrêt avec des emails non envoyés", extra={'pending': outbox.pending()})
+
+# Appels à Supabase : délai maximal et relances des lectures
+SUPABASE_TIMEOUT = float(os.getenv('SUPABASE_TIMEOUT', '5'))
+SUPABASE_RETRIES = int(os.getenv('SUPABASE_RETRIES', '2'))
+# Lectures sans effet de bord, qui peuvent être relancées après un échec
+STORAGE_READS = ('load_slots', 'available_times', 'unavailable_dates', 'appointments_page',
+                 'appointments_on', 'reminded_ids')
+
+# Disjoncteur partagé par les appels synchrones et asynchrones (mode ASGI) à Supabase
+storage_breaker = CircuitBreaker(
+    threshold=int(os.getenv('BREAKER_THRESHOLD', '5')),
+    reset_timeout=float(os.getenv('BREAKER_RESET_TIMEOUT', '30')),
+)
+
+def supabase_options(asynchronous=False):
+    # Délais explicites. Seules des options présentes dans supabase 2.13.0 (Pipfile.lock) :
+    # le client postgrest, un par processus (Lazy), garde lui-même ses connexions keep-alive
+    import httpx
+    from supabase import AsyncClientOptions, ClientOptions
+    timeout = httpx.Timeout(SUPABASE_TIMEOUT, connect=min(SUPABASE_TIMEOUT, 2.0))
+    options = AsyncClientOptions if asynchronous else ClientOptions
+    return options(postgrest_client_timeout=timeout)
+
+def create_supabase_client():
+    # Import de supabase (httpx, postgrest...) seulement si le backend est utilisé
+    from supabase import create_client
+    return create_client(os.getenv('SUPABASE_URL'), os.getenv('SUPABASE_KEY'), options=supabase_options())
+
+# Stockage des créneaux et rendez-vous : Supabase, ou SQLite en local
+if os.getenv('STORAGE_BACKEND', 'supabase') == 'sqlite':
+    supabase_client = None
+    storage = Lazy(lambda: SQLiteStorage(os.getenv('SQLITE_PATH', 'jlpt.db')))
+else:
+    supabase_client = Lazy(create_supabase_client)
+    storage = ResilientCalls(SupabaseStorage(supabase_client), storage_breaker,
+                             retry_methods=STORAGE_READS, retries=SUPABASE_RETRIES)
+storage = TimedCalls(storage, STORAGE_SECONDS)
+
+# Grille de disponibilité partagée par /get-slots et /get-unavailable-dates ;
+# la dernière grille connue reste servie tant que le stockage est indisponible
+availability = AvailabilityGrid(lambda: storage.load_slots(), ttl=int(os.getenv('AVAILABILITY_TTL', '15')),
+                                stale_retry=int(os.getenv('AVAILABILITY_STALE_RETRY', '5')))
+# Durée pendant laquelle un navigateur ou un CDN peut réutiliser une réponse de disponibilité
+AVAILABILITY_MAX_AGE = int(os.getenv('AVAILABILITY_MAX_AGE', '5'))
+
+# Profilage cProfile à la demande : sans PROFILE_DIR, aucun hook n'est installé.
+# PROFILE_SAMPLE_RATE requêtes profilées au hasard (sur PROFILE_ROUTES si défini), plus celles
+# qui portent un en-tête X-Profile signé (flask profile-token)
+PROFILE_DIR = os.getenv('PROFILE_DIR')
+profiler = RequestProfiler(
+    PROFILE_DIR,
+    sample_rate=float(os.getenv('PROFILE_SAMPLE_RATE', '0')),
+    routes=[route.strip() for route in os.getenv('PROFILE_ROUTES', '').split(',') if route.strip()],
+    max_files=int(os.getenv('PROFILE_MAX_FILES', '200')),
+) if PROFILE_DIR else None
+
+# Métriques partagées entre les workers gunicorn : chaque processus écrit ses valeurs dans
+# METRICS_MULTIPROC_DIR et /metrics renvoie leur somme, quel que soit le worker interrogé
+METRICS_MULTIPROC_DIR = os.getenv('METRICS_MULTIPROC_DIR')
+if METRICS_MULTIPROC_DIR:
+    registry.multiprocess(METRICS_MULTIPROC_DIR, interval=float(os.getenv('METRICS_WRITE_INTERVAL', '5')))
+
+def trusted_proxy(wsgi_app):
+    # Adresse et schéma du client repris des en-têtes X-Forwarded-* posés par les proxys de confiance
+    if not PROXY_FIX_HOPS:
+        return wsgi_app
+    return ProxyFix(wsgi_app, x_for=PROXY_FIX_HOPS, x_proto=PROXY_FIX_HOPS)
+
+def create_app(config=None):
+    app = Flask(__name__)
+    CORS(app)
+
+    app.secret_key = os.getenv('SECRET_KEY')
+    # Jeton d'accès aux routes /admin (désactivées s'il n'est pas défini)
+    app.config['ADMIN_TOKEN'] = os.getenv('ADMIN_TOKEN')
+    app.config['MAIL_SERVER'] = os.getenv('MAIL_SERVER')
+    app.config['MAIL_PORT'] = int(os.getenv('MAIL_PORT', '25'))
+    app.config['MAIL_USE_TLS'] = os.getenv('MAIL_USE_TLS') == 'True'
+    app.config['MAIL_USERNAME'] = os.getenv('MAIL_USERNAME')
+    app.config['MAIL_PASSWORD'] = os.getenv('MAIL_PASSWORD')
+    app.config['MAIL_DEFAULT_SENDER'] = os.getenv('MAIL_DEFAULT_SENDER')
+    if config:
+        app.config.update(config)
+
+    # Logs JSON écrits par un thread d'arrière-plan ; INFO et DEBUG échantillonnés si LOG_SAMPLE_RATE < 1
+    setup_logging(os.getenv('LOG_LEVEL', 'INFO'), float(os.getenv('LOG_SAMPLE_RATE', '1')),
+                  parse_levels(os.getenv('LOG_LEVELS')))
+    mail.init_app(app)
+    csrf.init_app(app)
+    outbox.init_app(app)
+    app.wsgi_app = trusted_proxy(app.wsgi_app)
+    app.register_blueprint(bp)
+    before_render_template.connect(start_template_timer, app)
+    template_rendered.connect(observe_template, app)
+    if profiler is not None:
+        profiler.init_app(app)
+    return app
+
+# Mesure de la durée de chaque requête et de chaque rendu de template
+@bp.before_app_request
+def start_request_timer():
+    g.request_start = time.perf_counter()
+    # Id repris du proxy s'il en fournit un, pour suivre une requête d'un log à l'autre
+    request_id = request.headers.get('X-Request-ID', '')
+    g.request_id = request_id if re.fullmatch(r'[\w.-]{1,64}', request_id) else uuid.uuid4().hex[:16]
+
+@bp.after_app_request
+def observe_request(response):
+    start = g.pop('request_start', None)
+    if start is not None:
+        route = request.url_rule.rule if request.url_rule else 'other'
+        duration = time.perf_counter() - start
+        REQUEST_SECONDS.observe(duration, method=request.method, route=route, status=response.status_code)
+        if log.isEnabledFor(logging.INFO):
+            log.info("requête", extra={'method': request.method, 'route': route, 'status': response.status_code,
+                                       'duration_ms': round(duration * 1000, 2)})
+    if 'request_id' in g:
+        response.headers['X-Request-ID'] = g.request_id
+    return response
+
+def start_template_timer(sender, template, context, **extra):
+    g.setdefault('template_starts', []).append(time.perf_counter())
+
+def observe_template(sender, template, context, **extra):
+    starts = g.get('template_starts')
+    if starts:
+        TEMPLATE_SECONDS.observe(time.perf_counter() - starts.pop(), template=template.name)
 
 translations = {
     'fr': {
         'title': "Prise de rendez-vous pour l'inscription à l'examen JLPT",
         'date': "Date",
         'timeSlot': "",
+        'seats': "places",
         'fullName': "Nom complet",
         'phone': "Téléphone",
         'email': "Email",
@@ -61,12 +257,19 @@ translations = {
         'email_subject': "Code de vérification JLPT",
         'email_body': "Votre code de vérification pour le rendez-vous JLPT est : {code}\n\nCe code est valable pendant 10 minutes.",
         'email_error': "Erreur lors de l'envoi de l'email. Veuillez réessayer.",
+        'reminder_subject': "Rappel : votre rendez-vous JLPT de demain",
+        'reminder_body': "Bonjour {name},\n\nNous vous rappelons votre rendez-vous JLPT ({level}) le {date} à {time}.\n\nMerci de vous présenter à l'heure avec votre confirmation.",
         'redirecting': "Redirection dans 3 secondes...",
+        'slot_taken': "Ce créneau vient d'être réservé. Veuillez en choisir un autre.",
+        'rate_limited': "Trop de demandes. Veuillez réessayer dans quelques instants.",
+        'slots_unavailable': "Les créneaux sont momentanément indisponibles. Veuillez réessayer dans quelques instants.",
+        'verification_locked': "Trop de codes incorrects. Veuillez refaire votre demande de rendez-vous.",
     },
     'en': {
         'title': "Appointment booking for JLPT exam registration",
         'date': "Date",
         'timeSlot': "Time Slot",
+        'seats': "seats",
         'fullName': "Full Name",
         'phone': "Phone",
         'email': "Email",
@@ -78,6 +281,8 @@ translations = {
         'email_subject': "JLPT Verification Code",
         'email_body': "Your verification code for JLPT appointment is: {code}\n\nThis code is valid for 10 minutes.",
         'email_error': "Error sending email. Please try again.",
+        'reminder_subject': "Reminder: your JLPT appointment tomorrow",
+        'reminder_body': "Hello {name},\n\nThis is a reminder of your JLPT appointment ({level}) on {date} at {time}.\n\nPlease arrive on time with your confirmation.",
         'verification_title': "Vérification de l'email",
         'verification_message': "Un code de vérification a été envoyé à votre adresse email. Veuillez le saisir ci-dessous.",
         'verify_code': "Vérifier le code",
@@ -86,11 +291,16 @@ translations = {
         'code_expired': "Code expiré",
         'invalid_code': "Code incorrect",
         'redirecting': "Redirecting in 3 seconds...",
+        'slot_taken': "This time slot has just been booked. Please choose another one.",
+        'rate_limited': "Too many requests. Please try again shortly.",
+        'slots_unavailable': "Time slots are temporarily unavailable. Please try again shortly.",
+        'verification_locked': "Too many incorrect codes. Please submit your appointment request again.",
     },
     'ja': {
         'title': "JLPT試験申し込みの予約",
         'date': "日付",
         'timeSlot': "時間帯",
+        'seats': "席",
         'fullName': "氏名",
         'phone': "電話番号",
         'email': "メールアドレス",
@@ -102,6 +312,8 @@ translations = {
         'email_subject': "あなたのJLPT検定確認コード",
         'email_body': "ここにあなたのJLPT検定確認コードがあります: {code}",
         'email_error': "メール送信エラー",
+        'reminder_subject': "明日のJLPT予約のお知らせ",
+        'reminder_body': "{name} 様\n\n{date} {time} のJLPT（{level}）のご予約をお知らせします。\n\n確認書をお持ちのうえ、時間どおりにお越しください。",
         'verification_title': "Vérification de l'email",
         'verification_message': "Un code de vérification a été envoyé à votre adresse email. Veuillez le saisir ci-dessous.",
         'verify_code': "Vérifier le code",
@@ -110,11 +322,16 @@ translations = {
         'code_expired': "Code expiré",
         'invalid_code': "Code incorrect",
         'redirecting': "3秒後にリダイレクトします...",
+        'slot_taken': "この時間帯はすでに予約されました。別の時間帯を選んでください。",
+        'rate_limited': "リクエストが多すぎます。しばらくしてからもう一度お試しください。",
+        'slots_unavailable': "現在、時間帯を表示できません。しばらくしてからもう一度お試しください。",
+        'verification_locked': "コードの誤りが多すぎます。もう一度予約を申し込んでください。",
     },
     'ar': {
         'title': "JLPT حجز موعد للتسجيل في اختبار",
         'date': "التاريخ",
         'timeSlot': "الموعد",
+        'seats': "مقاعد",
         'fullName': "الاسم الكامل",
         'phone': "رقم الهاتف",
         'email': "البريد الإلكتروني",
@@ -126,6 +343,8 @@ translations = {
         'email_subject': "رمز التحقق من JLPT",
         'email_body': "هنا رمز التحقق من JLPT: {code}",
         'email_error': "خطأ عند إرسال البريد الإلكتروني",
+        'reminder_subject': "تذكير: موعدك في JLPT غدًا",
+        'reminder_body': "مرحبًا {name}،\n\nنذكرك بموعدك في JLPT ({level}) يوم {date} الساعة {time}.\n\nيرجى الحضور في الوقت المحدد مع تأكيد الموعد.",
         'verification_title': "Vérification de l'email",
         'verification_message': "Un code de vérification a été envoyé إلى عنوان بريدك الإلكتروني. يرجى إدخاله أدناه.",
         'verify_code': "Vérifier le code",
@@ -134,87 +353,146 @@ translations = {
         'code_expired': "Code expiré",
         'invalid_code': "Code incorrect",
         'redirecting': "...إعادة توجيه في 3 ثوان",
+        'slot_taken': "تم حجز هذا الموعد للتو. يرجى اختيار موعد آخر.",
+        'rate_limited': "طلبات كثيرة جدًا. يرجى المحاولة مرة أخرى بعد قليل.",
+        'slots_unavailable': "المواعيد غير متاحة مؤقتًا. يرجى المحاولة مرة أخرى بعد قليل.",
+        'verification_locked': "عدد كبير جدًا من الرموز الخاطئة. يرجى إعادة طلب الموعد.",
     }
 }
 
 def initialize_supabase_slots():
+    # Synchronisation incrémentale : seules les différences avec le calendrier voulu
+    # sont écrites, les réservations existantes sont conservées. Les erreurs remontent
+    # à l'appelant : (ajoutés, supprimés, capacités modifiées)
+    # Horaires, jours fermés, jours fériés et capacité : voir SlotCalendar.from_env
+    wanted = SlotCalendar.from_env().slots()
+    to_insert, to_delete, to_resize = diff_slots(wanted, storage.load_slots())
+
+    storage.insert_slots(to_insert)
+    # Les slots hors calendrier ne sont supprimés que s'ils n'ont aucune réservation
+    storage.delete_free_slots(to_delete)
+    storage.resize_slots(to_resize)
+
+    availability.invalidate()
+    return len(to_insert), len(to_delete), len(to_resize)
+
+@bp.cli.command('sync-slots')
+def sync_slots_command():
+    """Synchronise la table slots avec le calendrier."""
     try:
-        # Supprimer tous les slots existants
-        supabase_client.table('slots').delete().neq('id', 0).execute()
-        
-        start_date = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
-        end_date = datetime(2025, 3, 25)
-        
-        slots_to_insert = []
-        current_date = start_date
-        
-        while current_date <= end_date:
-            if (current_date >= datetime.now().replace(hour=0, minute=0, second=0, microsecond=0) 
-                and current_date.weekday() != 6):  # Pas de dimanches
-                current_time = datetime.strptime(f"{current_date.strftime('%Y-%m-%d')} 09:30", "%Y-%m-%d %H:%M")
-                end_time = datetime.strptime(f"{current_date.strftime('%Y-%m-%d')} 16:30", "%Y-%m-%d %H:%M")
-                
-                while current_time <= end_time:
-                    slots_to_insert.append({
-                        'date': current_time.strftime("%Y-%m-%d"),
-                        'time': current_time.strftime("%H:%M"),
-                        'available': True
-                    })
-                    current_time += timedelta(minutes=30)
-            
-            current_date += timedelta(days=1)
-        
-        # Insérer les slots par lots de 1000
-        for i in range(0, len(slots_to_insert), 1000):
-            batch = slots_to_insert[i:i+1000]
-            supabase_client.table('slots').insert(batch).execute()
-        
-        print("Base de données Supabase initialisée avec succès")
+        inserted, deleted, resized = initialize_supabase_slots()
     except Exception as e:
-        print(f"Erreur lors de l'initialisation de la base de données : {e}")
+        log.exception("échec de la synchronisation des créneaux")
+        raise click.ClickException(f"échec de la synchronisation des créneaux : {e}")
+    click.echo(f"Base de données synchronisée : {inserted} créneaux ajoutés, {deleted} supprimés, "
+               f"{resized} capacités modifiées")
 
 def get_available_slots_for_date(date):
+    # {'HH:MM': places restantes}, déduction faite des places retenues
+    try:
+        held = holds.held_counts(date)
+        seats = availability.remaining_seats(date)
+        return {slot: left - held.get(slot, 0) for slot, left in seats.items() if left > held.get(slot, 0)}
+    except Exception as e:
+        log.warning("créneaux indisponibles", extra={'error': str(e), 'date': date})
+        return {}
+
+def slot_seats(date, slot_time):
+    # Places restantes selon la grille ; en cas de doute, la réservation atomique tranche
     try:
-        response = supabase_client.table('slots') \
-            .select('time') \
-            .eq('date', date) \
-            .eq('available', True) \
-            .execute()
-        return [slot['time'] for slot in response.data]
+        return availability.remaining_seats(date).get(slot_time, 1)
     except Exception as e:
-        print(f"Erreur lors de la récupération des slots : {e}")
-        return []
+        log.warning("créneaux indisponibles", extra={'error': str(e), 'date': date})
+        return 1
 
-@app.route('/')
+@bp.route('/')
 def home():
     return redirect('/fr')  # Redirection par défaut vers la version française
 
-@app.route('/fr')
+# Pages de langue pré-rendues une fois par processus et par application ; seul le jeton CSRF,
+# propre à chaque session, est remplacé à chaque requête
+CSRF_PLACEHOLDER = '__CSRF_TOKEN__'
+
+def render_language_page(lang):
+    language_pages = current_app.extensions.setdefault('language_pages', {})
+    page = language_pages.get(lang)
+    if page is None:
+        html = render_template('index.html', t=translations[lang], lang=lang,
+                               csrf_token=lambda: CSRF_PLACEHOLDER)
+        page = (html, hashlib.sha1(html.encode()).hexdigest()[:16])
+        language_pages[lang] = page
+    html, digest = page
+
+    token = generate_csrf()
+    raw_token = session.get(current_app.config.get('WTF_CSRF_FIELD_NAME', 'csrf_token'), '')
+    # Le jeton signé reste valable une heure : au-delà de 30 minutes la page est renvoyée
+    window = int(time.time() // 1800)
+    etag = hashlib.sha1(f'{digest}:{raw_token}:{window}'.encode()).hexdigest()[:16]
+    if etag in request.if_none_match:
+        CACHE_TOTAL.inc(cache='language_page', result='not_modified')
+        response = current_app.response_class(status=304)
+    else:
+        response = make_response(html.replace(CSRF_PLACEHOLDER, token))
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = 'private, no-cache'
+    response.vary.add('Cookie')
+    return response
+
+def availability_response(etag, build):
+    # Réponse 304 sans rendu si le client possède déjà cette version des disponibilités
+    if etag in request.if_none_match:
+        CACHE_TOTAL.inc(cache='availability_response', result='not_modified')
+        response = current_app.response_class(status=304)
+    else:
+        response = make_response(build())
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = f'public, max-age={AVAILABILITY_MAX_AGE}'
+    return response
+
+@bp.route('/fr')
 def fr():
-    return render_template('index.html', t=translations['fr'], lang='fr')
+    return render_language_page('fr')
 
-@app.route('/en')
+@bp.route('/en')
 def en():
-    return render_template('index.html', t=translations['en'], lang='en')
+    return render_language_page('en')
 
-@app.route('/ja')
+@bp.route('/ja')
 def ja():
-    return render_template('index.html', t=translations['ja'], lang='ja')
+    return render_language_page('ja')
 
-@app.route('/ar')
+@bp.route('/ar')
 def ar():
-    return render_template('index.html', t=translations['ar'], lang='ar')
+    return render_language_page('ar')
 
-@app.route('/get-slots')
+@bp.route('/get-slots')
 def get_slots():
-    date = request.args.get('date')
+    date = request.args.get('date', '')
     lang = request.args.get('lang', 'fr')
-    slots = get_available_slots_for_date(date)
-    return render_template('slots.html', slots=slots, t=translations[lang])
+    if lang not in translations:
+        lang = 'fr'
+    # La date et la langue entrent dans l'ETag : rien d'autre que AAAA-MM-JJ n'est accepté
+    if not re.fullmatch(r'\d{4}-\d{2}-\d{2}', date):
+        return jsonify({'error': 'date must be YYYY-MM-DD'}), 400
+    try:
+        etag = f'{lang}-{date}-{availability.day_version(date)}-{held_tag(holds.held_counts(date))}'
+    except Exception as e:
+        # Aucune grille connue : le dire plutôt que d'afficher une journée sans créneaux
+        log.warning("créneaux indisponibles", extra={'error': str(e), 'date': date})
+        return render_template('slots.html', slots={}, t=translations[lang],
+                               error=translations[lang]['slots_unavailable'])
+    return availability_response(etag, lambda: render_template(
+        'slots.html', slots=get_available_slots_for_date(date), t=translations[lang]))
+
+def generate_appointment_pdf(data):
+    # reportlab, qrcode et PIL ne sont importés qu'à la première confirmation
+    from pdf import generate_appointment_pdf
+    return generate_appointment_pdf(data)
 
 def generate_verification_code():
     return str(random.randint(100000, 999999))
 
+@EMAIL_SECONDS.time(kind='verification')
 def send_verification_email(email, code, lang):
     try:
         subject = translations[lang]['email_subject']
@@ -226,13 +504,24 @@ def send_verification_email(email, code, lang):
             body=body
         )
         
-        mail.send(msg)
-        return True
-    except Exception as e:
-        print(f"Erreur d'envoi d'email: {e}")
-        return False
-
-@app.route('/save-appointment', methods=['POST'])
+        # Id du message, à suivre sur /email-status ; None si l'email n'a pas pu être mis en file
+        return outbox.submit(msg)
+    except Exception:
+        log.exception("échec de la mise en file de l'email", extra={'email': email})
+        return None
+
+def rate_limit_verification(email, ip):
+    # Renvoie 0 si un code peut être envoyé, sinon le délai (en secondes) avant de réessayer
+    if outbox.pending() >= MAIL_MAX_BACKLOG:
+        RATE_LIMITED.inc(reason='mail_backlog')
+        return 5
+    # Les deux seaux sont vérifiés avant d'en consommer un : un email limité ne coûte rien à l'adresse IP
+    refused, wait = take_all((ip_limiter, ip), (email_limiter, email))
+    if refused is not None:
+        RATE_LIMITED.inc(reason=('ip', 'email')[refused])
+    return wait
+
+@bp.route('/save-appointment', methods=['POST'])
 def save_appointment():
     lang = request.form.get('lang', 'fr')
     if lang not in translations:
@@ -245,107 +534,71 @@ def save_appointment():
     email = request.form.get('email')
     jlpt_level = request.form.get('jlpt_level')
 
-    print(f"Données reçues: date={date}, time={time}, name={name}, phone={phone}, email={email}, jlpt_level={jlpt_level}")  # Debug
-
     if not all([date, time, name, phone, email, jlpt_level]):
-        print("Champs manquants:", {
-            'date': bool(date),
-            'time': bool(time),
-            'name': bool(name),
-            'phone': bool(phone),
-            'email': bool(email),
-            'jlpt_level': bool(jlpt_level)
-        })  # Debug
+        missing = [field for field, value in (('date', date), ('time', time), ('name', name), ('phone', phone),
+                                              ('email', email), ('jlpt_level', jlpt_level)) if not value]
+        log.info("demande incomplète", extra={'missing': missing})
         return render_template('error.html', 
                              t=translations[lang], 
                              lang=lang,
-                             error_message="Tous les champs sont requis")
+                             error_message=translations[lang]['error'])
+
+    # Même navigateur, même email et même créneau : un seul code et un seul email, la répétition
+    # reçoit la même page (et le même id de demande, qui ne doit pas passer à un autre navigateur)
+    return deduplicated(('save', browser_key(), email.lower(), date, time),
+                        lambda: request_verification(lang, date, time, name, phone, email, jlpt_level))
+
+def request_verification(lang, date, time, name, phone, email, jlpt_level):
+    # Refuser vite, sans retenir le créneau ni envoyer d'email, au-delà des limites
+    retry_after = rate_limit_verification(email.lower(), request.remote_addr)
+    if retry_after:
+        response = make_response(render_template('error.html',
+                                                 t=translations[lang],
+                                                 lang=lang,
+                                                 error_message=translations[lang]['rate_limited']), 429)
+        response.headers['Retry-After'] = str(retry_after)
+        return response
+
+    # Retenir le créneau jusqu'à l'expiration du code, avant d'envoyer l'email
+    expires = datetime.now() + timedelta(seconds=VERIFICATION_TTL)
+    if not holds.hold(date, time, email.lower(), expires, seats=slot_seats(date, time)):
+        SLOT_CONFLICTS.inc(stage='hold')
+        return render_template('error.html',
+                             t=translations[lang],
+                             lang=lang,
+                             error_message=translations[lang]['slot_taken'])
 
     # Générer et envoyer le code de vérification
     verification_code = generate_verification_code()
-    send_verification_email(email, verification_code, lang)
-
-    # Stocker les données dans la session
-    session['verification_data'] = {
-        'code': verification_code,
-        'date': date,
-        'time': time,
-        'name': name,
-        'phone': phone,
-        'email': email,
-        'jlpt_level': jlpt_level,
-        'expires': (datetime.now() + timedelta(minutes=10)).isoformat()
-    }
-
-    print("Code de vérification généré:", verification_code)  # Debug
-    print("Données stockées dans la session:", session['verification_data'])  # Debug
-
-    return render_template('verify.html', t=translations[lang], lang=lang)
-
-def generate_appointment_pdf(data, lang):
-    buffer = BytesIO()
-    c = canvas.Canvas(buffer, pagesize=A4)
-    width, height = A4
-
-    # Fond blanc
-    c.setFillColor(colors.white)
-    c.rect(0, 0, width, height, fill=True)
-
-    # Logo
-    logo_path = "logo_horizontal.png"
-    img = ImageReader(logo_path)
-    logo_width = 10*cm
-    logo_height = 2.5*cm  # Réduit un peu la hauteur
-    x = (width - logo_width) / 2
-    y_logo = height - 3*cm
-    c.drawImage(img, x, y_logo, width=logo_width, height=logo_height, mask='auto')
-    
-    # Titre
-    c.setFillColor(colors.black)  # Remettre la couleur en noir pour le texte
-    c.setFont("Helvetica-Bold", 20)
-    y_title = y_logo - 2*cm
-    c.drawString(2*cm, y_title, "JLPT - Confirmation de rendez-vous")
-    
-    # Informations du rendez-vous
-    c.setFont("Helvetica", 12)
-    y = y_title - 2*cm  # Commencer les détails 2cm sous le titre
-    
-    details = [
-        f"Nom : {data['name']}",
-        f"Email : {data['email']}",
-        f"Téléphone : {data['phone']}",
-        f"Date : {data['date']}",
-        f"Heure : {data['time']}",
-        f"Niveau JLPT : {data['jlpt_level']}",
-        "\nLieu : Institut Torii",
-    ]
-    
-    # Debug : imprimer les données
-    print("Données pour le PDF:", data)
-    
-    for line in details:
-        c.drawString(2*cm, y, line)
-        y -= 1*cm  # Espacement d'1cm entre chaque ligne
-    
-    # QR Code
-    qr = qrcode.QRCode(version=1, box_size=10, border=5)
-    qr.add_data("https://maps.app.goo.gl/NRyzbD337Rrkokh5A")
-    qr.make(fit=True)
-    qr_img = qr.make_image(fill_color="black", back_color="white")
-    
-    temp_qr_path = "temp_qr.png"
-    qr_img.save(temp_qr_path)
-    
-    c.drawString(2*cm, y-1*cm, "Scannez pour la localisation :")
-    c.drawImage(temp_qr_path, 2*cm, y-7*cm, width=5*cm, height=5*cm)
-    
-    os.remove(temp_qr_path)
-    
-    c.save()
-    buffer.seek(0)
-    return buffer
-
-def send_confirmation_email(email, pdf_buffer, lang):
+    email_id = send_verification_email(email, verification_code, lang)
+
+    # Stocker la demande côté serveur (la langue sert aux rappels de la veille) ;
+    # la session ne garde que son id, une demande précédente est remplacée et son créneau libéré
+    previous_id = session.get('verification_id')
+    previous = verifications.get(previous_id) if previous_id else None
+    session['verification_id'] = verifications.create(
+        Verification(verification_code, date, time, name, phone, email, jlpt_level, lang),
+        replace=previous_id)
+    if previous is not None and (previous.date, previous.time, previous.email.lower()) != (date, time, email.lower()):
+        holds.release(previous.date, previous.time, previous.email.lower())
+
+    log.info("code de vérification envoyé", extra={'email': email, 'date': date, 'time': time,
+                                                     'jlpt_level': jlpt_level, 'lang': lang})
+
+    return with_email_id(render_template('verify.html', t=translations[lang], lang=lang), email_id)
+
+def with_email_id(page, email_id):
+    # Id de l'email dans la session (GET /email-status) et dans l'en-tête X-Email-Id
+    response = make_response(page)
+    if email_id:
+        session['email_id'] = email_id
+        response.headers['X-Email-Id'] = email_id
+    else:
+        session.pop('email_id', None)
+    return response
+
+@EMAIL_SECONDS.time(kind='confirmation')
+def send_confirmation_email(email, pdf_buffer, lang, block=False):
     try:
         msg = Message(
             subject="Confirmation de rendez-vous JLPT",
@@ -360,81 +613,396 @@ def send_confirmation_email(email, pdf_buffer, lang):
             pdf_buffer.getvalue()
         )
         
-        mail.send(msg)
-        return True
-    except Exception as e:
-        print(f"Erreur d'envoi d'email: {e}")
-        return False
-
-@app.route('/verify-code', methods=['POST'])
-def verify_code():
-    lang = request.form.get('lang', 'fr')
-    submitted_code = request.form.get('code')
-    
-    verification_data = session.get('verification_data')
-    if not verification_data:
+        return outbox.submit(msg, block=block)
+    except Exception:
+        log.exception("échec de la mise en file de l'email", extra={'email': email})
+        return None
+
+def dedupe_outcome(response):
+    # Ce qu'il faut pour rejouer la réponse : corps, statut, en-têtes et état de la session
+    headers = [(name, value) for name, value in response.headers
+               if name.lower() not in ('set-cookie', 'content-length')]
+    changes = {key: session.get(key) for key in DEDUPE_SESSION_KEYS}
+    return response.get_data(), response.status_code, headers, changes
+
+def replay(outcome, route):
+    body, status, headers, changes = outcome
+    for key, value in changes.items():
+        if value is None:
+            session.pop(key, None)
+        else:
+            session[key] = value
+    DEDUPLICATED.inc(route=route)
+    log.info("demande répétée, réponse d'origine renvoyée", extra={'route': route})
+    return current_app.response_class(body, status=status, headers=headers)
+
+def deduplicated(key, view):
+    # Regroupement propre au processus : entre workers, seule la consommation atomique du code
+    # (verifications.check) empêche une seconde réservation
+    owner, entry = submissions.claim(key)
+    if not owner:
+        outcome = entry.wait(DEDUPE_TTL)
+        if outcome is None:
+            # La première demande a échoué : celle-ci est traitée normalement
+            return view()
+        return replay(outcome, key[0])
+    try:
+        response = make_response(view())
+    except Exception:
+        submissions.abandon(key)
+        raise
+    submissions.finish(key, dedupe_outcome(response))
+    return response
+
+def browser_key():
+    # Secret CSRF de la session : propre au navigateur et présent dès l'affichage du formulaire
+    return session.get(current_app.config.get('WTF_CSRF_FIELD_NAME', 'csrf_token'))
+
+def verification_key(verification_id):
+    return ('verify', verification_id)
+
+def pending_verification():
+    # Demande désignée par la session si le code soumis est valide et n'a pas expiré,
+    # sinon (None, message d'erreur, CONSUMED ou None)
+    verification_id = session.get('verification_id')
+    if not verification_id:
+        return None, None
+
+    status, record = verifications.check(verification_id, request.form.get('code'))
+    if status == VERIFIED:
+        verification_data = record.booking()
+        verification_data['id'] = verification_id
+        return verification_data, None
+    if status == CONSUMED:
+        # Code déjà accepté, éventuellement par un autre worker : pas de seconde réservation
+        session.pop('verification_id', None)
+        return None, CONSUMED
+
+    VERIFICATION_FAILURES.inc(reason=status)
+    if status == EXPIRED:
+        # La retenue du créneau a expiré en même temps que le code
+        session.pop('verification_id', None)
+    elif status == LOCKED:
+        # Trop d'essais : la demande est supprimée et le créneau libéré pour les autres candidats
+        holds.release(record.date, record.time, record.email.lower())
+        session.pop('verification_id', None)
+        log.warning("demande bloquée après trop de codes incorrects",
+                    extra={'email': record.email, 'date': record.date, 'time': record.time})
+        return None, 'verification_locked'
+    return None, None
+
+def verification_error(lang, error=None):
+    if error is None:
         return render_template('error.html', t=translations[lang], lang=lang)
+    return render_template('error.html', t=translations[lang], lang=lang,
+                           error_message=translations[lang][error])
+
+def complete_booking(verification_data, appointment_id, lang):
+    # Suite de la réservation, une fois book_slot appelé (partagée avec le mode ASGI)
+    holds.release(verification_data['date'], verification_data['time'], verification_data['email'].lower())
+    if appointment_id is None:
+        # Les dernières places ont été prises entre-temps : la grille locale était en retard
+        availability.invalidate()
+        SLOT_CONFLICTS.inc(stage='booking')
+        verifications.delete(verification_data['id'])
+        session.pop('verification_id', None)
+        return render_template('error.html',
+                             t=translations[lang],
+                             lang=lang,
+                             error_message=translations[lang]['slot_taken'])
+    availability.book_seat(verification_data['date'], verification_data['time'])
+    
+    # Générer et envoyer le PDF de confirmation
+    pdf_buffer = generate_appointment_pdf(verification_data)
+    email_id = send_confirmation_email(verification_data['email'], pdf_buffer, lang)
+    
+    # La demande consommée reste jusqu'à son expiration : une répétition sur un autre worker
+    # reçoit CONSUMED et la page de confirmation, sans nouvelle réservation
+    session.pop('verification_id', None)
+    
+    # Afficher la page de succès
+    return with_email_id(render_template('success.html', t=translations[lang], lang=lang), email_id)
 
-    if datetime.now() > datetime.fromisoformat(verification_data['expires']):
-        session.pop('verification_data', None)
-        return render_template('error.html', t=translations[lang], lang=lang)
+@bp.route('/verify-code', methods=['POST'])
+def verify_code():
+    return confirm_verification(storage.book_slot)
 
-    if submitted_code != verification_data['code']:
-        return render_template('error.html', t=translations[lang], lang=lang)
+def confirm_verification(book_slot):
+    # Vue de /verify-code, partagée avec le mode ASGI qui réserve avec le client asynchrone
+    lang = request.form.get('lang', 'fr')
+    # Un POST répété après la réservation (demande déjà supprimée) reçoit la page d'origine
+    key = verification_key(session.get('verification_id'))
+    entry = submissions.peek(key)
+    if entry is not None:
+        outcome = entry.wait(DEDUPE_TTL)
+        if outcome is not None:
+            return replay(outcome, key[0])
+
+    verification_data, error = pending_verification()
+    if error == CONSUMED:
+        DEDUPLICATED.inc(route='verify')
+        log.info("code déjà utilisé, page de confirmation renvoyée")
+        return render_template('success.html', t=translations[lang], lang=lang)
+    if verification_data is None:
+        return verification_error(lang, error)
 
     try:
-        # Mettre à jour le slot comme non disponible
-        supabase_client.table('slots') \
-            .update({'available': False}) \
-            .eq('date', verification_data['date']) \
-            .eq('time', verification_data['time']) \
-            .execute()
-        
-        # Sauvegarder le rendez-vous
-        supabase_client.table('appointments') \
-            .insert({
-                'date': verification_data['date'],
-                'time': verification_data['time'],
-                'name': verification_data['name'],
-                'phone': verification_data['phone'],
-                'email': verification_data['email'],
-                'jlpt_level': verification_data['jlpt_level']
-            }) \
-            .execute()
-        
-        # Générer et envoyer le PDF de confirmation
-        pdf_buffer = generate_appointment_pdf(verification_data, lang)
-        send_confirmation_email(verification_data['email'], pdf_buffer, lang)
-        
-        session.pop('verification_data', None)
-        
-        # Afficher la page de succès
-        return render_template('success.html', t=translations[lang], lang=lang)
-    except Exception as e:
-        print(f"Erreur : {e}")
+        # Réserver le créneau et enregistrer le rendez-vous en un seul aller-retour. La
+        # consommation du code (pending_verification) garantit une seule réservation, PDF et
+        # email entre workers ; dans ce processus, un POST répété reçoit en plus la page d'origine
+        return deduplicated(key, lambda: complete_booking(
+            verification_data, book_slot(verification_data), lang))
+    except Exception:
+        # Réservation non faite : le candidat peut réessayer avec le même code
+        verifications.reopen(verification_data['id'])
+        log.exception("échec de la réservation", extra={'date': verification_data['date'],
+                                                         'time': verification_data['time']})
         return render_template('error.html', t=translations[lang], lang=lang)
 
-@app.route('/change-language')
+@bp.route('/change-language')
 def change_language():
     lang = request.args.get('lang', 'fr')
     if lang not in translations:
         lang = 'fr'
-    return render_template('index.html', t=translations[lang], lang=lang)
+    return render_language_page(lang)
+
+def storage_unavailable(response):
+    # Même forme de réponse, mais signalée comme indisponible et jamais mise en cache
+    response.status_code = 503
+    response.headers['Retry-After'] = str(availability.stale_retry)
+    response.headers['Cache-Control'] = 'no-store'
+    return response
 
-@app.route('/get-unavailable-dates')
+@bp.route('/get-unavailable-dates')
 def get_unavailable_dates():
     try:
-        response = supabase_client.table('slots') \
-            .select('date') \
-            .eq('available', False) \
-            .execute()
-        return jsonify([slot['date'] for slot in response.data])
+        return availability_response(availability.version(),
+                                      lambda: jsonify(availability.unavailable_dates()))
     except Exception as e:
-        print(f"Erreur lors de la récupération des dates indisponibles : {e}")
-        return jsonify([])
-
-# Initialiser la base de données au démarrage de l'application
-initialize_supabase_slots()
+        log.warning("dates indisponibles non chargées", extra={'error': str(e)})
+        return storage_unavailable(jsonify([]))
+
+@bp.route('/email-status')
+@bp.route('/email-status/<message_id>')
+def email_status(message_id=None):
+    # Sans id : dernier email (code ou confirmation) envoyé pour cette session
+    message_id = message_id or session.get('email_id')
+    status = outbox.status(message_id) if message_id else None
+    if status is None:
+        return jsonify({'error': 'unknown message'}), 404
+    return jsonify({'id': message_id, 'status': status})
+
+@bp.route('/availability')
+def month_availability():
+    month = request.args.get('month', '')
+    if not re.fullmatch(r'\d{4}-(0[1-9]|1[0-2])', month):
+        return jsonify({'error': 'month must be YYYY-MM'}), 400
+    try:
+        return availability_response(
+            f'{month}-{availability.version()}',
+            lambda: jsonify({'month': month, 'days': availability.month_summary(month)}))
+    except Exception as e:
+        log.warning("disponibilités du mois non chargées", extra={'error': str(e), 'month': month})
+        return storage_unavailable(jsonify({'month': month, 'days': []}))
+
+def admin_required(view):
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        expected = current_app.config.get('ADMIN_TOKEN')
+        token = request.headers.get('Authorization', '').removeprefix('Bearer ')
+        if not expected or not hmac.compare_digest(token.encode(), expected.encode()):
+            abort(403)
+        return view(*args, **kwargs)
+    return wrapper
+
+def iter_appointments(page_size=None, **filters):
+    # Parcours par pages avec une clé (date, time, id) : mémoire constante, pas de limite de lignes
+    page_size = page_size or EXPORT_PAGE_SIZE
+    after = None
+    while True:
+        page = storage.appointments_page(after=after, limit=page_size, **filters)
+        yield from page
+        if len(page) < page_size:
+            return
+        last = page[-1]
+        after = (last['date'], last['time'], last['id'])
+
+class _Line:
+    # Tampon minimal pour csv.writer : renvoie la ligne écrite au lieu de l'accumuler
+    def write(self, line):
+        return line
+
+def export_csv(appointments):
+    writer = csv.writer(_Line())
+    yield writer.writerow(APPOINTMENT_COLUMNS)
+    for appointment in appointments:
+        yield writer.writerow([appointment[column] for column in APPOINTMENT_COLUMNS])
+
+def export_ndjson(appointments):
+    for appointment in appointments:
+        yield json.dumps(appointment, ensure_ascii=False, default=str) + '\n'
+
+@bp.route('/admin/export')
+@admin_required
+def export_appointments():
+    export_format = request.args.get('format', 'csv')
+    if export_format not in ('csv', 'ndjson'):
+        return jsonify({'error': 'format must be csv or ndjson'}), 400
+    filters = {
+        'date_from': request.args.get('from'),
+        'date_to': request.args.get('to'),
+        'jlpt_level': request.args.get('level'),
+    }
+    appointments = iter_appointments(**filters)
+    if export_format == 'csv':
+        body, mimetype = export_csv(appointments), 'text/csv'
+    else:
+        body, mimetype = export_ndjson(appointments), 'application/x-ndjson'
+    response = Response(stream_with_context(body), mimetype=mimetype)
+    response.headers['Content-Disposition'] = f'attachment; filename=appointments.{export_format}'
+    return response
+
+def confirmation_files(appointments, resend=False, lang='fr'):
+    # (nom du fichier, PDF) pour chaque rendez-vous, avec renvoi facultatif par l'outbox
+    from pdf import render_many, confirmation_filename
+    for appointment, pdf in render_many(appointments, workers=PDF_WORKERS):
+        if resend:
+            # Attendre une place dans la file plutôt que perdre des emails sur un gros lot
+            send_confirmation_email(appointment['email'], BytesIO(pdf), lang, block=True)
+        yield confirmation_filename(appointment), pdf
+
+def confirmation_filters(date, date_from, date_to, level):
+    return {'date_from': date or date_from, 'date_to': date or date_to, 'jlpt_level': level}
+
+@bp.route('/admin/confirmations.zip')
+@admin_required
+def export_confirmations():
+    filters = confirmation_filters(request.args.get('date'), request.args.get('from'),
+                                   request.args.get('to'), request.args.get('level'))
+    if not filters['date_from'] and not filters['date_to']:
+        return jsonify({'error': 'date or from/to is required'}), 400
+    from pdf import zip_stream
+    # Téléchargement seul : un GET rejoué (rechargement, reprise, proxy) ne doit pas renvoyer d'emails.
+    # Le renvoi passe par `flask render-confirmations --resend`
+    files = confirmation_files(iter_appointments(**filters))
+    response = Response(stream_with_context(zip_stream(files)), mimetype='application/zip')
+    response.headers['Content-Disposition'] = 'attachment; filename=confirmations.zip'
+    return response
+
+@bp.cli.command('render-confirmations')
+@click.option('--date', help="Jour des rendez-vous (AAAA-MM-JJ)")
+@click.option('--from', 'date_from', help="Premier jour inclus")
+@click.option('--to', 'date_to', help="Dernier jour inclus")
+@click.option('--level', help="Niveau JLPT (N1 à N5)")
+@click.option('--output', default='confirmations.zip', show_default=True, help="Archive ZIP à écrire")
+@click.option('--resend', is_flag=True, help="Renvoyer aussi chaque confirmation par email")
+@click.option('--lang', default='fr', show_default=True)
+def render_confirmations_command(date, date_from, date_to, level, output, resend, lang):
+    """Régénère en parallèle les PDF de confirmation dans une archive ZIP."""
+    filters = confirmation_filters(date, date_from, date_to, level)
+    if not filters['date_from'] and not filters['date_to']:
+        raise click.UsageError("--date ou --from/--to est requis")
+    from pdf import zip_stream
+    count = 0
+    with open(output, 'wb') as archive:
+        def counted(files):
+            nonlocal count
+            for name, pdf in files:
+                count += 1
+                yield name, pdf
+        for chunk in zip_stream(counted(confirmation_files(iter_appointments(**filters), resend, lang))):
+            archive.write(chunk)
+    print(f"{count} confirmations écrites dans {output}")
+    if resend:
+        # Laisser l'outbox finir les envois avant de quitter
+        outbox.drain()
+
+@bp.route('/admin/profiles')
+@admin_required
+def list_profiles():
+    # Captures les plus lentes, tous workers confondus ; ?route=verify-code pour filtrer
+    if profiler is None:
+        abort(404)
+    route = request.args.get('route')
+    captures = [capture for capture in profiler.captures(limit=None)
+                if not route or capture['route'] == route_slug(route)]
+    limit = request.args.get('limit', '50')
+    return jsonify({'profiles': captures[:int(limit) if limit.isdigit() else 50]})
+
+@bp.route('/admin/profiles/<name>')
+@admin_required
+def download_profile(name):
+    path = profiler.path(name) if profiler is not None else None
+    if path is None:
+        abort(404)
+    return send_file(path, mimetype='application/octet-stream', as_attachment=True, download_name=name)
+
+@bp.cli.command('profile-token')
+def profile_token_command():
+    """Affiche une valeur d'en-tête X-Profile (profilage d'une requête à la demande)."""
+    if profiler is None:
+        raise click.UsageError("PROFILE_DIR n'est pas défini : le profilage est désactivé")
+    print(profiler.token())
+
+def reminder_message(appointment):
+    t = translations.get(appointment.get('lang'), translations['fr'])
+    return Message(
+        subject=t['reminder_subject'],
+        recipients=[appointment['email']],
+        body=t['reminder_body'].format(name=appointment['name'], date=appointment['date'],
+                                       time=appointment['time'], level=appointment['jlpt_level'])
+    )
+
+def send_reminders(date, dry_run=False):
+    # Rappels des rendez-vous du jour donné, hors de ceux déjà envoyés (relance sans doublon).
+    # Renvoie (envoyés, en échec, déjà envoyés)
+    appointments = storage.appointments_on(date)
+    reminded = storage.reminded_ids([a['id'] for a in appointments]) if appointments else set()
+    pending = [a for a in appointments if a['id'] not in reminded]
+    if dry_run:
+        return len(pending), 0, len(reminded)
+    sent = failed = 0
+    messages = ((a['id'], reminder_message(a)) for a in pending)
+    with closing(send_in_batches(mail, messages, REMINDER_BATCH_SIZE, REMINDER_RATE)) as batches:
+        for batch, errors in batches:
+            # Enregistré lot par lot : une interruption ne renverra que le lot en cours.
+            # Un lot non enregistré arrête l'envoi : une relance renverrait tous les suivants
+            if batch:
+                try:
+                    storage.record_reminders(batch)
+                except Exception as e:
+                    log.exception("rappels envoyés mais non enregistrés", extra={'count': len(batch)})
+                    raise click.ClickException(
+                        f"{sent + len(batch)} rappels envoyés pour le {date} mais {len(batch)} non enregistrés "
+                        f"({e}) ; envoi interrompu, une relance renverra ces {len(batch)} rappels") from e
+            sent += len(batch)
+            failed += len(errors)
+    return sent, failed, len(reminded)
+
+@bp.cli.command('send-reminders')
+@click.option('--date', help="Jour des rendez-vous (AAAA-MM-JJ), demain par défaut")
+@click.option('--dry-run', is_flag=True, help="Compter les rappels sans les envoyer")
+def send_reminders_command(date, dry_run):
+    """Envoie les rappels des rendez-vous du lendemain (à planifier, par exemple avec cron)."""
+    if date is None:
+        date = (datetime.now() + timedelta(days=1)).strftime("%Y-%m-%d")
+    elif not re.fullmatch(r'\d{4}-\d{2}-\d{2}', date):
+        raise click.BadParameter("format attendu : AAAA-MM-JJ", param_hint='--date')
+    sent, failed, skipped = send_reminders(date, dry_run)
+    if dry_run:
+        print(f"{sent} rappels à envoyer pour le {date} ({skipped} déjà envoyés)")
+        return
+    print(f"{sent} rappels envoyés pour le {date}, {failed} en échec, {skipped} déjà envoyés")
+    if failed:
+        raise SystemExit(1)
+
+@bp.route('/metrics')
+def metrics():
+    return current_app.response_class(registry.render(), mimetype='text/plain; version=0.0.4')
+
+# Les créneaux ne sont plus synchronisés au démarrage : `flask --app app sync-slots`.
+# Point d'entrée des serveurs (gunicorn app:app) : create_app() n'en crée d'autres que pour les tests
+app = create_app()
 
 # Au démarrage de l'application
 if __name__ == '__main__':
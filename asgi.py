@@ -0,0 +1,303 @@
+"""Mode de service asynchrone (ASGI).
+
+    uvicorn asgi:application --workers 2
+
+Les routes qui attendent surtout le réseau (disponibilités, demande de code,
+réservation) passent par la boucle d'événements : lecture des créneaux et
+réservation avec le client Supabase asynchrone, emails envoyés par aiosmtplib.
+Les vues, qui lisent ou écrivent dans le magasin des vérifications (retenues
+des créneaux, demandes de code), tournent dans un thread ; la confirmation ne
+rend la main à la boucle que pour la réservation. Toutes les autres routes sont celles de Flask,
+exécutées dans un pool de threads par asgiref. À l'arrêt (lifespan), le
+worker attend les emails encore en file.
+
+Dépendances supplémentaires : asgiref, aiosmtplib et un serveur ASGI (uvicorn).
+"""
+import asyncio
+import logging
+import os
+import sys
+from io import BytesIO
+
+import aiosmtplib
+from asgiref.wsgi import WsgiToAsgi
+from flask import request
+from supabase import acreate_client
+
+import app as app_module
+from app import app
+from metrics import SMTP_SECONDS, EMAIL_FAILURES, STORAGE_SECONDS, TimedCalls
+from outbox import Outbox, _Job, QUEUED, SENDING, RETRYING, SENT, FAILED
+from resilience import ResilientCalls
+from storage import AsyncSupabaseStorage
+
+log = logging.getLogger('jlpt.asgi')
+
+
+class ThreadedStorage:
+    """Stockage synchrone (SQLite) appelé depuis la boucle via un thread."""
+
+    def __init__(self, storage):
+        self.storage = storage
+
+    async def load_slots(self):
+        return await asyncio.to_thread(self.storage.load_slots)
+
+    async def book_slot(self, data):
+        return await asyncio.to_thread(self.storage.book_slot, data)
+
+
+class AsyncOutbox(Outbox):
+    """Outbox dont les emails partent sur la boucle d'événements avec aiosmtplib.
+
+    `connections` borne le nombre de sessions SMTP simultanées. submit() peut
+    être appelé depuis la boucle comme depuis les threads des routes Flask.
+    """
+
+    def __init__(self, app, loop, connections=10, max_retries=3, backoff=2.0, history=10000, statuses=None):
+        super().__init__(app, None, workers=connections, max_retries=max_retries,
+                         backoff=backoff, history=history, statuses=statuses)
+        self._loop = loop
+        self._semaphore = asyncio.Semaphore(connections)
+        self._tasks = set()
+        self._pending = 0
+
+    def submit(self, message, block=False):
+        job = _Job(message)
+        with self.app.app_context():
+            # Sérialisé tout de suite : Flask-Mail a besoin du contexte de l'application
+            raw = message.as_bytes()
+        self._set_status(job.id, QUEUED)
+        with self._lock:
+            self._pending += 1
+        self._loop.call_soon_threadsafe(self._spawn, job, raw, message.sender, list(message.send_to))
+        return job.id
+
+    def pending(self):
+        return self._pending
+
+    def _spawn(self, job, raw, sender, recipients):
+        task = self._loop.create_task(self._deliver(job, raw, sender, recipients))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _publish(self, job_id, status):
+        # Statut partagé écrit dans SQLite : hors de la boucle
+        if self.statuses is None:
+            self._set_status(job_id, status)
+        else:
+            await asyncio.to_thread(self._set_status, job_id, status)
+
+    async def _deliver(self, job, raw, sender, recipients):
+        config = self.app.config
+        try:
+            while True:
+                await self._publish(job.id, SENDING)
+                try:
+                    async with self._semaphore:
+                        with SMTP_SECONDS.time():
+                            await aiosmtplib.send(
+                                raw, sender=sender, recipients=recipients,
+                                hostname=config['MAIL_SERVER'], port=config['MAIL_PORT'],
+                                username=config.get('MAIL_USERNAME'), password=config.get('MAIL_PASSWORD'),
+                                start_tls=config.get('MAIL_USE_TLS', False))
+                    await self._publish(job.id, SENT)
+                    return
+                except Exception as e:
+                    log.warning("échec d'envoi d'email", extra={'error': str(e), 'attempt': job.attempts + 1})
+                    job.attempts += 1
+                    if job.attempts > self.max_retries:
+                        EMAIL_FAILURES.inc(stage='delivery')
+                        await self._publish(job.id, FAILED)
+                        return
+                    await self._publish(job.id, RETRYING)
+                    await asyncio.sleep(self.backoff * 2 ** (job.attempts - 1))
+        finally:
+            with self._lock:
+                self._pending -= 1
+
+
+async_storage = None
+_started = None
+_refresh_lock = None
+
+
+async def startup():
+    global async_storage, _refresh_lock
+    loop = asyncio.get_running_loop()
+    _refresh_lock = asyncio.Lock()
+    # Les fonctions de app.py lisent la variable globale outbox à chaque envoi
+    app_module.outbox = AsyncOutbox(
+        app, loop,
+        connections=int(os.getenv('MAIL_ASYNC_CONNECTIONS', '10')),
+        max_retries=int(os.getenv('MAIL_OUTBOX_RETRIES', '3')),
+        statuses=app_module.email_statuses,
+    )
+    if app_module.supabase_client is None:
+        # app_module.storage mesure déjà la durée de ses appels
+        async_storage = ThreadedStorage(app_module.storage)
+    else:
+        client = await acreate_client(os.getenv('SUPABASE_URL'), os.getenv('SUPABASE_KEY'),
+                                      options=app_module.supabase_options(asynchronous=True))
+        # Même disjoncteur que les appels synchrones : un backend en panne l'est pour les deux
+        async_storage = TimedCalls(
+            ResilientCalls(AsyncSupabaseStorage(client), app_module.storage_breaker,
+                           retry_methods=app_module.STORAGE_READS, retries=app_module.SUPABASE_RETRIES),
+            STORAGE_SECONDS)
+
+
+async def ensure_started():
+    # Au premier appel (lifespan, ou première requête si le serveur n'envoie pas lifespan)
+    global _started
+    if _started is None:
+        _started = asyncio.ensure_future(startup())
+    await _started
+
+
+async def refresh_availability():
+    # Recharge la grille sans bloquer la boucle ; les vues Flask la trouvent ensuite à jour
+    availability = app_module.availability
+    if availability.is_fresh():
+        return
+    async with _refresh_lock:
+        if not availability.is_fresh():
+            try:
+                availability.refresh(await async_storage.load_slots())
+            except Exception as e:
+                log.warning("créneaux indisponibles", extra={'error': str(e)})
+                # Sans grille connue, la vue Flask renvoie sa réponse d'indisponibilité
+                availability.serve_stale()
+
+
+def run_view():
+    return app.view_functions[request.url_rule.endpoint](**request.view_args)
+
+
+async def availability_view():
+    await refresh_availability()
+    # La vue lit les retenues des créneaux (SQLite avec VERIFICATION_STORE=file) et, sans grille
+    # (stockage en panne au premier chargement), retente le chargement synchrone : hors de la boucle
+    return await asyncio.to_thread(run_view)
+
+
+async def save_appointment():
+    # La retenue du créneau et la demande de code s'écrivent dans le magasin des vérifications
+    # (SQLite) : la vue tourne dans un thread. L'email part ensuite par l'AsyncOutbox
+    await refresh_availability()
+    return await asyncio.to_thread(run_view)
+
+
+async def verify_code():
+    # Même vue que app.verify_code (regroupement des POST répétés, PDF, email) dans un thread ;
+    # seule la réservation revient sur la boucle, avec le client asynchrone
+    loop = asyncio.get_running_loop()
+
+    def book_slot(verification_data):
+        return asyncio.run_coroutine_threadsafe(async_storage.book_slot(verification_data), loop).result()
+
+    await refresh_availability()
+    return await asyncio.to_thread(app_module.confirm_verification, book_slot)
+
+
+ASYNC_ROUTES = {
+    ('GET', '/get-slots'): availability_view,
+    ('GET', '/get-unavailable-dates'): availability_view,
+    ('GET', '/availability'): availability_view,
+    ('POST', '/save-appointment'): save_appointment,
+    ('POST', '/verify-code'): verify_code,
+}
+
+flask_application = WsgiToAsgi(app)
+
+
+def build_environ(scope, body):
+    # Requête WSGI équivalente, pour le contexte de requête Flask
+    environ = {
+        'REQUEST_METHOD': scope['method'],
+        'SCRIPT_NAME': scope.get('root_path', '').encode('utf8').decode('latin1'),
+        'PATH_INFO': scope['path'].encode('utf8').decode('latin1'),
+        'QUERY_STRING': scope['query_string'].decode('ascii'),
+        'SERVER_PROTOCOL': f"HTTP/{scope['http_version']}",
+        'SERVER_NAME': (scope.get('server') or ('localhost', 80))[0],
+        'SERVER_PORT': str((scope.get('server') or ('localhost', 80))[1]),
+        'wsgi.version': (1, 0),
+        'wsgi.url_scheme': scope.get('scheme', 'http'),
+        'wsgi.input': BytesIO(body),
+        'wsgi.errors': sys.stderr,
+        'wsgi.multithread': True,
+        'wsgi.multiprocess': True,
+        'wsgi.run_once': False,
+    }
+    if scope.get('client'):
+        environ['REMOTE_ADDR'] = scope['client'][0]
+    for name, value in scope.get('headers', []):
+        name = name.decode('latin1')
+        if name in ('content-type', 'content-length'):
+            key = name.upper().replace('-', '_')
+        else:
+            key = 'HTTP_' + name.upper().replace('-', '_')
+        value = value.decode('latin1')
+        environ[key] = f'{environ[key]},{value}' if key in environ else value
+    # Le corps est déjà lu en entier, y compris s'il a été envoyé par morceaux
+    environ['CONTENT_LENGTH'] = str(len(body))
+    environ.pop('HTTP_TRANSFER_ENCODING', None)
+    # Même correction par ProxyFix que les routes servies par app.wsgi_app
+    return app_module.trusted_proxy(lambda environ, start_response: environ)(environ, None)
+
+
+async def read_body(receive):
+    body = b''
+    while True:
+        message = await receive()
+        body += message.get('body', b'')
+        if not message.get('more_body'):
+            return body
+
+
+async def dispatch(environ, view):
+    # Même enchaînement que Flask.full_dispatch_request (CSRF, métriques, session),
+    # avec une vue asynchrone
+    with app.request_context(environ):
+        try:
+            try:
+                response = app.preprocess_request()
+                if response is None:
+                    response = await view()
+            except Exception as e:
+                response = app.handle_user_exception(e)
+            return app.finalize_request(response)
+        except Exception as e:
+            return app.handle_exception(e)
+
+
+async def lifespan(receive, send):
+    while True:
+        message = await receive()
+        if message['type'] == 'lifespan.startup':
+            await ensure_started()
+            await send({'type': 'lifespan.startup.complete'})
+        elif message['type'] == 'lifespan.shutdown':
+            # Drain dans un thread : les envois en cours avancent sur la boucle pendant l'attente
+            if _started is not None and not await asyncio.to_thread(app_module.outbox.drain, app_module.MAIL_DRAIN_TIMEOUT):
+                log.warning("arrêt avec des emails non envoyés", extra={'pending': app_module.outbox.pending()})
+            await send({'type': 'lifespan.shutdown.complete'})
+            return
+
+
+async def application(scope, receive, send):
+    if scope['type'] == 'lifespan':
+        return await lifespan(receive, send)
+    view = ASYNC_ROUTES.get((scope.get('method'), scope.get('path'))) if scope['type'] == 'http' else None
+    await ensure_started()
+    if view is None:
+        return await flask_application(scope, receive, send)
+
+    environ = build_environ(scope, await read_body(receive))
+    response = await dispatch(environ, view)
+    await send({
+        'type': 'http.response.start',
+        'status': response.status_code,
+        'headers': [(name.lower().encode('latin1'), value.encode('latin1'))
+                    for name, value in response.headers.to_wsgi_list()],
+    })
+    await send({'type': 'http.response.body', 'body': response.get_data()})
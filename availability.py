@@ -0,0 +1,164 @@
+import logging
+import threading
+import time
+import zlib
+
+from metrics import CACHE_TOTAL
+
+log = logging.getLogger('jlpt.availability')
+
+
+class AvailabilityGrid:
+    """Grille des créneaux en mémoire : un bitmap et les places restantes par jour, rafraîchie sur TTL."""
+
+    def __init__(self, loader, ttl=15, stale_retry=5):
+        # loader() renvoie les lignes {'date', 'time', 'capacity', 'booked'} de la table slots
+        self._loader = loader
+        self.ttl = ttl
+        # Délai avant un nouvel essai quand le stockage échoue et que l'ancienne grille est servie
+        self.stale_retry = stale_retry
+        self._lock = threading.Lock()
+        self._refresh_lock = threading.Lock()
+        self._times = []      # bit -> 'HH:MM', trié
+        self._index = {}      # 'HH:MM' -> bit
+        self._slots = {}      # date -> bitmap des créneaux existants
+        self._free = {}       # date -> bitmap des créneaux ayant encore des places
+        self._seats = {}      # date -> {'HH:MM': places restantes}
+        self._loaded_at = None
+        self._retry_at = None
+        self._loaded = False
+        self._times_tag = 0
+        self._version = None
+
+    def is_fresh(self):
+        now = time.monotonic()
+        if self._retry_at is not None and now < self._retry_at:
+            return True
+        return self._loaded_at is not None and now - self._loaded_at < self.ttl
+
+    def _ensure_fresh(self):
+        if self.is_fresh():
+            CACHE_TOTAL.inc(cache='availability', result='hit')
+            return
+        CACHE_TOTAL.inc(cache='availability', result='miss')
+        # Un seul thread recharge. Les autres attendent s'il n'y a encore aucune grille,
+        # sinon ils lisent la précédente plutôt que de rester bloqués derrière un stockage lent
+        if not self._refresh_lock.acquire(blocking=not self._loaded):
+            CACHE_TOTAL.inc(cache='availability', result='stale')
+            return
+        try:
+            if not self.is_fresh():
+                try:
+                    self.refresh()
+                except Exception:
+                    if not self.serve_stale():
+                        raise
+        finally:
+            self._refresh_lock.release()
+
+    def serve_stale(self):
+        # Après un échec du chargement : garde la dernière grille connue quelques secondes.
+        # Renvoie False s'il n'y en a aucune
+        if not self._loaded:
+            return False
+        log.warning("stockage indisponible, dernière grille des créneaux servie")
+        CACHE_TOTAL.inc(cache='availability', result='stale')
+        self._retry_at = time.monotonic() + self.stale_retry
+        return True
+
+    def refresh(self, rows=None):
+        # rows permet de fournir des lignes déjà chargées (lecture asynchrone en mode ASGI)
+        rows = list(self._loader() if rows is None else rows)
+        times = sorted({row['time'] for row in rows})
+        index = {t: bit for bit, t in enumerate(times)}
+        slots = {}
+        free = {}
+        seats = {}
+        for row in rows:
+            bit = 1 << index[row['time']]
+            remaining = max(row['capacity'] - row['booked'], 0)
+            slots[row['date']] = slots.get(row['date'], 0) | bit
+            seats.setdefault(row['date'], {})[row['time']] = remaining
+            if remaining:
+                free[row['date']] = free.get(row['date'], 0) | bit
+        with self._lock:
+            self._times = times
+            self._index = index
+            self._slots = slots
+            self._free = free
+            self._seats = seats
+            self._times_tag = zlib.crc32(','.join(times).encode())
+            self._version = None
+            self._loaded_at = time.monotonic()
+            self._retry_at = None
+            self._loaded = True
+
+    def invalidate(self):
+        with self._lock:
+            self._loaded_at = None
+            self._retry_at = None
+
+    def book_seat(self, date, slot_time):
+        # Écriture immédiate dans la grille locale, les autres workers suivent au prochain TTL
+        with self._lock:
+            day = self._seats.get(date)
+            if day is None or slot_time not in day:
+                self._loaded_at = None
+                return
+            day[slot_time] = max(day[slot_time] - 1, 0)
+            if not day[slot_time]:
+                self._free[date] = self._free.get(date, 0) & ~(1 << self._index[slot_time])
+            self._version = None
+
+    def available_times(self, date):
+        self._ensure_fresh()
+        with self._lock:
+            mask = self._free.get(date, 0)
+            times = self._times
+        return [t for bit, t in enumerate(times) if mask >> bit & 1]
+
+    def remaining_seats(self, date):
+        # {'HH:MM': places restantes} pour tous les créneaux du jour, complets compris
+        self._ensure_fresh()
+        with self._lock:
+            return dict(sorted(self._seats.get(date, {}).items()))
+
+    def unavailable_dates(self):
+        # Une entrée par créneau indisponible, comme la requête d'origine sur slots
+        self._ensure_fresh()
+        with self._lock:
+            booked = {date: mask & ~self._free.get(date, 0) for date, mask in self._slots.items()}
+        dates = []
+        for date in sorted(booked):
+            dates.extend([date] * booked[date].bit_count())
+        return dates
+
+    def month_summary(self, month):
+        # Créneaux avec des places, total des créneaux et places restantes pour chaque jour du mois 'YYYY-MM'
+        self._ensure_fresh()
+        prefix = month + '-'
+        with self._lock:
+            days = [(date, self._free.get(date, 0).bit_count(), mask.bit_count(), sum(self._seats[date].values()))
+                    for date, mask in self._slots.items() if date.startswith(prefix)]
+        return [{'date': date, 'free': free, 'total': total, 'seats': seats}
+                for date, free, total, seats in sorted(days)]
+
+    def day_version(self, date):
+        # Change dès qu'une place du jour est prise ; identique d'un worker à l'autre
+        self._ensure_fresh()
+        with self._lock:
+            return f'{self._times_tag:x}-{self._day_tag(date):x}'
+
+    def _day_tag(self, date):
+        seats = self._seats.get(date, {})
+        return zlib.crc32(','.join(f'{t}:{seats[t]}' for t in sorted(seats)).encode())
+
+    def version(self):
+        # Empreinte de toute la grille, recalculée seulement après un changement
+        self._ensure_fresh()
+        with self._lock:
+            if self._version is None:
+                state = ';'.join(f'{date}:{mask:x}:{self._day_tag(date):x}'
+                                 for date, mask in sorted(self._slots.items()))
+                self._version = f'{self._times_tag:x}-{zlib.crc32(state.encode()):x}'
+            return self._version
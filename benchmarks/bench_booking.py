@@ -0,0 +1,247 @@
+"""Test de charge local du parcours de réservation, sans Supabase ni serveur SMTP.
+
+    python -m benchmarks.bench_booking [--users 16] [--requests 200] [--contenders 20]
+
+Le stockage est une base SQLite en mémoire et les emails partent vers un
+serveur SMTP minimal lancé dans le processus. Chaque utilisateur virtuel
+enchaîne surtout des lectures /get-slots, et parfois une réservation complète
+(/save-appointment puis /verify-code). Une seconde phase fait confirmer le
+même créneau par plusieurs candidats en même temps.
+"""
+import argparse
+import os
+import random
+import socketserver
+import statistics
+import threading
+import time
+from collections import defaultdict
+from datetime import datetime, timedelta
+
+SLOT_DAYS = 30
+
+
+class SMTPSink(socketserver.ThreadingTCPServer):
+    """Serveur SMTP minimal qui accepte et compte les messages."""
+
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self):
+        super().__init__(('127.0.0.1', 0), SMTPHandler)
+        self.messages = 0
+        self.lock = threading.Lock()
+
+
+class SMTPHandler(socketserver.StreamRequestHandler):
+
+    def reply(self, line):
+        self.wfile.write(line.encode() + b'\r\n')
+
+    def handle(self):
+        self.reply('220 sink')
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                return
+            command = line[:4].upper()
+            if command == b'EHLO':
+                self.reply('250 sink')
+            elif command == b'DATA':
+                self.reply('354 end with .')
+                while self.rfile.readline() not in (b'.\r\n', b''):
+                    pass
+                with self.server.lock:
+                    self.server.messages += 1
+                self.reply('250 queued')
+            elif command == b'QUIT':
+                self.reply('221 bye')
+                return
+            else:
+                self.reply('250 ok')
+
+
+def configure_environment(smtp_port):
+    # Avant l'import de app : stockage SQLite en mémoire et SMTP local
+    os.environ.update({
+        'STORAGE_BACKEND': 'sqlite',
+        'SQLITE_PATH': ':memory:',
+        'MAIL_SERVER': '127.0.0.1',
+        'MAIL_PORT': str(smtp_port),
+        'MAIL_USE_TLS': 'False',
+        'MAIL_DEFAULT_SENDER': 'bench@example.com',
+        'SECRET_KEY': 'bench',
+        # Tous les utilisateurs virtuels partagent la même adresse IP
+        'RATE_LIMIT_PER_IP': '1000000',
+        'MAIL_MAX_BACKLOG': '1000000',
+        'VERIFICATION_STORE': 'memory',
+        # Une ligne de log par requête noierait les résultats ; LOG_LEVEL=INFO pour en mesurer le coût
+        'LOG_LEVEL': os.getenv('LOG_LEVEL', 'WARNING'),
+    })
+
+
+class Recorder:
+
+    def __init__(self):
+        self.latencies = defaultdict(list)
+        self.lock = threading.Lock()
+
+    def call(self, route, func, *args, **kwargs):
+        start = time.perf_counter()
+        response = func(*args, **kwargs)
+        elapsed = time.perf_counter() - start
+        with self.lock:
+            self.latencies[route].append(elapsed)
+        return response
+
+
+def verification_code(client):
+    # None si le créneau était retenu par un autre candidat (aucun code envoyé)
+    with client.session_transaction() as session:
+        verification_id = session.get('verification_id')
+    from app import verifications
+    record = verifications.get(verification_id) if verification_id else None
+    return record.code if record else None
+
+
+def book(client, recorder, date, slot_time, email):
+    recorder.call('/save-appointment', client.post, '/save-appointment', data={
+        'date': date,
+        'time': slot_time,
+        'name': 'Bench User',
+        'phone': '+213555000000',
+        'email': email,
+        'jlpt_level': 'N5',
+        'lang': 'fr',
+    })
+    code = verification_code(client)
+    if code is None:
+        return None
+    return recorder.call('/verify-code', client.post, '/verify-code', data={'code': code, 'lang': 'fr'})
+
+
+def mixed_user(app_module, recorder, dates, requests, booking_ratio, seed):
+    rng = random.Random(seed)
+    client = app_module.app.test_client()
+    for i in range(requests):
+        date = rng.choice(dates)
+        if rng.random() < booking_ratio:
+            slots = app_module.get_available_slots_for_date(date)
+            if slots:
+                book(client, recorder, date, rng.choice(list(slots)), f'user{seed}-{i}@example.com')
+                continue
+        recorder.call('/get-slots', client.get, f'/get-slots?date={date}&lang=fr')
+
+
+def contention(app_module, recorder, date, slot_time, contenders):
+    # Tous les candidats demandent le même créneau : seuls les premiers, dans la limite des
+    # places, le retiennent et reçoivent un code. Les retenues étant propres au processus, on simule ensuite des candidats
+    # servis par d'autres workers en libérant la retenue avant chaque demande
+    clients = []
+    for i in range(contenders):
+        client = app_module.app.test_client()
+        recorder.call('/save-appointment', client.post, '/save-appointment', data={
+            'date': date,
+            'time': slot_time,
+            'name': 'Bench User',
+            'phone': '+213555000000',
+            'email': f'contender{i}@example.com',
+            'jlpt_level': 'N5',
+            'lang': 'fr',
+        })
+        clients.append((client, verification_code(client)))
+        app_module.holds.release(date, slot_time, f'contender{i}@example.com')
+
+    barrier = threading.Barrier(contenders)
+    successes = []
+
+    def confirm(client, code):
+        barrier.wait()
+        response = recorder.call('/verify-code (même créneau)', client.post, '/verify-code',
+                                 data={'code': code, 'lang': 'fr'})
+        if 'Rendez-vous enregistré' in response.get_data(as_text=True):
+            successes.append(code)
+
+    threads = [threading.Thread(target=confirm, args=pair) for pair in clients]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return len(successes)
+
+
+def report(recorder, elapsed):
+    print(f"{'route':32} {'n':>6} {'req/s':>9} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8}")
+    for route, samples in sorted(recorder.latencies.items()):
+        if len(samples) > 1:
+            cuts = statistics.quantiles(samples, n=100, method='inclusive')
+            p50, p95, p99 = cuts[49], cuts[94], cuts[98]
+        else:
+            p50 = p95 = p99 = samples[0]
+        print(f"{route:32} {len(samples):>6} {len(samples) / elapsed:>9.1f} "
+              f"{p50 * 1000:>8.2f} {p95 * 1000:>8.2f} {p99 * 1000:>8.2f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--users', type=int, default=16, help="utilisateurs virtuels simultanés")
+    parser.add_argument('--requests', type=int, default=200, help="requêtes par utilisateur")
+    parser.add_argument('--booking-ratio', type=float, default=0.05,
+                        help="part des requêtes qui sont une réservation complète")
+    parser.add_argument('--contenders', type=int, default=20,
+                        help="candidats confirmant le même créneau")
+    parser.add_argument('--capacity', type=int, default=1, help="places par créneau")
+    args = parser.parse_args()
+
+    smtp = SMTPSink()
+    threading.Thread(target=smtp.serve_forever, daemon=True).start()
+    configure_environment(smtp.server_address[1])
+
+    import app as app_module
+    from slot_calendar import SlotCalendar
+
+    app_module.app.config['WTF_CSRF_ENABLED'] = False
+    start = datetime.now() + timedelta(days=1)
+    slots = SlotCalendar(capacity=args.capacity).slots(start, start + timedelta(days=SLOT_DAYS))
+    app_module.storage.insert_slots(sorted((date, slot_time, seats) for (date, slot_time), seats in slots.items()))
+    app_module.availability.invalidate()
+    dates = sorted({date for date, _ in slots})
+
+    recorder = Recorder()
+    began = time.perf_counter()
+    users = [threading.Thread(target=mixed_user,
+                              args=(app_module, recorder, dates, args.requests, args.booking_ratio, seed))
+             for seed in range(args.users)]
+    for user in users:
+        user.start()
+    for user in users:
+        user.join()
+
+    # Débit de la phase de charge seule, sans la phase de concurrence qui suit
+    elapsed = time.perf_counter() - began
+
+    date = dates[-1]
+    slot_time = app_module.availability.available_times(date)[0]
+    seats = app_module.availability.remaining_seats(date)[slot_time]
+    contended = Recorder()
+    began = time.perf_counter()
+    winners = contention(app_module, contended, date, slot_time, args.contenders)
+    contention_elapsed = time.perf_counter() - began
+
+    print(f"charge mixte ({args.users} utilisateurs, {elapsed:.2f} s)")
+    report(recorder, elapsed)
+    print(f"\nmême créneau ({args.contenders} candidats, {contention_elapsed:.2f} s)")
+    report(contended, contention_elapsed)
+    print(f"\nconfirmations simultanées du même créneau : {winners} réussie(s) sur {args.contenders} "
+          f"({seats} place(s) restante(s))")
+
+    # Attendre la fin des envois, emails en cours et nouvelles tentatives compris
+    if not app_module.outbox.drain(timeout=30):
+        print("emails encore en attente après 30 s")
+    print(f"emails reçus par le serveur SMTP local : {smtp.messages}")
+    if winners != min(seats, args.contenders):
+        raise SystemExit("nombre de réservations différent des places restantes du créneau")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,85 @@
+"""Micro-benchmark du PDF de confirmation : PDF/s avant et après le cache.
+
+    python -m benchmarks.bench_pdf [--count 50]
+"""
+import argparse
+import os
+import tempfile
+import time
+from io import BytesIO
+
+import qrcode
+from reportlab.lib import colors
+from reportlab.lib.pagesizes import A4
+from reportlab.lib.units import cm
+from reportlab.lib.utils import ImageReader
+from reportlab.pdfgen import canvas
+
+from pdf import LOGO_PATH, MAPS_URL, ConfirmationRenderer
+
+SAMPLE = {
+    'name': 'Test User',
+    'email': 'test@example.com',
+    'phone': '+213555000000',
+    'date': '2025-03-01',
+    'time': '10:00',
+    'jlpt_level': 'N5',
+}
+
+
+def legacy_render(data, workdir):
+    # Ancienne implémentation : logo relu et QR régénéré puis écrit sur disque à chaque PDF
+    buffer = BytesIO()
+    c = canvas.Canvas(buffer, pagesize=A4)
+    width, height = A4
+    c.setFillColor(colors.white)
+    c.rect(0, 0, width, height, fill=True)
+    img = ImageReader(LOGO_PATH)
+    y_logo = height - 3*cm
+    c.drawImage(img, (width - 10*cm) / 2, y_logo, width=10*cm, height=2.5*cm, mask='auto')
+    c.setFillColor(colors.black)
+    c.setFont("Helvetica-Bold", 20)
+    y_title = y_logo - 2*cm
+    c.drawString(2*cm, y_title, "JLPT - Confirmation de rendez-vous")
+    c.setFont("Helvetica", 12)
+    y = y_title - 2*cm
+    for key in ('name', 'email', 'phone', 'date', 'time', 'jlpt_level'):
+        c.drawString(2*cm, y, f"{key} : {data[key]}")
+        y -= 1*cm
+    qr = qrcode.QRCode(version=1, box_size=10, border=5)
+    qr.add_data(MAPS_URL)
+    qr.make(fit=True)
+    temp_qr_path = os.path.join(workdir, "temp_qr.png")
+    qr.make_image(fill_color="black", back_color="white").save(temp_qr_path)
+    c.drawString(2*cm, y-1*cm, "Scannez pour la localisation :")
+    c.drawImage(temp_qr_path, 2*cm, y-7*cm, width=5*cm, height=5*cm)
+    os.remove(temp_qr_path)
+    c.save()
+    buffer.seek(0)
+    return buffer
+
+
+def measure(render, count):
+    render()  # échauffement (et construction du cache pour le nouveau rendu)
+    start = time.perf_counter()
+    for _ in range(count):
+        render()
+    return count / (time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--count', type=int, default=50)
+    args = parser.parse_args()
+
+    renderer = ConfirmationRenderer()
+    with tempfile.TemporaryDirectory() as workdir:
+        before = measure(lambda: legacy_render(SAMPLE, workdir), args.count)
+    after = measure(lambda: renderer.render(SAMPLE), args.count)
+
+    print(f"avant : {before:8.1f} PDF/s")
+    print(f"après : {after:8.1f} PDF/s  (x{after / before:.1f})")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,82 @@
+import threading
+import time
+from collections import OrderedDict
+
+
+class _Entry:
+    __slots__ = ('expires', 'done', 'outcome')
+
+    def __init__(self, expires):
+        self.expires = expires
+        self.done = threading.Event()
+        self.outcome = None
+
+    def wait(self, timeout=None):
+        # Résultat de la première demande, ou None si elle a échoué ou tarde trop
+        self.done.wait(timeout)
+        return self.outcome
+
+
+class DedupeCache:
+    """Regroupe les demandes identiques rapprochées (double clic, POST renvoyé).
+
+    La première demande d'une clé l'exécute ; les suivantes attendent son
+    résultat puis le reçoivent tel quel pendant `ttl` secondes. Un échec
+    (exception) n'est pas gardé : la demande suivante est exécutée normalement.
+    """
+
+    def __init__(self, ttl=30, max_keys=100000, clock=time.monotonic):
+        self.ttl = ttl
+        self.max_keys = max_keys
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()   # clé -> _Entry, dans l'ordre d'expiration
+
+    def claim(self, key):
+        # Renvoie (True, entrée) si l'appelant doit exécuter la demande,
+        # (False, entrée) si elle est déjà en cours ou terminée
+        now = self._clock()
+        with self._lock:
+            self._purge(now)
+            entry = self._entries.get(key)
+            if entry is not None:
+                return False, entry
+            entry = self._entries[key] = _Entry(now + self.ttl)
+            while len(self._entries) > self.max_keys:
+                self._entries.popitem(last=False)[1].done.set()
+            return True, entry
+
+    def peek(self, key):
+        # Entrée en cours ou terminée pour cette clé, sans en créer
+        with self._lock:
+            self._purge(self._clock())
+            return self._entries.get(key)
+
+    def finish(self, key, outcome):
+        with self._lock:
+            entry = self._entries.get(key)
+        if entry is not None:
+            entry.outcome = outcome
+            entry.done.set()
+
+    def abandon(self, key):
+        with self._lock:
+            entry = self._entries.pop(key, None)
+        if entry is not None:
+            entry.done.set()
+
+    def clear(self):
+        with self._lock:
+            entries = list(self._entries.values())
+            self._entries.clear()
+        for entry in entries:
+            entry.done.set()
+
+    def _purge(self, now):
+        entries = self._entries
+        while entries:
+            key, entry = next(iter(entries.items()))
+            # Une demande encore en cours n'expire pas avant d'avoir fini
+            if entry.expires > now or not entry.done.is_set():
+                return
+            del entries[key]
@@ -0,0 +1,141 @@
+import heapq
+import itertools
+import os
+import sqlite3
+import threading
+import zlib
+from datetime import datetime
+
+from verifications import _immediate
+
+
+class SlotHolds:
+    """Places retenues pendant la vérification par email, jusqu'à leur expiration.
+
+    En mémoire, pour un seul processus (tests, mode ASGI avec un worker).
+
+    Les expirations sont rangées dans un tas : seules les retenues arrivées à
+    échéance sont examinées, sans parcourir toutes les autres.
+    """
+
+    def __init__(self, clock=datetime.now):
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._holds = {}      # (date, time) -> {owner: expires}
+        self._by_date = {}    # date -> {time}
+        self._heap = []       # (expires, seq, date, time, owner)
+        self._seq = itertools.count()
+
+    def _purge(self, now):
+        heap = self._heap
+        while heap and heap[0][0] <= now:
+            expires, _, date, slot_time, owner = heapq.heappop(heap)
+            # La retenue a pu être renouvelée ou libérée depuis : ne retirer que celle-ci
+            if self._holds.get((date, slot_time), {}).get(owner) == expires:
+                self._remove(date, slot_time, owner)
+
+    def _remove(self, date, slot_time, owner):
+        holders = self._holds[(date, slot_time)]
+        del holders[owner]
+        if holders:
+            return
+        del self._holds[(date, slot_time)]
+        times = self._by_date[date]
+        times.discard(slot_time)
+        if not times:
+            del self._by_date[date]
+
+    def hold(self, date, slot_time, owner, expires, seats=1):
+        # Renvoie False si les `seats` places du créneau sont déjà retenues par d'autres
+        with self._lock:
+            self._purge(self._clock())
+            holders = self._holds.get((date, slot_time), {})
+            if owner not in holders and len(holders) >= seats:
+                return False
+            holders[owner] = expires
+            self._holds[(date, slot_time)] = holders
+            self._by_date.setdefault(date, set()).add(slot_time)
+            heapq.heappush(self._heap, (expires, next(self._seq), date, slot_time, owner))
+            return True
+
+    def release(self, date, slot_time, owner):
+        with self._lock:
+            if owner in self._holds.get((date, slot_time), {}):
+                self._remove(date, slot_time, owner)
+
+    def held_counts(self, date):
+        # {'HH:MM': places retenues} pour le jour donné
+        with self._lock:
+            self._purge(self._clock())
+            return {slot_time: len(self._holds[(date, slot_time)])
+                    for slot_time in self._by_date.get(date, ())}
+
+
+HOLDS_SCHEMA = """
+CREATE TABLE IF NOT EXISTS holds (
+    date TEXT NOT NULL,
+    time TEXT NOT NULL,
+    owner TEXT NOT NULL,
+    expires REAL NOT NULL,
+    PRIMARY KEY (date, time, owner)
+);
+CREATE INDEX IF NOT EXISTS idx_holds_expires ON holds(expires);
+"""
+
+
+class FileSlotHolds:
+    """Mêmes retenues dans un fichier SQLite local, partagées par les workers d'une même machine.
+
+    Rangées à côté des demandes de vérification (même fichier) : une place retenue
+    par un worker est refusée par les autres.
+    """
+
+    def __init__(self, path, clock=datetime.now):
+        self.path = path
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._conn = None
+        self._pid = None
+
+    def _connection(self):
+        # Une connexion par processus : elle ne doit pas être partagée après un fork
+        if self._pid != os.getpid():
+            conn = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None, timeout=5)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.executescript(HOLDS_SCHEMA)
+            self._conn, self._pid = conn, os.getpid()
+        return self._conn
+
+    def hold(self, date, slot_time, owner, expires, seats=1):
+        # Renvoie False si les `seats` places du créneau sont déjà retenues par d'autres
+        now = self._clock().timestamp()
+        # Transaction d'écriture : deux workers ne peuvent pas prendre la dernière place ensemble
+        with self._lock, _immediate(self._connection()) as conn:
+            conn.execute('DELETE FROM holds WHERE expires <= ?', (now,))
+            others = conn.execute('SELECT COUNT(*) FROM holds WHERE date = ? AND time = ? AND owner != ?',
+                                  (date, slot_time, owner)).fetchone()[0]
+            if others >= seats:
+                return False
+            conn.execute('INSERT OR REPLACE INTO holds (date, time, owner, expires) VALUES (?, ?, ?, ?)',
+                         (date, slot_time, owner, expires.timestamp()))
+            return True
+
+    def release(self, date, slot_time, owner):
+        with self._lock:
+            self._connection().execute('DELETE FROM holds WHERE date = ? AND time = ? AND owner = ?',
+                                       (date, slot_time, owner))
+
+    def held_counts(self, date):
+        # {'HH:MM': places retenues} pour le jour donné
+        with self._lock:
+            rows = self._connection().execute(
+                'SELECT time, COUNT(*) FROM holds WHERE date = ? AND expires > ? GROUP BY time',
+                (date, self._clock().timestamp())).fetchall()
+        return dict(rows)
+
+
+def held_tag(counts):
+    # Empreinte stable des places retenues d'un jour, pour l'ETag de /get-slots
+    if not counts:
+        return '0'
+    return f"{zlib.crc32(','.join(f'{t}:{counts[t]}' for t in sorted(counts)).encode()):x}"
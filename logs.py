@@ -0,0 +1,178 @@
+"""Journalisation structurée, sans écriture sur le chemin des requêtes.
+
+Chaque ligne est un objet JSON (horodatage, niveau, logger, message, id de
+requête et champs passés par `extra=`). Les enregistrements sont mis dans une
+file par le thread de la requête et écrits par un thread d'arrière-plan. Les
+données personnelles sont masquées et les niveaux INFO et DEBUG peuvent être
+échantillonnés.
+"""
+import atexit
+import copy
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import random
+import sys
+import threading
+from datetime import datetime, timezone
+
+# Attributs présents sur tout LogRecord : le reste vient de `extra=`
+_RECORD_ATTRS = frozenset(vars(logging.LogRecord('', 0, '', 0, '', (), None))) | {'message', 'asctime'}
+
+MASKED_FIELDS = frozenset({'email', 'phone', 'name', 'recipient'})
+SECRET_FIELDS = frozenset({'code', 'token', 'password'})
+
+
+def mask_email(email):
+    local, _, domain = str(email).partition('@')
+    return f'{local[:1]}***@{domain}' if domain else '***'
+
+
+def mask(key, value):
+    # Données personnelles réduites au minimum utile pour recouper les logs, secrets retirés
+    if key in SECRET_FIELDS:
+        return '***'
+    if key not in MASKED_FIELDS or value is None:
+        return value
+    if key in ('email', 'recipient'):
+        return mask_email(value)
+    if key == 'phone':
+        value = str(value)
+        return '*' * max(len(value) - 2, 0) + value[-2:]
+    if key == 'name':
+        return str(value)[:1] + '***'
+    return value
+
+
+class JsonFormatter(logging.Formatter):
+
+    def format(self, record):
+        entry = {
+            'ts': datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec='milliseconds'),
+            'level': record.levelname,
+            'logger': record.name,
+            'msg': record.getMessage(),
+        }
+        for key, value in vars(record).items():
+            if key not in _RECORD_ATTRS and not key.startswith('_'):
+                entry[key] = mask(key, value)
+        if record.exc_info:
+            entry['exc'] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            entry['exc'] = record.exc_text
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class RequestIdFilter(logging.Filter):
+    """Ajoute l'id de la requête Flask en cours (g.request_id), s'il y en a une."""
+
+    def filter(self, record):
+        if not hasattr(record, 'request_id'):
+            from flask import g, has_request_context
+            if has_request_context():
+                record.request_id = g.get('request_id')
+        return True
+
+
+class SamplingFilter(logging.Filter):
+    """Ne garde qu'une fraction `rate` des enregistrements sous WARNING."""
+
+    def __init__(self, rate=1.0):
+        super().__init__()
+        self.rate = rate
+
+    def filter(self, record):
+        return record.levelno >= logging.WARNING or self.rate >= 1 or random.random() < self.rate
+
+
+class StderrHandler(logging.StreamHandler):
+    """Écrit sur le sys.stderr courant (remplacé par pytest ou un serveur)."""
+
+    @property
+    def stream(self):
+        return sys.stderr
+
+    @stream.setter
+    def stream(self, value):
+        pass
+
+
+class BackgroundQueueHandler(logging.handlers.QueueHandler):
+    """QueueHandler dont le thread d'écriture est relancé dans chaque processus
+    (les threads ne survivent pas au fork des workers gunicorn).
+    """
+
+    def __init__(self, *handlers):
+        super().__init__(queue.SimpleQueue())
+        self._handlers = handlers
+        self._listener = None
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def _start(self):
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._listener = logging.handlers.QueueListener(
+                self.queue, *self._handlers, respect_handler_level=True)
+            self._listener.start()
+            self._pid = os.getpid()
+
+    def emit(self, record):
+        if self._pid != os.getpid():
+            self._start()
+        super().emit(record)
+
+    def prepare(self, record):
+        # Le message et la trace sont figés ici, le JSON est construit par le thread d'écriture
+        record = copy.copy(record)
+        record.message = record.getMessage()
+        record.msg = record.message
+        record.args = None
+        if record.exc_info:
+            record.exc_text = _traceback_formatter.formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def stop(self):
+        # Écrit ce qui reste dans la file (appelé à la sortie du processus)
+        with self._lock:
+            if self._listener is not None and self._pid == os.getpid():
+                self._listener.stop()
+            self._pid = None
+
+
+_traceback_formatter = logging.Formatter()
+_handler = None
+
+
+def parse_levels(value):
+    # "outbox=DEBUG,werkzeug=WARNING" -> {'outbox': 'DEBUG', 'werkzeug': 'WARNING'}
+    levels = {}
+    for item in (value or '').split(','):
+        name, _, level = item.partition('=')
+        if name.strip() and level.strip():
+            levels[name.strip()] = level.strip().upper()
+    return levels
+
+
+def setup_logging(level='INFO', sample_rate=1.0, levels=None):
+    """Installe le handler en file sur le logger racine (une seule fois par processus)."""
+    global _handler
+    root = logging.getLogger()
+    root.setLevel(level.upper())
+    for name, logger_level in (levels or {}).items():
+        logging.getLogger(name).setLevel(logger_level)
+    if _handler is None:
+        output = StderrHandler()
+        output.setFormatter(JsonFormatter())
+        _handler = BackgroundQueueHandler(output)
+        _handler.addFilter(RequestIdFilter())
+        atexit.register(_handler.stop)
+        root.addHandler(_handler)
+    _handler.filters = [f for f in _handler.filters if not isinstance(f, SamplingFilter)]
+    if sample_rate < 1:
+        _handler.addFilter(SamplingFilter(sample_rate))
+    return _handler
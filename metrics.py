@@ -0,0 +1,270 @@
+import atexit
+import bisect
+import inspect
+import json
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+log = logging.getLogger('jlpt.metrics')
+
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(labels):
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in labels) + '}'
+
+
+def _format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value))
+
+
+class _Metric:
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def _key(self, labels):
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def snapshot(self):
+        with self._lock:
+            return {key: self._snapshot(value) for key, value in self._values.items()}
+
+    def render(self, values=None):
+        # values : valeurs à exposer (par défaut celles du processus), par étiquettes
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} {self.type}']
+        if values is None:
+            values = self.snapshot()
+        for key, value in sorted(values.items()):
+            labels = list(zip(self.labelnames, key))
+            lines.extend(self._lines(labels, value))
+        return lines
+
+
+class Counter(_Metric):
+    type = 'counter'
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels):
+        return self._values.get(self._key(labels), 0)
+
+    def _snapshot(self, value):
+        return value
+
+    def _merge(self, total, value):
+        return total + value
+
+    def _lines(self, labels, value):
+        return [f'{self.name}{_format_labels(labels)} {_format_value(value)}']
+
+
+class Histogram(_Metric):
+    type = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                # Compteurs par intervalle (le dernier pour +Inf), puis la somme
+                state = self._values[key] = [0] * (len(self.buckets) + 1) + [0.0]
+            state[index] += 1
+            state[-1] += value
+
+    @contextmanager
+    def time(self, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def count(self, **labels):
+        state = self._values.get(self._key(labels))
+        return sum(state[:-1]) if state else 0
+
+    def _snapshot(self, value):
+        return list(value)
+
+    def _merge(self, total, value):
+        return [a + b for a, b in zip(total, value)]
+
+    def _lines(self, labels, state):
+        lines = []
+        cumulative = 0
+        for bound, count in zip(self.buckets + (float('inf'),), state[:-1]):
+            cumulative += count
+            bucket_labels = labels + [('le', _format_value(bound))]
+            lines.append(f'{self.name}_bucket{_format_labels(bucket_labels)} {cumulative}')
+        lines.append(f'{self.name}_sum{_format_labels(labels)} {_format_value(state[-1])}')
+        lines.append(f'{self.name}_count{_format_labels(labels)} {cumulative}')
+        return lines
+
+
+class Registry:
+    """Métriques du processus, exposées au format texte de Prometheus.
+
+    Avec multiprocess(directory), chaque processus écrit ses valeurs dans
+    directory/<pid>.json (toutes les `interval` secondes, à chaque rendu et à
+    la sortie) et render() additionne les fichiers de tous les workers : un
+    scrape reçu par n'importe quel worker donne les totaux de la machine.
+    """
+
+    def __init__(self):
+        self._metrics = []
+        self.directory = None
+        self.interval = None
+
+    def counter(self, name, documentation, labelnames=()):
+        metric = Counter(name, documentation, labelnames)
+        self._metrics.append(metric)
+        return metric
+
+    def histogram(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        metric = Histogram(name, documentation, labelnames, buckets)
+        self._metrics.append(metric)
+        return metric
+
+    def multiprocess(self, directory, interval=5):
+        self.directory = directory
+        self.interval = interval
+        os.makedirs(directory, exist_ok=True)
+        self._start_writer()
+        # Les threads ne survivent pas au fork (workers gunicorn, pool de PDF) : relancé dans chaque
+        # enfant, qui repart de zéro pour ne pas compter une seconde fois les valeurs du parent
+        os.register_at_fork(after_in_child=self._forked)
+        atexit.register(self.dump)
+
+    def _forked(self):
+        for metric in self._metrics:
+            metric._lock = threading.Lock()
+            metric._values.clear()
+        self._start_writer()
+
+    def _start_writer(self):
+        threading.Thread(target=self._write_loop, name='metrics-writer', daemon=True).start()
+
+    def _write_loop(self):
+        while True:
+            time.sleep(self.interval)
+            try:
+                self.dump()
+            except OSError as e:
+                log.warning("métriques non écrites", extra={'error': str(e)})
+
+    def dump(self):
+        # Écrit puis renomme : un lecteur ne voit jamais un fichier à moitié écrit
+        data = {metric.name: [[list(key), value] for key, value in metric.snapshot().items()]
+                for metric in self._metrics}
+        path = os.path.join(self.directory, f'{os.getpid()}.json')
+        with open(path + '.tmp', 'w') as f:
+            json.dump(data, f)
+        os.replace(path + '.tmp', path)
+
+    def _collect(self):
+        # Valeurs additionnées de tous les processus, workers arrêtés compris (compteurs cumulés)
+        self.dump()
+        totals = {metric.name: {} for metric in self._metrics}
+        for name in os.listdir(self.directory):
+            if not name.endswith('.json'):
+                continue
+            try:
+                with open(os.path.join(self.directory, name)) as f:
+                    data = json.load(f)
+            except (OSError, ValueError):
+                continue
+            for metric in self._metrics:
+                values = totals[metric.name]
+                for key, value in data.get(metric.name, ()):
+                    key = tuple(key)
+                    values[key] = value if key not in values else metric._merge(values[key], value)
+        return totals
+
+    def render(self):
+        totals = self._collect() if self.directory is not None else {}
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render(totals.get(metric.name)))
+        return '\n'.join(lines) + '\n'
+
+
+class TimedCalls:
+    """Enveloppe un objet et mesure la durée de chacun de ses appels de méthode."""
+
+    def __init__(self, target, histogram, label='operation'):
+        self._target = target
+        self._histogram = histogram
+        self._label = label
+
+    def __getattr__(self, name):
+        attr = getattr(self._target, name)
+        if not callable(attr):
+            return attr
+
+        if inspect.iscoroutinefunction(attr):
+            async def timed(*args, **kwargs):
+                with self._histogram.time(**{self._label: name}):
+                    return await attr(*args, **kwargs)
+        else:
+            def timed(*args, **kwargs):
+                with self._histogram.time(**{self._label: name}):
+                    return attr(*args, **kwargs)
+
+        # Mis en cache sur l'instance : __getattr__ n'est plus appelé pour cette méthode
+        setattr(self, name, timed)
+        return timed
+
+
+registry = Registry()
+
+REQUEST_SECONDS = registry.histogram(
+    'jlpt_http_request_duration_seconds', "Durée des requêtes HTTP", ('method', 'route', 'status'))
+STORAGE_SECONDS = registry.histogram(
+    'jlpt_storage_duration_seconds', "Durée des appels au stockage (Supabase ou SQLite)", ('operation',))
+EMAIL_SECONDS = registry.histogram(
+    'jlpt_email_duration_seconds', "Durée de send_verification_email et send_confirmation_email", ('kind',))
+SMTP_SECONDS = registry.histogram(
+    'jlpt_smtp_send_duration_seconds', "Durée d'envoi d'un email par le serveur SMTP")
+PDF_SECONDS = registry.histogram(
+    'jlpt_pdf_render_duration_seconds', "Durée de génération du PDF de confirmation")
+TEMPLATE_SECONDS = registry.histogram(
+    'jlpt_template_render_duration_seconds', "Durée de rendu des templates Jinja", ('template',))
+CACHE_TOTAL = registry.counter(
+    'jlpt_cache_requests_total', "Accès aux caches (grille des créneaux, réponses HTTP)", ('cache', 'result'))
+EMAIL_FAILURES = registry.counter(
+    'jlpt_email_failures_total', "Emails non remis", ('stage',))
+SLOT_CONFLICTS = registry.counter(
+    'jlpt_slot_conflicts_total', "Demandes refusées car le créneau était déjà retenu ou pris", ('stage',))
+BACKEND_FAILURES = registry.counter(
+    'jlpt_backend_failures_total', "Appels au stockage en échec : relancés, abandonnés ou refusés par le disjoncteur",
+    ('operation', 'outcome'))
+DEDUPLICATED = registry.counter(
+    'jlpt_deduplicated_total', "Demandes répétées servies avec la réponse d'origine", ('route',))
+VERIFICATION_FAILURES = registry.counter(
+    'jlpt_verification_failures_total', "Codes de vérification refusés : incorrect, demande expirée ou bloquée", ('reason',))
+RATE_LIMITED = registry.counter(
+    'jlpt_rate_limited_total', "Demandes de code refusées par la limite de débit ou la file d'emails", ('reason',))
@@ -0,0 +1,249 @@
+import logging
+import os
+import queue
+import sqlite3
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+from metrics import SMTP_SECONDS, EMAIL_FAILURES
+
+log = logging.getLogger('jlpt.outbox')
+
+QUEUED = 'queued'
+SENDING = 'sending'
+RETRYING = 'retrying'
+SENT = 'sent'
+FAILED = 'failed'
+
+
+class _Job:
+    __slots__ = ('id', 'message', 'attempts')
+
+    def __init__(self, message):
+        self.id = uuid.uuid4().hex
+        self.message = message
+        self.attempts = 0
+
+
+STATUS_SCHEMA = """
+CREATE TABLE IF NOT EXISTS email_statuses (
+    id TEXT PRIMARY KEY,
+    status TEXT NOT NULL,
+    updated REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_email_statuses_updated ON email_statuses(updated);
+"""
+
+
+class FileStatusStore:
+    """Statuts des emails dans un fichier SQLite local, lisibles par tous les workers de la machine.
+
+    Un statut est oublié `ttl` secondes après sa dernière mise à jour.
+    """
+
+    def __init__(self, path, ttl=86400, clock=time.time):
+        self.path = path
+        self.ttl = ttl
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._conn = None
+        self._pid = None
+
+    def _connection(self):
+        # Une connexion par processus : elle ne doit pas être partagée après un fork
+        if self._pid != os.getpid():
+            conn = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None, timeout=5)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.executescript(STATUS_SCHEMA)
+            self._conn, self._pid = conn, os.getpid()
+        return self._conn
+
+    def set(self, job_id, status):
+        now = self._clock()
+        with self._lock:
+            conn = self._connection()
+            conn.execute('DELETE FROM email_statuses WHERE updated <= ?', (now - self.ttl,))
+            conn.execute('INSERT OR REPLACE INTO email_statuses (id, status, updated) VALUES (?, ?, ?)',
+                         (job_id, status, now))
+
+    def get(self, job_id):
+        with self._lock:
+            row = self._connection().execute('SELECT status FROM email_statuses WHERE id = ? AND updated > ?',
+                                             (job_id, self._clock() - self.ttl)).fetchone()
+        return row[0] if row else None
+
+
+class Outbox:
+    """File d'attente d'emails vidée en arrière-plan sur des connexions SMTP réutilisées.
+
+    Les statuts sont gardés en mémoire pour drain() ; avec `statuses` (FileStatusStore),
+    ils sont aussi publiés pour que tout worker réponde à /email-status.
+    """
+
+    def __init__(self, app, mail, workers=2, max_retries=3, backoff=2.0,
+                 idle_timeout=30, maxsize=1000, history=10000, statuses=None):
+        self.app = app
+        self.mail = mail
+        self.statuses = statuses
+        self.workers = workers
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.idle_timeout = idle_timeout
+        self.history = history
+        self._queue = queue.Queue(maxsize=maxsize)
+        self._statuses = OrderedDict()
+        self._lock = threading.Lock()
+        self._threads = []
+        self._pid = None
+        self._inline = 0
+
+    def init_app(self, app):
+        # L'application peut être créée après l'outbox (create_app). Les threads d'envoi gardent
+        # le contexte de la première (app:app) : une autre application (tests) ne la remplace pas
+        app.extensions['outbox'] = self
+        if self.app is None:
+            self.app = app
+
+    def submit(self, message, block=False):
+        # block=True attend une place dans la file au lieu d'échouer (envois en lot)
+        job = _Job(message)
+        self._set_status(job.id, QUEUED)
+        if self.workers <= 0:
+            # Mode synchrone : pas de pool, envoi direct dans la requête
+            self._send_inline(job)
+            return job.id
+        self._start()
+        try:
+            self._queue.put(job, block=block)
+        except queue.Full:
+            EMAIL_FAILURES.inc(stage='queue_full')
+            self._set_status(job.id, FAILED)
+            raise
+        return job.id
+
+    def status(self, job_id):
+        with self._lock:
+            status = self._statuses.get(job_id)
+        if status is None and self.statuses is not None:
+            # Email mis en file par un autre worker
+            status = self.statuses.get(job_id)
+        return status
+
+    def pending(self):
+        # Emails en attente dans la file, ou en cours d'envoi synchrone
+        return self._queue.qsize() + self._inline
+
+    def drain(self, timeout=None):
+        # Attend que tous les emails soient envoyés ou abandonnés, nouvelles tentatives comprises.
+        # Renvoie False si le délai est dépassé
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            with self._lock:
+                busy = any(status in (QUEUED, SENDING, RETRYING) for status in self._statuses.values())
+            if not busy:
+                return True
+            if deadline is not None and time.monotonic() > deadline:
+                return False
+            time.sleep(0.05)
+
+    def _set_status(self, job_id, status):
+        with self._lock:
+            self._statuses[job_id] = status
+            self._statuses.move_to_end(job_id)
+            while len(self._statuses) > self.history:
+                self._statuses.popitem(last=False)
+        if self.statuses is not None:
+            try:
+                self.statuses.set(job_id, status)
+            except Exception as e:
+                # Le suivi ne doit pas bloquer l'envoi
+                log.warning("statut d'email non enregistré", extra={'error': str(e)})
+
+    def _start(self):
+        # Les threads ne survivent pas au fork des workers gunicorn : on les relance par processus
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._threads = []
+            for i in range(self.workers):
+                thread = threading.Thread(target=self._run, name=f'outbox-{i}', daemon=True)
+                thread.start()
+                self._threads.append(thread)
+            self._pid = os.getpid()
+
+    def _send_inline(self, job):
+        with self._lock:
+            self._inline += 1
+        try:
+            self._send_inline_job(job)
+        finally:
+            with self._lock:
+                self._inline -= 1
+
+    def _send_inline_job(self, job):
+        with self.app.app_context():
+            try:
+                self._set_status(job.id, SENDING)
+                with SMTP_SECONDS.time():
+                    self.mail.send(job.message)
+                self._set_status(job.id, SENT)
+            except Exception as e:
+                log.warning("échec d'envoi d'email", extra={'error': str(e)})
+                EMAIL_FAILURES.inc(stage='delivery')
+                self._set_status(job.id, FAILED)
+
+    def _run(self):
+        with self.app.app_context():
+            connection = None
+            while True:
+                try:
+                    job = self._queue.get(timeout=self.idle_timeout)
+                except queue.Empty:
+                    # Fermer la session SMTP inutilisée avant que le serveur ne la coupe
+                    connection = self._close(connection)
+                    continue
+                self._set_status(job.id, SENDING)
+                try:
+                    with SMTP_SECONDS.time():
+                        if connection is None:
+                            connection = self.mail.connect()
+                            connection.__enter__()
+                        connection.send(job.message)
+                    self._set_status(job.id, SENT)
+                except Exception as e:
+                    log.warning("échec d'envoi d'email", extra={'error': str(e), 'attempt': job.attempts + 1})
+                    connection = self._close(connection)
+                    self._retry(job)
+                finally:
+                    self._queue.task_done()
+
+    def _close(self, connection):
+        if connection is not None:
+            try:
+                connection.__exit__(None, None, None)
+            except Exception:
+                pass
+        return None
+
+    def _retry(self, job):
+        job.attempts += 1
+        if job.attempts > self.max_retries:
+            EMAIL_FAILURES.inc(stage='delivery')
+            self._set_status(job.id, FAILED)
+            return
+        self._set_status(job.id, RETRYING)
+        delay = self.backoff * 2 ** (job.attempts - 1)
+        timer = threading.Timer(delay, self._requeue, (job,))
+        timer.daemon = True
+        timer.start()
+
+    def _requeue(self, job):
+        try:
+            self._queue.put_nowait(job)
+        except queue.Full:
+            EMAIL_FAILURES.inc(stage='queue_full')
+            self._set_status(job.id, FAILED)
@@ -0,0 +1,216 @@
+import itertools
+import logging
+import multiprocessing
+import os
+import threading
+import zipfile
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from io import BytesIO
+
+import qrcode
+from PIL import Image
+from reportlab import rl_config
+from reportlab.lib import colors
+from reportlab.lib.pagesizes import A4
+from reportlab.lib.units import cm
+from reportlab.lib.utils import ImageReader
+from reportlab.pdfgen import canvas
+
+from metrics import PDF_SECONDS
+
+log = logging.getLogger('jlpt.pdf')
+
+LOGO_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'logo_horizontal.png')
+MAPS_URL = "https://maps.app.goo.gl/NRyzbD337Rrkokh5A"
+
+LOGO_WIDTH = 10*cm
+LOGO_HEIGHT = 2.5*cm
+QR_SIZE = 5*cm
+# Résolution du logo une fois réduit (~215 dpi sur 10 cm), largement suffisant pour l'impression
+LOGO_PIXELS = 850
+LOGO_JPEG_QUALITY = 92
+
+# Flux d'images en binaire plutôt qu'en ASCII85 : plus petits, et sans l'encodage ASCII85
+# (en Python pur sans rl_accel) qui coûterait plus que tout le reste du rendu
+rl_config.useA85 = 0
+
+
+def _build_logo(path):
+    # Décodage, réduction et aplatissement sur fond blanc une seule fois par processus ;
+    # encodé en JPEG, le logo est recopié tel quel dans chaque PDF, sans recompression
+    with Image.open(path) as img:
+        img = img.convert('RGBA')
+        height = round(LOGO_PIXELS * img.height / img.width)
+        img = img.resize((LOGO_PIXELS, height), Image.LANCZOS)
+        flat = Image.new('RGB', img.size, 'white')
+        flat.paste(img, mask=img.split()[3])
+    jpeg = BytesIO()
+    flat.save(jpeg, 'JPEG', quality=LOGO_JPEG_QUALITY)
+    jpeg.seek(0)
+    return _reader(jpeg)
+
+
+def _build_qr(url):
+    qr = qrcode.QRCode(version=1, box_size=10, border=5)
+    qr.add_data(url)
+    qr.make(fit=True)
+    qr_img = qr.make_image(fill_color="black", back_color="white")
+    return _reader(qr_img.get_image().convert('L'))
+
+
+def _reader(image):
+    reader = ImageReader(image)
+    # Pixels décodés dès maintenant : drawImage en calcule l'empreinte à chaque PDF
+    reader.getRGBData()
+    return reader
+
+
+class ConfirmationRenderer:
+    """Génère les PDF de confirmation à partir d'éléments statiques mis en cache."""
+
+    def __init__(self, logo_path=LOGO_PATH, maps_url=MAPS_URL):
+        self.logo_path = logo_path
+        self.maps_url = maps_url
+        self._lock = threading.Lock()
+        # drawImage relit le fichier JPEG du logo partagé : un rendu d'image à la fois
+        self._draw_lock = threading.Lock()
+        self._logo = None
+        self._qr = None
+
+    def _assets(self):
+        if self._logo is None:
+            with self._lock:
+                if self._logo is None:
+                    self._qr = _build_qr(self.maps_url)
+                    self._logo = _build_logo(self.logo_path)
+        return self._logo, self._qr
+
+    def render(self, data):
+        logo, qr = self._assets()
+        buffer = BytesIO()
+        c = canvas.Canvas(buffer, pagesize=A4)
+        width, height = A4
+
+        # Fond blanc
+        c.setFillColor(colors.white)
+        c.rect(0, 0, width, height, fill=True)
+
+        # Logo
+        x = (width - LOGO_WIDTH) / 2
+        y_logo = height - 3*cm
+        with self._draw_lock:
+            c.drawImage(logo, x, y_logo, width=LOGO_WIDTH, height=LOGO_HEIGHT)
+
+        # Titre
+        c.setFillColor(colors.black)
+        c.setFont("Helvetica-Bold", 20)
+        y_title = y_logo - 2*cm
+        c.drawString(2*cm, y_title, "JLPT - Confirmation de rendez-vous")
+
+        # Informations du rendez-vous
+        c.setFont("Helvetica", 12)
+        y = y_title - 2*cm
+
+        details = [
+            f"Nom : {data['name']}",
+            f"Email : {data['email']}",
+            f"Téléphone : {data['phone']}",
+            f"Date : {data['date']}",
+            f"Heure : {data['time']}",
+            f"Niveau JLPT : {data['jlpt_level']}",
+            "\nLieu : Institut Torii",
+        ]
+
+        for line in details:
+            c.drawString(2*cm, y, line)
+            y -= 1*cm
+
+        # QR Code vers la localisation
+        c.drawString(2*cm, y-1*cm, "Scannez pour la localisation :")
+        with self._draw_lock:
+            c.drawImage(qr, 2*cm, y-7*cm, width=QR_SIZE, height=QR_SIZE)
+
+        c.save()
+        buffer.seek(0)
+        return buffer
+
+
+renderer = ConfirmationRenderer()
+
+
+@PDF_SECONDS.time()
+def generate_appointment_pdf(data):
+    log.debug("génération du PDF", extra={'date': data.get('date'), 'time': data.get('time')})
+    return renderer.render(data)
+
+
+def _render_bytes(data):
+    # Exécuté dans les processus du pool : chacun prépare son propre logo et QR code une fois
+    return renderer.render(data).getvalue()
+
+
+def render_many(appointments, workers=None, window=None):
+    """Génère les PDF de plusieurs rendez-vous, en parallèle sur `workers` processus.
+
+    Produit les paires (rendez-vous, octets du PDF) dans l'ordre des rendez-vous.
+    Les rendez-vous sont lus au fur et à mesure : au plus `window` PDF (par défaut
+    4 par processus) sont en cours de rendu ou en attente d'être consommés.
+    workers=1 rend tout dans le processus courant ; None utilise tous les cœurs.
+    """
+    workers = workers or os.cpu_count() or 1
+    appointments = iter(appointments)
+    first = list(itertools.islice(appointments, 2))
+    appointments = itertools.chain(first, appointments)
+    if workers == 1 or len(first) < 2:
+        for appointment in appointments:
+            yield appointment, _render_bytes(appointment)
+        return
+    window = window or workers * 4
+    # spawn plutôt que fork : le processus web a déjà des threads (outbox) et des verrous
+    context = multiprocessing.get_context('spawn')
+    with ProcessPoolExecutor(max_workers=workers, mp_context=context) as pool:
+        pending = deque()
+        for appointment in appointments:
+            pending.append((appointment, pool.submit(_render_bytes, appointment)))
+            if len(pending) >= window:
+                appointment, future = pending.popleft()
+                yield appointment, future.result()
+        while pending:
+            appointment, future = pending.popleft()
+            yield appointment, future.result()
+
+
+def confirmation_filename(appointment):
+    return f"confirmation_{appointment['date']}_{appointment['time'].replace(':', 'h')}_{appointment['id']}.pdf"
+
+
+class _Chunks:
+    # Flux en écriture seule pour zipfile : les octets écrits sont repris au fur et à mesure
+    def __init__(self):
+        self._chunks = []
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        data = b''.join(self._chunks)
+        self._chunks.clear()
+        return data
+
+
+def zip_stream(files):
+    """Archive ZIP produite morceau par morceau à partir de paires (nom, octets).
+
+    Les PDF étant déjà compressés, ils sont stockés tels quels.
+    """
+    sink = _Chunks()
+    with zipfile.ZipFile(sink, 'w', zipfile.ZIP_STORED) as archive:
+        for name, data in files:
+            archive.writestr(name, data)
+            yield sink.drain()
+    yield sink.drain()
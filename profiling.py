@@ -0,0 +1,155 @@
+"""Profilage cProfile de requêtes choisies, à la demande.
+
+Désactivé tant que PROFILE_DIR n'est pas défini : aucun hook n'est alors
+installé. Activé, il profile une fraction des requêtes (`sample_rate`,
+éventuellement limitée à certaines routes) et toute requête portant un en-tête
+X-Profile signé. Chaque capture est écrite dans un fichier .prof (pstats,
+snakeviz, flameprof...) dont le nom donne la date, la durée et la route.
+"""
+import cProfile
+import logging
+import os
+import random
+import re
+import threading
+import time
+
+from itsdangerous import BadSignature, TimestampSigner
+
+log = logging.getLogger('jlpt.profiling')
+
+HEADER = 'X-Profile'
+_SALT = 'jlpt-profile'
+# <horodatage ms>_<durée µs>_<méthode>_<route>.prof
+_FILENAME = re.compile(r'(\d+)_(\d+)_([A-Z]+)_([\w.-]+)\.prof')
+
+
+def route_slug(route):
+    # '/admin/export' -> 'admin.export', '/' -> 'index'
+    return re.sub(r'[^\w.-]+', '_', route.strip('/').replace('/', '.')) or 'index'
+
+
+class RequestProfiler:
+    """Hooks Flask qui profilent les requêtes choisies et écrivent un .prof par capture."""
+
+    def __init__(self, directory, sample_rate=0.0, routes=(), max_files=200, token_max_age=3600):
+        self.directory = directory
+        self.sample_rate = sample_rate
+        self.routes = frozenset(routes)
+        self.max_files = max_files
+        self.token_max_age = token_max_age
+        self.app = None
+        self._local = threading.local()
+        self._lock = threading.Lock()
+
+    def init_app(self, app):
+        # Enregistré après le blueprint : le profil entoure la vue au plus près. Les jetons sont
+        # signés avec la clé de la première application (app:app), comme pour l'outbox
+        app.extensions['profiler'] = self
+        if self.app is None:
+            self.app = app
+        os.makedirs(self.directory, exist_ok=True)
+        app.before_request(self.start)
+        app.after_request(self.stop)
+        app.teardown_request(self.discard)
+
+    def _signer(self):
+        return TimestampSigner(self.app.secret_key, salt=_SALT)
+
+    def token(self):
+        # Valeur de l'en-tête X-Profile, valable token_max_age secondes
+        return self._signer().sign('profile').decode()
+
+    def _signed(self, value):
+        try:
+            self._signer().unsign(value, max_age=self.token_max_age)
+        except BadSignature:
+            return False
+        return True
+
+    def wanted(self, route, header):
+        if header:
+            return self._signed(header)
+        if self.routes and route not in self.routes:
+            return False
+        return self.sample_rate > 0 and random.random() < self.sample_rate
+
+    def start(self):
+        from flask import g, request
+        # Un seul profil actif par thread : en mode ASGI, les requêtes concurrentes partagent
+        # le thread de la boucle et cProfile n'a qu'un hook par thread
+        if getattr(self._local, 'active', None) is not None:
+            return
+        route = request.url_rule.rule if request.url_rule else 'other'
+        if not self.wanted(route, request.headers.get(HEADER)):
+            return
+        profile = cProfile.Profile()
+        # Le profil appartient à la requête (g) ; le thread ne retient que lequel est actif
+        g.profile = (profile, route, time.perf_counter())
+        self._local.active = profile
+        profile.enable()
+
+    def _finish(self):
+        from flask import g
+        capture = g.pop('profile', None)
+        if capture is None:
+            return None
+        profile = capture[0]
+        profile.disable()
+        if getattr(self._local, 'active', None) is profile:
+            self._local.active = None
+        return capture
+
+    def stop(self, response):
+        capture = self._finish()
+        if capture is None:
+            return response
+        profile, route, start = capture
+        duration = time.perf_counter() - start
+        from flask import request
+        try:
+            name = self._save(profile, request.method, route, duration)
+            log.info("profil enregistré", extra={'file': name, 'route': route,
+                                                  'duration_ms': round(duration * 1000, 2)})
+        except OSError as e:
+            log.warning("profil non enregistré", extra={'error': str(e)})
+        return response
+
+    def discard(self, exc=None):
+        # Requête terminée sans passer par stop (exception non gérée) : le profil est abandonné
+        self._finish()
+
+    def _save(self, profile, method, route, duration):
+        name = f'{int(time.time() * 1000)}_{int(duration * 1e6)}_{method}_{route_slug(route)}.prof'
+        profile.dump_stats(os.path.join(self.directory, name))
+        self._prune()
+        return name
+
+    def _prune(self):
+        # Garde les max_files captures les plus récentes (le nom commence par l'horodatage)
+        with self._lock:
+            names = sorted(n for n in os.listdir(self.directory) if _FILENAME.fullmatch(n))
+            for name in names[:max(len(names) - self.max_files, 0)]:
+                try:
+                    os.remove(os.path.join(self.directory, name))
+                except FileNotFoundError:
+                    pass
+
+    def captures(self, limit=50):
+        # Captures de tous les workers, les plus lentes d'abord
+        found = []
+        for name in os.listdir(self.directory):
+            match = _FILENAME.fullmatch(name)
+            if match:
+                captured_at, duration, method, route = match.groups()
+                found.append({'file': name, 'method': method, 'route': route,
+                              'duration_ms': int(duration) / 1000, 'captured_at': int(captured_at) / 1000})
+        found.sort(key=lambda capture: capture['duration_ms'], reverse=True)
+        return found[:limit]
+
+    def path(self, name):
+        # Chemin d'une capture existante, ou None (pas de chemin arbitraire)
+        if not _FILENAME.fullmatch(name):
+            return None
+        path = os.path.join(self.directory, name)
+        return path if os.path.exists(path) else None
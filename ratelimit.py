@@ -0,0 +1,68 @@
+import math
+import threading
+import time
+from collections import OrderedDict
+from contextlib import ExitStack
+
+
+class TokenBucketLimiter:
+    """Limite de débit par clé (email, adresse IP) avec un seau à jetons.
+
+    Chaque clé dispose de `burst` jetons, regagnés au rythme de `burst` par
+    `period` secondes. Les clés les moins récemment utilisées sont oubliées
+    au-delà de `max_keys` pour borner la mémoire.
+    """
+
+    def __init__(self, burst, period, clock=time.monotonic, max_keys=100000):
+        self.burst = burst
+        self.rate = burst / period
+        self.max_keys = max_keys
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._buckets = OrderedDict()   # clé -> (jetons, instant de la dernière mise à jour)
+
+    def take(self, key):
+        # Renvoie 0 si la demande est acceptée, sinon le nombre de secondes avant le prochain jeton
+        with self._lock:
+            return self._take(key, self._clock())
+
+    def _tokens(self, key, now):
+        tokens, updated = self._buckets.get(key, (self.burst, now))
+        return min(self.burst, tokens + (now - updated) * self.rate)
+
+    def _wait(self, key, now):
+        tokens = self._tokens(key, now)
+        return 0 if tokens >= 1 else math.ceil((1 - tokens) / self.rate)
+
+    def _take(self, key, now):
+        tokens = self._tokens(key, now)
+        self._buckets.pop(key, None)
+        if tokens >= 1:
+            tokens -= 1
+            wait = 0
+        else:
+            wait = math.ceil((1 - tokens) / self.rate)
+        self._buckets[key] = (tokens, now)
+        while len(self._buckets) > self.max_keys:
+            self._buckets.popitem(last=False)
+        return wait
+
+
+def take_all(*checks):
+    """Prend un jeton dans chaque seau (limiteur, clé), ou dans aucun.
+
+    Renvoie (None, 0) si tous les seaux ont un jeton, sinon (indice du premier
+    seau vide, secondes avant son prochain jeton) : un refus par un seau ne
+    coûte pas de jeton aux autres.
+    """
+    with ExitStack() as stack:
+        # Verrous pris dans un ordre fixe : deux appels simultanés ne peuvent pas s'attendre
+        for limiter in sorted({limiter for limiter, _ in checks}, key=id):
+            stack.enter_context(limiter._lock)
+        for index, (limiter, key) in enumerate(checks):
+            wait = limiter._wait(key, limiter._clock())
+            if wait:
+                return index, wait
+        for limiter, key in checks:
+            limiter._take(key, limiter._clock())
+    return None, 0
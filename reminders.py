@@ -0,0 +1,55 @@
+import logging
+import time
+
+from metrics import SMTP_SECONDS
+
+log = logging.getLogger('jlpt.reminders')
+
+
+def send_in_batches(mail, messages, batch_size=50, rate=0, sleep=time.sleep):
+    """Envoie les messages (clé, Message) sur une seule session SMTP, réutilisée.
+
+    `rate` limite le débit en messages par seconde (0 : sans limite). Génère,
+    lot par lot, les clés des messages partis pour que l'appelant puisse les
+    enregistrer au fur et à mesure, et les clés en échec. Après une erreur,
+    la session est rouverte pour le message suivant.
+    """
+    interval = 1 / rate if rate else 0
+    connection = None
+    sent = []
+    failed = []
+    next_send = time.monotonic()
+    try:
+        for key, message in messages:
+            if interval:
+                delay = next_send - time.monotonic()
+                if delay > 0:
+                    sleep(delay)
+                next_send = max(next_send, time.monotonic()) + interval
+            try:
+                with SMTP_SECONDS.time():
+                    if connection is None:
+                        connection = mail.connect()
+                        connection.__enter__()
+                    connection.send(message)
+                sent.append(key)
+            except Exception as e:
+                log.warning("échec d'envoi du rappel", extra={'appointment_id': key, 'error': str(e)})
+                failed.append(key)
+                connection = _close(connection)
+            if len(sent) + len(failed) >= batch_size:
+                yield sent, failed
+                sent, failed = [], []
+        if sent or failed:
+            yield sent, failed
+    finally:
+        _close(connection)
+
+
+def _close(connection):
+    if connection is not None:
+        try:
+            connection.__exit__(None, None, None)
+        except Exception:
+            pass
+    return None
@@ -0,0 +1,137 @@
+import asyncio
+import inspect
+import random
+import threading
+import time
+
+from metrics import BACKEND_FAILURES
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half_open'
+
+
+class CircuitOpen(Exception):
+    """Appel refusé sans contacter le backend : le disjoncteur est ouvert."""
+
+
+class CircuitBreaker:
+    """Disjoncteur : après `threshold` échecs consécutifs, les appels échouent
+    immédiatement pendant `reset_timeout` secondes, puis un seul appel d'essai
+    décide de la fermeture ou d'une nouvelle ouverture.
+    """
+
+    def __init__(self, threshold=5, reset_timeout=30, clock=time.monotonic):
+        self.threshold = threshold
+        self.reset_timeout = reset_timeout
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._failures = 0
+        self._opened_at = None
+        self._trial = False
+
+    @property
+    def state(self):
+        with self._lock:
+            return self._state()
+
+    def _state(self):
+        if self._opened_at is None:
+            return CLOSED
+        if self._clock() - self._opened_at >= self.reset_timeout:
+            return HALF_OPEN
+        return OPEN
+
+    def before_call(self):
+        # Lève CircuitOpen si l'appel ne doit pas partir
+        with self._lock:
+            state = self._state()
+            if state == CLOSED:
+                return
+            if state == HALF_OPEN and not self._trial:
+                # Un seul appel d'essai à la fois
+                self._trial = True
+                return
+        raise CircuitOpen("Stockage indisponible, nouvel essai plus tard")
+
+    def record_success(self):
+        with self._lock:
+            self._failures = 0
+            self._opened_at = None
+            self._trial = False
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            if self._trial or self._failures >= self.threshold:
+                self._opened_at = self._clock()
+            self._trial = False
+
+
+class ResilientCalls:
+    """Enveloppe un stockage : disjoncteur sur tous les appels, relances bornées
+    (avec attente exponentielle et aléa) pour les lectures idempotentes seulement.
+    """
+
+    def __init__(self, target, breaker, retry_methods=(), retries=2, backoff=0.1):
+        self._target = target
+        self._breaker = breaker
+        self._retry_methods = frozenset(retry_methods)
+        self._retries = retries
+        self._backoff = backoff
+
+    def _attempts(self, name):
+        return self._retries + 1 if name in self._retry_methods else 1
+
+    def _delay(self, attempt):
+        return self._backoff * 2 ** attempt * random.uniform(0.5, 1.5)
+
+    def _failed(self, name, attempt, attempts):
+        self._breaker.record_failure()
+        last = attempt == attempts - 1 or self._breaker.state != CLOSED
+        BACKEND_FAILURES.inc(operation=name, outcome='error' if last else 'retry')
+        return last
+
+    def __getattr__(self, name):
+        attr = getattr(self._target, name)
+        if not callable(attr):
+            return attr
+        breaker = self._breaker
+        attempts = self._attempts(name)
+
+        def rejected():
+            try:
+                breaker.before_call()
+            except CircuitOpen:
+                BACKEND_FAILURES.inc(operation=name, outcome='rejected')
+                raise
+
+        if inspect.iscoroutinefunction(attr):
+            async def call(*args, **kwargs):
+                for attempt in range(attempts):
+                    rejected()
+                    try:
+                        result = await attr(*args, **kwargs)
+                    except Exception:
+                        if self._failed(name, attempt, attempts):
+                            raise
+                        await asyncio.sleep(self._delay(attempt))
+                    else:
+                        breaker.record_success()
+                        return result
+        else:
+            def call(*args, **kwargs):
+                for attempt in range(attempts):
+                    rejected()
+                    try:
+                        result = attr(*args, **kwargs)
+                    except Exception:
+                        if self._failed(name, attempt, attempts):
+                            raise
+                        time.sleep(self._delay(attempt))
+                    else:
+                        breaker.record_success()
+                        return result
+
+        setattr(self, name, call)
+        return call
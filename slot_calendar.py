@@ -0,0 +1,104 @@
+import os
+from datetime import datetime, timedelta
+
+WEEKDAYS = ('mon', 'tue', 'wed', 'thu', 'fri', 'sat', 'sun')
+
+
+def _parse_date(value):
+    return datetime.strptime(value, "%Y-%m-%d")
+
+
+def _parse_list(value):
+    return [item.strip() for item in (value or '').split(',') if item.strip()]
+
+
+class SlotCalendar:
+    """Calendrier des créneaux : horaires, pas, jours fermés, jours fériés et capacité."""
+
+    def __init__(self, first_time='09:30', last_time='16:30', interval=30, closed_days=('sun',),
+                 holidays=(), capacity=1, first_day=None, last_day=None):
+        if interval <= 0:
+            # Sinon times() ne s'arrêterait jamais
+            raise ValueError(f"pas des créneaux invalide (SLOT_INTERVAL) : {interval} minutes")
+        self.first_time = first_time
+        self.last_time = last_time
+        self.interval = interval
+        self.closed_days = {WEEKDAYS.index(day.lower()[:3]) for day in closed_days}
+        self.holidays = set(holidays)
+        self.capacity = capacity
+        self.first_day = first_day
+        self.last_day = last_day
+
+    @classmethod
+    def from_env(cls):
+        first_day = os.getenv('CALENDAR_FIRST_DAY')
+        return cls(
+            first_time=os.getenv('SLOT_FIRST_TIME', '09:30'),
+            last_time=os.getenv('SLOT_LAST_TIME', '16:30'),
+            interval=int(os.getenv('SLOT_INTERVAL', '30')),
+            closed_days=_parse_list(os.getenv('CLOSED_DAYS', 'sun')),
+            holidays=_parse_list(os.getenv('HOLIDAYS')),
+            capacity=int(os.getenv('SLOT_CAPACITY', '1')),
+            first_day=_parse_date(first_day) if first_day else None,
+            last_day=_parse_date(os.getenv('CALENDAR_LAST_DAY', '2025-03-25')),
+        )
+
+    def times(self):
+        current = datetime.strptime(self.first_time, "%H:%M")
+        last = datetime.strptime(self.last_time, "%H:%M")
+        times = []
+        while current <= last:
+            times.append(current.strftime("%H:%M"))
+            current += timedelta(minutes=self.interval)
+        return times
+
+    def slots(self, start_date=None, end_date=None):
+        # {(date, time): capacité} pour chaque jour ouvert de la période
+        start_date = start_date or self.first_day or today()
+        end_date = end_date or self.last_day
+        times = self.times()
+        slots = {}
+        current_date = start_date.replace(hour=0, minute=0, second=0, microsecond=0)
+        while current_date <= end_date:
+            date = current_date.strftime("%Y-%m-%d")
+            if current_date.weekday() not in self.closed_days and date not in self.holidays:
+                for slot_time in times:
+                    slots[(date, slot_time)] = self.capacity
+            current_date += timedelta(days=1)
+        return slots
+
+
+def diff_slots(wanted, existing):
+    """Compare le calendrier voulu {(date, time): capacité} aux lignes de slots.
+
+    Renvoie les créneaux à insérer (date, time, capacité), les ids des lignes à
+    supprimer et les capacités à modifier (id, capacité). Les créneaux ayant
+    des réservations ne sont jamais supprimés et leur capacité ne descend pas
+    sous le nombre de places prises.
+    """
+    present = set()
+    to_delete = []
+    to_resize = []
+    # Les lignes réservées d'abord pour qu'un doublon libre soit celui supprimé
+    for row in sorted(existing, key=lambda row: -row['booked']):
+        key = (row['date'], row['time'])
+        if key in present:
+            # Doublon laissé par une ancienne initialisation
+            if not row['booked']:
+                to_delete.append(row['id'])
+            continue
+        present.add(key)
+        if key not in wanted:
+            if not row['booked']:
+                to_delete.append(row['id'])
+            continue
+        capacity = max(wanted[key], row['booked'])
+        if capacity != row['capacity']:
+            to_resize.append((row['id'], capacity))
+    to_insert = sorted((date, slot_time, capacity)
+                       for (date, slot_time), capacity in wanted.items() if (date, slot_time) not in present)
+    return to_insert, to_delete, to_resize
+
+
+def today():
+    return datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
@@ -0,0 +1,403 @@
+import sqlite3
+import threading
+
+APPOINTMENT_COLUMNS = ('id', 'date', 'time', 'name', 'phone', 'email', 'jlpt_level', 'created_at')
+REMINDER_COLUMNS = ('id', 'date', 'time', 'name', 'email', 'jlpt_level', 'lang')
+
+
+class Lazy:
+    """Objet construit au premier accès à l'un de ses attributs.
+
+    Permet d'importer l'application sans ouvrir de client ni de connexion.
+    """
+
+    def __init__(self, factory):
+        self._factory = factory
+        self._target = None
+        self._lock = threading.Lock()
+
+    def _resolve(self):
+        if self._target is None:
+            with self._lock:
+                if self._target is None:
+                    self._target = self._factory()
+        return self._target
+
+    def __getattr__(self, name):
+        return getattr(self._resolve(), name)
+
+
+class Storage:
+    """Accès aux créneaux et aux rendez-vous, quel que soit le backend."""
+
+    def load_slots(self):
+        # Toutes les lignes {'id', 'date', 'time', 'capacity', 'booked'} de la table slots
+        raise NotImplementedError
+
+    def available_times(self, date):
+        raise NotImplementedError
+
+    def unavailable_dates(self):
+        raise NotImplementedError
+
+    def insert_slots(self, slots):
+        # Ajoute les créneaux (date, time, capacité), en ignorant ceux qui existent déjà
+        raise NotImplementedError
+
+    def delete_free_slots(self, ids):
+        # Supprime les créneaux donnés, uniquement s'ils n'ont aucune réservation
+        raise NotImplementedError
+
+    def resize_slots(self, updates):
+        # Change la capacité des créneaux (id, capacité), jamais sous le nombre de places prises
+        raise NotImplementedError
+
+    def book_slot(self, data):
+        # Prend une place du créneau s'il en reste et enregistre le rendez-vous, atomiquement.
+        # Renvoie l'id du rendez-vous, ou None si le créneau est complet
+        raise NotImplementedError
+
+    def appointments_page(self, after=None, limit=500, date_from=None, date_to=None, jlpt_level=None):
+        # Rendez-vous triés par (date, time, id), à partir de la clé `after` exclue
+        raise NotImplementedError
+
+    def appointments_on(self, date):
+        # Rendez-vous du jour (REMINDER_COLUMNS) triés par heure, pour les rappels
+        raise NotImplementedError
+
+    def reminded_ids(self, ids):
+        # Ids des rendez-vous, parmi ceux donnés, dont le rappel est déjà parti
+        raise NotImplementedError
+
+    def record_reminders(self, ids):
+        # Note l'envoi des rappels ; un id déjà noté est ignoré
+        raise NotImplementedError
+
+
+class SupabaseStorage(Storage):
+
+    def __init__(self, client):
+        self.client = client
+
+    def load_slots(self):
+        # Lecture paginée pour ne pas être tronqué par la limite de lignes de PostgREST
+        rows = []
+        page_size = 1000
+        start = 0
+        while True:
+            response = self.client.table('slots') \
+                .select('id, date, time, capacity, booked') \
+                .order('id') \
+                .range(start, start + page_size - 1) \
+                .execute()
+            rows.extend(response.data)
+            if len(response.data) < page_size:
+                return rows
+            start += page_size
+
+    def available_times(self, date):
+        response = self.client.table('slots') \
+            .select('time') \
+            .eq('date', date) \
+            .eq('available', True) \
+            .order('time') \
+            .execute()
+        return [slot['time'] for slot in response.data]
+
+    def unavailable_dates(self):
+        response = self.client.table('slots') \
+            .select('date') \
+            .eq('available', False) \
+            .order('date') \
+            .execute()
+        return [slot['date'] for slot in response.data]
+
+    def insert_slots(self, slots):
+        # Les doublons insérés en même temps par un autre worker sont ignorés
+        # grâce à la contrainte unique (date, time)
+        rows = [{'date': date, 'time': time, 'capacity': capacity} for date, time, capacity in slots]
+        for i in range(0, len(rows), 1000):
+            batch = rows[i:i+1000]
+            self.client.table('slots') \
+                .upsert(batch, on_conflict='date,time', ignore_duplicates=True) \
+                .execute()
+
+    def delete_free_slots(self, ids):
+        for i in range(0, len(ids), 200):
+            batch = ids[i:i+200]
+            self.client.table('slots') \
+                .delete() \
+                .in_('id', batch) \
+                .eq('booked', 0) \
+                .execute()
+
+    def resize_slots(self, updates):
+        # Une requête par capacité : en pratique toute la période change de la même façon
+        by_capacity = {}
+        for slot_id, capacity in updates:
+            by_capacity.setdefault(capacity, []).append(slot_id)
+        for capacity, ids in by_capacity.items():
+            for i in range(0, len(ids), 200):
+                self.client.table('slots') \
+                    .update({'capacity': capacity}) \
+                    .in_('id', ids[i:i+200]) \
+                    .lte('booked', capacity) \
+                    .execute()
+
+    def book_slot(self, data):
+        # Voir la fonction book_slot dans le readme
+        response = self.client.rpc('book_slot', {
+            'p_date': data['date'],
+            'p_time': data['time'],
+            'p_name': data['name'],
+            'p_phone': data['phone'],
+            'p_email': data['email'],
+            'p_jlpt_level': data['jlpt_level'],
+            'p_lang': data.get('lang', 'fr')
+        }).execute()
+        return response.data
+
+    def appointments_page(self, after=None, limit=500, date_from=None, date_to=None, jlpt_level=None):
+        query = self.client.table('appointments') \
+            .select(', '.join(APPOINTMENT_COLUMNS)) \
+            .order('date').order('time').order('id') \
+            .limit(limit)
+        if date_from:
+            query = query.gte('date', date_from)
+        if date_to:
+            query = query.lte('date', date_to)
+        if jlpt_level:
+            query = query.eq('jlpt_level', jlpt_level)
+        if after:
+            # Pagination par clé : (date, time, id) > after, sans OFFSET
+            date, time, last_id = after
+            query = query.or_(
+                f'date.gt."{date}",'
+                f'and(date.eq."{date}",time.gt."{time}"),'
+                f'and(date.eq."{date}",time.eq."{time}",id.gt.{last_id})')
+        return query.execute().data
+
+    def appointments_on(self, date):
+        response = self.client.table('appointments') \
+            .select(', '.join(REMINDER_COLUMNS)) \
+            .eq('date', date) \
+            .order('time').order('id') \
+            .execute()
+        return response.data
+
+    def reminded_ids(self, ids):
+        reminded = set()
+        for i in range(0, len(ids), 200):
+            response = self.client.table('reminders') \
+                .select('appointment_id') \
+                .in_('appointment_id', ids[i:i+200]) \
+                .execute()
+            reminded.update(row['appointment_id'] for row in response.data)
+        return reminded
+
+    def record_reminders(self, ids):
+        rows = [{'appointment_id': i} for i in ids]
+        for i in range(0, len(rows), 1000):
+            self.client.table('reminders') \
+                .upsert(rows[i:i+1000], on_conflict='appointment_id', ignore_duplicates=True) \
+                .execute()
+
+
+class AsyncSupabaseStorage:
+    """Lecture des créneaux et réservation avec le client Supabase asynchrone (mode ASGI)."""
+
+    def __init__(self, client):
+        self.client = client
+
+    async def load_slots(self):
+        rows = []
+        page_size = 1000
+        start = 0
+        while True:
+            response = await self.client.table('slots') \
+                .select('id, date, time, capacity, booked') \
+                .order('id') \
+                .range(start, start + page_size - 1) \
+                .execute()
+            rows.extend(response.data)
+            if len(response.data) < page_size:
+                return rows
+            start += page_size
+
+    async def book_slot(self, data):
+        response = await self.client.rpc('book_slot', {
+            'p_date': data['date'],
+            'p_time': data['time'],
+            'p_name': data['name'],
+            'p_phone': data['phone'],
+            'p_email': data['email'],
+            'p_jlpt_level': data['jlpt_level'],
+            'p_lang': data.get('lang', 'fr')
+        }).execute()
+        return response.data
+
+
+SQLITE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS slots (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    date TEXT NOT NULL,
+    time TEXT NOT NULL,
+    capacity INTEGER NOT NULL DEFAULT 1,
+    booked INTEGER NOT NULL DEFAULT 0 CHECK (booked <= capacity),
+    available INTEGER GENERATED ALWAYS AS (booked < capacity) VIRTUAL,
+    UNIQUE (date, time)
+);
+CREATE INDEX IF NOT EXISTS idx_slots_date_available ON slots(date, available);
+CREATE TABLE IF NOT EXISTS appointments (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    date TEXT NOT NULL,
+    time TEXT NOT NULL,
+    name TEXT NOT NULL,
+    phone TEXT NOT NULL,
+    email TEXT NOT NULL,
+    jlpt_level TEXT NOT NULL,
+    lang TEXT NOT NULL DEFAULT 'fr',
+    created_at TEXT NOT NULL DEFAULT CURRENT_TIMESTAMP
+);
+CREATE INDEX IF NOT EXISTS idx_appointments_email ON appointments(email);
+CREATE INDEX IF NOT EXISTS idx_appointments_date_time ON appointments(date, time, id);
+CREATE TABLE IF NOT EXISTS reminders (
+    appointment_id INTEGER PRIMARY KEY REFERENCES appointments(id),
+    sent_at TEXT NOT NULL DEFAULT CURRENT_TIMESTAMP
+);
+"""
+
+# Base créée avant l'ajout de la capacité : available devient calculé à partir de booked
+SQLITE_CAPACITY_MIGRATION = """
+DROP INDEX IF EXISTS idx_slots_date_available;
+ALTER TABLE slots ADD COLUMN capacity INTEGER NOT NULL DEFAULT 1;
+ALTER TABLE slots ADD COLUMN booked INTEGER NOT NULL DEFAULT 0;
+UPDATE slots SET booked = 1 - available;
+ALTER TABLE slots DROP COLUMN available;
+ALTER TABLE slots ADD COLUMN available INTEGER GENERATED ALWAYS AS (booked < capacity) VIRTUAL;
+CREATE INDEX idx_slots_date_available ON slots(date, available);
+"""
+
+
+class SQLiteStorage(Storage):
+    """Backend local pour les tests, la CI et les petites installations."""
+
+    def __init__(self, path=':memory:'):
+        # Une seule connexion protégée par un verrou : SQLite sérialise de toute façon les écritures
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.row_factory = sqlite3.Row
+        self._lock = threading.Lock()
+        with self._lock:
+            if path != ':memory:':
+                self._conn.execute('PRAGMA journal_mode=WAL')
+            self._conn.executescript(SQLITE_SCHEMA)
+            columns = {row['name'] for row in self._conn.execute('PRAGMA table_info(slots)')}
+            if 'capacity' not in columns:
+                self._conn.executescript(SQLITE_CAPACITY_MIGRATION)
+            columns = {row['name'] for row in self._conn.execute('PRAGMA table_info(appointments)')}
+            if 'lang' not in columns:
+                self._conn.execute("ALTER TABLE appointments ADD COLUMN lang TEXT NOT NULL DEFAULT 'fr'")
+
+    def _query(self, sql, params=()):
+        with self._lock:
+            return self._conn.execute(sql, params).fetchall()
+
+    def load_slots(self):
+        rows = self._query('SELECT id, date, time, capacity, booked FROM slots ORDER BY id')
+        return [dict(row) for row in rows]
+
+    def available_times(self, date):
+        rows = self._query(
+            'SELECT time FROM slots WHERE date = ? AND available = 1 ORDER BY time', (date,))
+        return [row['time'] for row in rows]
+
+    def unavailable_dates(self):
+        rows = self._query('SELECT date FROM slots WHERE available = 0 ORDER BY date')
+        return [row['date'] for row in rows]
+
+    def insert_slots(self, slots):
+        with self._lock:
+            self._conn.execute('BEGIN')
+            self._conn.executemany(
+                'INSERT OR IGNORE INTO slots (date, time, capacity) VALUES (?, ?, ?)', slots)
+            self._conn.execute('COMMIT')
+
+    def delete_free_slots(self, ids):
+        with self._lock:
+            self._conn.execute('BEGIN')
+            self._conn.executemany(
+                'DELETE FROM slots WHERE id = ? AND booked = 0', [(i,) for i in ids])
+            self._conn.execute('COMMIT')
+
+    def resize_slots(self, updates):
+        with self._lock:
+            self._conn.execute('BEGIN')
+            self._conn.executemany(
+                'UPDATE slots SET capacity = ? WHERE id = ? AND booked <= ?',
+                [(capacity, slot_id, capacity) for slot_id, capacity in updates])
+            self._conn.execute('COMMIT')
+
+    def book_slot(self, data):
+        with self._lock:
+            self._conn.execute('BEGIN IMMEDIATE')
+            try:
+                cursor = self._conn.execute(
+                    'UPDATE slots SET booked = booked + 1 WHERE date = ? AND time = ? AND booked < capacity',
+                    (data['date'], data['time']))
+                if cursor.rowcount == 0:
+                    self._conn.execute('ROLLBACK')
+                    return None
+                cursor = self._conn.execute(
+                    'INSERT INTO appointments (date, time, name, phone, email, jlpt_level, lang) '
+                    'VALUES (?, ?, ?, ?, ?, ?, ?)',
+                    (data['date'], data['time'], data['name'], data['phone'],
+                     data['email'], data['jlpt_level'], data.get('lang', 'fr')))
+                self._conn.execute('COMMIT')
+                return cursor.lastrowid
+            except Exception:
+                self._conn.execute('ROLLBACK')
+                raise
+
+    def appointments_page(self, after=None, limit=500, date_from=None, date_to=None, jlpt_level=None):
+        conditions = []
+        params = []
+        if date_from:
+            conditions.append('date >= ?')
+            params.append(date_from)
+        if date_to:
+            conditions.append('date <= ?')
+            params.append(date_to)
+        if jlpt_level:
+            conditions.append('jlpt_level = ?')
+            params.append(jlpt_level)
+        if after:
+            # Pagination par clé : (date, time, id) > after, sans OFFSET
+            conditions.append('(date, time, id) > (?, ?, ?)')
+            params.extend(after)
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ''
+        rows = self._query(
+            f"SELECT {', '.join(APPOINTMENT_COLUMNS)} FROM appointments {where} "
+            f"ORDER BY date, time, id LIMIT ?", (*params, limit))
+        return [dict(row) for row in rows]
+
+    def appointments_on(self, date):
+        rows = self._query(
+            f"SELECT {', '.join(REMINDER_COLUMNS)} FROM appointments WHERE date = ? ORDER BY time, id", (date,))
+        return [dict(row) for row in rows]
+
+    def reminded_ids(self, ids):
+        reminded = set()
+        for i in range(0, len(ids), 500):
+            batch = ids[i:i+500]
+            rows = self._query(
+                f"SELECT appointment_id FROM reminders WHERE appointment_id IN ({', '.join('?' * len(batch))})",
+                batch)
+            reminded.update(row['appointment_id'] for row in rows)
+        return reminded
+
+    def record_reminders(self, ids):
+        with self._lock:
+            self._conn.execute('BEGIN')
+            self._conn.executemany(
+                'INSERT OR IGNORE INTO reminders (appointment_id) VALUES (?)', [(i,) for i in ids])
+            self._conn.execute('COMMIT')
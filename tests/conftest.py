@@ -1,9 +1,24 @@
 import pytest
 import os
+import tempfile
 from dotenv import load_dotenv
 
+# Tests hors ligne (CI) : base SQLite dans un dossier temporaire et clé de session de test,
+# fixées avant l'import de app ; STORAGE_BACKEND=supabase pour viser une vraie base
+_tmp = tempfile.mkdtemp(prefix='jlpt-tests-')
+os.environ.setdefault('STORAGE_BACKEND', 'sqlite')
+os.environ.setdefault('SQLITE_PATH', os.path.join(_tmp, 'jlpt.db'))
+os.environ.setdefault('SECRET_KEY', 'test-secret-key')
+os.environ.setdefault('MAIL_DEFAULT_SENDER', 'test@example.com')
+# Les emails de test ne partent jamais : ne pas les attendre à la sortie de pytest
+os.environ.setdefault('MAIL_DRAIN_TIMEOUT', '0')
+# Une ligne de log JSON par requête noierait la sortie de pytest ; LOG_LEVEL=INFO pour les voir
+os.environ.setdefault('LOG_LEVEL', 'WARNING')
+
 # Charger les variables d'environnement de test
 load_dotenv('.env.test')
+# Demandes de vérification en mémoire : pas de fichier SQLite créé par les tests
+os.environ.setdefault('VERIFICATION_STORE', 'memory')
 
 @pytest.fixture(autouse=True)
 def app_context():
@@ -1,29 +1,46 @@
 import pytest
 from datetime import datetime, timedelta
-from app import app, supabase_client, send_verification_email, generate_verification_code
+from app import (app, availability, holds, storage_breaker, submissions, verifications,
+                 send_verification_email, generate_verification_code)
+from storage import SQLiteStorage
+from verifications import Verification
+from profiling import RequestProfiler
 
 @pytest.fixture
 def client():
     app.config['TESTING'] = True
+    app.config['WTF_CSRF_ENABLED'] = False
+    # Le disjoncteur est partagé par tout le processus : chaque test repart fermé
+    storage_breaker.record_success()
+    submissions.clear()
     with app.test_client() as client:
         with app.app_context():  # Ajouter le contexte d'application
             yield client
 
+def pending_verification(client, code='123456', email='test@example.com', time='10:00'):
+    # Demande en attente de son code, comme après /save-appointment
+    record = Verification(code, datetime.now().strftime("%Y-%m-%d"), time, 'Test User',
+                          '0123456789', email, 'N5')
+    verification_id = verifications.create(record)
+    with client.session_transaction() as session:
+        session['verification_id'] = verification_id
+    return verification_id
+
 @pytest.fixture
-def mock_supabase_slots():
-    # Créer quelques slots de test
-    slots_data = [
-        {'date': datetime.now().strftime("%Y-%m-%d"), 'time': '10:00', 'available': True},
-        {'date': datetime.now().strftime("%Y-%m-%d"), 'time': '10:30', 'available': True},
-        {'date': datetime.now().strftime("%Y-%m-%d"), 'time': '11:00', 'available': False}
-    ]
-    for slot in slots_data:
-        supabase_client.table('slots').insert(slot).execute()
-    yield slots_data
-    # Nettoyage
-    supabase_client.table('slots').delete().neq('id', 0).execute()
-
-def test_get_available_slots(client, mock_supabase_slots):
+def seeded_slots(mocker):
+    # Base SQLite vierge pour chaque test, remplie par l'interface de stockage :
+    # 10:00 et 10:30 libres, 11:00 déjà réservé
+    today = datetime.now().strftime("%Y-%m-%d")
+    local = SQLiteStorage()
+    local.insert_slots([(today, '10:00', 1), (today, '10:30', 1), (today, '11:00', 1)])
+    local.book_slot({'date': today, 'time': '11:00', 'name': 'Other User', 'phone': '1',
+                     'email': 'other@example.com', 'jlpt_level': 'N5'})
+    mocker.patch('app.storage', local)
+    availability.invalidate()
+    yield local
+    availability.invalidate()
+
+def test_get_available_slots(client, seeded_slots):
     """Test la récupération des créneaux disponibles"""
     date = datetime.now().strftime("%Y-%m-%d")
     response = client.get(f'/get-slots?date={date}')
@@ -48,6 +65,146 @@ def test_save_appointment_form(client):
     # Vérifier le contenu spécifique de verify.html
     assert 'vérification' in response.data.decode().lower()
 
+def test_logs_without_personal_data(client, mocker, caplog):
+    """Test que les logs d'une demande de code ne contiennent ni le code ni l'email en clair"""
+    from logs import JsonFormatter
+    mocker.patch('app.send_verification_email', return_value=True)
+    mocker.patch('app.generate_verification_code', return_value='654321')
+    data = {
+        'date': (datetime.now() + timedelta(days=2)).strftime("%Y-%m-%d"),
+        'time': '14:30',
+        'name': 'Test User',
+        'phone': '0123456789',
+        'email': 'private@example.com',
+        'jlpt_level': 'N5',
+        'lang': 'fr'
+    }
+    with caplog.at_level('INFO'):
+        response = client.post('/save-appointment', data=data, headers={'X-Request-ID': 'req-42'})
+    assert response.headers['X-Request-ID'] == 'req-42'
+    lines = [JsonFormatter().format(record) for record in caplog.records]
+    assert any('"request_id": "req-42"' in line and 'p***@example.com' in line for line in lines)
+    assert not any('654321' in line or 'private@' in line or '0123456789' in line for line in lines)
+
+def test_save_appointment_deduplicated(client, mocker):
+    """Test qu'un double envoi du formulaire ne génère qu'un code et un email"""
+    send = mocker.patch('app.send_verification_email', return_value=True)
+    data = {
+        'date': (datetime.now() + timedelta(days=3)).strftime("%Y-%m-%d"),
+        'time': '15:00',
+        'name': 'Test User',
+        'phone': '0123456789',
+        'email': 'twice@example.com',
+        'jlpt_level': 'N5',
+        'lang': 'fr'
+    }
+    with client.session_transaction() as session:
+        # Secret CSRF posé à l'affichage du formulaire
+        session['csrf_token'] = 'browser-a'
+    first = client.post('/save-appointment', data=data)
+    with client.session_transaction() as session:
+        verification_id = session['verification_id']
+        # Le navigateur renvoie le POST sans avoir reçu le cookie de la première réponse
+        session.pop('verification_id')
+    second = client.post('/save-appointment', data=dict(data, email='Twice@example.com'))
+    assert second.data == first.data
+    assert send.call_count == 1
+    with client.session_transaction() as session:
+        assert session['verification_id'] == verification_id
+    assert verifications.get(verification_id).email == 'twice@example.com'
+
+    # Un autre navigateur avec les mêmes données reçoit sa propre demande, pas l'id du premier
+    other = app.test_client()
+    with other.session_transaction() as session:
+        session['csrf_token'] = 'browser-b'
+    other.post('/save-appointment', data=data)
+    with other.session_transaction() as session:
+        assert session['verification_id'] != verification_id
+    assert send.call_count == 2
+    holds.release(data['date'], data['time'], 'twice@example.com')
+
+def test_new_request_releases_previous_slot(client, mocker):
+    """Test qu'une nouvelle demande du même navigateur libère le créneau de la précédente"""
+    mocker.patch('app.send_verification_email', return_value=True)
+    from ratelimit import TokenBucketLimiter
+    mocker.patch('app.ip_limiter', TokenBucketLimiter(5, 600))
+    date = (datetime.now() + timedelta(days=4)).strftime("%Y-%m-%d")
+    data = {'date': date, 'time': '09:00', 'name': 'Test User', 'phone': '0123456789',
+            'email': 'change@example.com', 'jlpt_level': 'N5', 'lang': 'fr'}
+    client.post('/save-appointment', data=data)
+    assert holds.held_counts(date) == {'09:00': 1}
+    client.post('/save-appointment', data=dict(data, time='09:30'))
+    assert holds.held_counts(date) == {'09:30': 1}
+    holds.release(date, '09:30', 'change@example.com')
+
+def test_verify_code_deduplicated(client, mocker, seeded_slots):
+    """Test qu'une confirmation répétée ne réserve, ne génère et n'envoie qu'une fois"""
+    book = mocker.spy(seeded_slots, 'book_slot')
+    pdf = mocker.patch('app.generate_appointment_pdf')
+    send = mocker.patch('app.send_confirmation_email', return_value=True)
+    verification_id = pending_verification(client)
+    responses = []
+    for _ in range(2):
+        with client.session_transaction() as session:
+            # Le navigateur renvoie le POST avec l'ancien cookie
+            session['verification_id'] = verification_id
+        responses.append(client.post('/verify-code', data={'code': '123456', 'lang': 'fr'}))
+    assert responses[0].data == responses[1].data
+    assert book.call_count == pdf.call_count == send.call_count == 1
+    # La demande reste consommée jusqu'à son expiration
+    assert verifications.get(verification_id).consumed
+    with client.session_transaction() as session:
+        assert 'verification_id' not in session
+
+def test_verify_code_consumed_on_other_worker(client, mocker, seeded_slots):
+    """Test qu'un code déjà accepté ailleurs (cache d'un autre worker) ne réserve pas une seconde fois"""
+    book = mocker.spy(seeded_slots, 'book_slot')
+    send = mocker.patch('app.send_confirmation_email', return_value=True)
+    mocker.patch('app.generate_appointment_pdf')
+    verification_id = pending_verification(client)
+    first = client.post('/verify-code', data={'code': '123456', 'lang': 'fr'})
+    # Le second worker n'a pas la réponse d'origine dans son cache
+    submissions.clear()
+    with client.session_transaction() as session:
+        session['verification_id'] = verification_id
+    second = client.post('/verify-code', data={'code': '123456', 'lang': 'fr'})
+    assert book.call_count == send.call_count == 1
+    assert second.status_code == 200
+    assert second.data == first.data
+
+def test_verify_code_retry_after_failure(client, mocker, seeded_slots):
+    """Test qu'après un échec de la réservation, le même code peut être réessayé"""
+    mocker.patch('app.send_confirmation_email', return_value=True)
+    mocker.patch('app.generate_appointment_pdf')
+    book = mocker.patch.object(seeded_slots, 'book_slot', side_effect=[ConnectionError('down'), 1])
+    pending_verification(client)
+    client.post('/verify-code', data={'code': '123456', 'lang': 'fr'})
+    response = client.post('/verify-code', data={'code': '123456', 'lang': 'fr'})
+    assert book.call_count == 2
+    assert response.status_code == 200
+
+def test_save_appointment_slot_held(client, mocker):
+    """Test qu'un créneau en cours de vérification est refusé à un autre candidat"""
+    send = mocker.patch('app.send_verification_email', return_value=True)
+    data = {
+        'date': (datetime.now() + timedelta(days=1)).strftime("%Y-%m-%d"),
+        'time': '11:30',
+        'name': 'Test User',
+        'phone': '0123456789',
+        'email': 'first@example.com',
+        'jlpt_level': 'N5',
+        'lang': 'fr'
+    }
+    response = client.post('/save-appointment', data=data)
+    assert 'vérification' in response.data.decode().lower()
+
+    data['email'] = 'second@example.com'
+    response = client.post('/save-appointment', data=data)
+    assert 'Ce créneau vient' in response.data.decode()
+    assert send.call_count == 1
+
+    holds.release(data['date'], data['time'], 'first@example.com')
+
 def test_verification_code_generation():
     """Test la génération du code de vérification"""
     code = generate_verification_code()
@@ -56,32 +213,37 @@ def test_verification_code_generation():
     assert int(code) >= 100000  # Vérifie que c'est bien un nombre à 6 chiffres
     assert int(code) <= 999999
 
-def test_verify_code(client):
+def test_verify_code(client, mocker, seeded_slots):
     """Test la vérification du code"""
-    with client.session_transaction() as session:
-        session['verification_data'] = {
-            'code': '123456',
-            'date': datetime.now().strftime("%Y-%m-%d"),
-            'time': '10:00',
-            'name': 'Test User',
-            'phone': '0123456789',
-            'email': 'test@example.com',
-            'jlpt_level': 'N5',
-            'expires': (datetime.now() + timedelta(minutes=10)).isoformat()
-        }
+    send = mocker.patch('app.send_confirmation_email', return_value=True)
+    pending_verification(client)
     
     response = client.post('/verify-code', data={'code': '123456', 'lang': 'fr'})
     assert response.status_code == 200
     # Vérifier le contenu spécifique de success.html
     assert 'rendez-vous' in response.data.decode().lower()
+    booked = seeded_slots.appointments_on(datetime.now().strftime("%Y-%m-%d"))
+    assert [(a['time'], a['email']) for a in booked] == [('10:00', 'test@example.com'),
+                                                         ('11:00', 'other@example.com')]
+    assert send.call_count == 1
+
+def test_verify_code_slot_taken(client, mocker, seeded_slots):
+    """Test la réservation d'un créneau déjà pris par un autre candidat"""
+    book = mocker.spy(seeded_slots, 'book_slot')
+    pdf = mocker.patch('app.generate_appointment_pdf')
+    verification_id = pending_verification(client, time='11:00')
+
+    response = client.post('/verify-code', data={'code': '123456', 'lang': 'fr'})
+    assert response.status_code == 200
+    assert 'Ce créneau vient' in response.data.decode()
+    assert book.call_count == 1
+    assert book.spy_return is None
+    pdf.assert_not_called()
+    assert verifications.get(verification_id) is None
 
 def test_invalid_verification_code(client):
     """Test un code de vérification invalide"""
-    with client.session_transaction() as session:
-        session['verification_data'] = {
-            'code': '123456',
-            'expires': (datetime.now() + timedelta(minutes=10)).isoformat()
-        }
+    verification_id = pending_verification(client)
     
     response = client.post('/verify-code', data={'code': '999999', 'lang': 'fr'})
     content = response.data.decode().lower()
@@ -90,9 +252,28 @@ def test_invalid_verification_code(client):
     # Vérifier que la réponse contient la redirection
     assert 'window.location.href = \'/fr\'' in content
     assert 'redirection' in content.lower()
+    # La demande reste en attente d'un autre essai
+    assert verifications.get(verification_id).attempts == 1
 
-def test_email_sending_with_code(client):
+def test_verification_locked(client, mocker):
+    """Test qu'une demande est supprimée et son créneau libéré après trop de codes incorrects"""
+    book = mocker.patch('app.storage.book_slot')
+    release = mocker.patch.object(holds, 'release')
+    verification_id = pending_verification(client)
+    for _ in range(verifications.max_attempts - 1):
+        client.post('/verify-code', data={'code': '999999', 'lang': 'fr'})
+    response = client.post('/verify-code', data={'code': '000000', 'lang': 'fr'})
+    assert 'Trop de codes incorrects' in response.data.decode()
+    release.assert_called_once_with(datetime.now().strftime("%Y-%m-%d"), '10:00', 'test@example.com')
+    assert verifications.get(verification_id) is None
+    # Le bon code n'est plus accepté
+    client.post('/verify-code', data={'code': '123456', 'lang': 'fr'})
+    book.assert_not_called()
+
+def test_email_sending_with_code(client, mocker):
     """Test l'envoi d'email avec le code"""
+    from test_reminders import FakeMail
+    mocker.patch('app.mail.connect', FakeMail().connect)
     with app.app_context():
         # Générer un vrai code
         code = generate_verification_code()
@@ -101,32 +282,319 @@ def test_email_sending_with_code(client):
         email = "test@example.com"
         result = send_verification_email(email, code, 'fr')
         
-        # Vérifier que l'envoi a réussi
-        assert result == True
+    # Vérifier que l'email est en file et suivi par son id
+    assert result
+    assert client.get(f'/email-status/{result}').json['id'] == result
+
+def test_email_status_from_session(client, mocker):
+    """Test que l'id de l'email de vérification est rendu au navigateur"""
+    mocker.patch('app.outbox.submit', return_value='a1b2c3')
+    mocker.patch('app.outbox.status', side_effect=lambda job_id: 'sent' if job_id == 'a1b2c3' else None)
+    data = {'date': (datetime.now() + timedelta(days=5)).strftime("%Y-%m-%d"), 'time': '15:00',
+            'name': 'Test User', 'phone': '0123456789', 'email': 'status@example.com',
+            'jlpt_level': 'N5', 'lang': 'fr'}
+    response = client.post('/save-appointment', data=data)
+    assert response.headers['X-Email-Id'] == 'a1b2c3'
+    assert client.get('/email-status').json == {'id': 'a1b2c3', 'status': 'sent'}
+    assert client.get('/email-status/inconnu').status_code == 404
+    holds.release(data['date'], data['time'], 'status@example.com')
 
-def test_unavailable_dates(client, mock_supabase_slots):
+def test_unavailable_dates(client, seeded_slots):
     """Test la récupération des dates indisponibles"""
     response = client.get('/get-unavailable-dates')
     assert response.status_code == 200
     dates = response.json
     assert isinstance(dates, list)
 
-def test_initialize_slots():
+def test_month_availability(client, seeded_slots):
+    """Test le résumé des disponibilités d'un mois"""
+    today = datetime.now()
+    response = client.get(f'/availability?month={today.strftime("%Y-%m")}')
+    assert response.status_code == 200
+    days = {day['date']: day for day in response.json['days']}
+    day = days[today.strftime("%Y-%m-%d")]
+    assert day['free'] == 2
+    assert day['total'] == 3
+
+def test_get_slots_invalid_arguments(client, seeded_slots):
+    """Test qu'une date invalide est refusée et qu'une langue inconnue retombe sur le français"""
+    assert client.get('/get-slots?date=2025-01-06"x').status_code == 400
+    assert client.get('/get-slots').status_code == 400
+    today = datetime.now().strftime("%Y-%m-%d")
+    response = client.get(f'/get-slots?date={today}&lang=xx')
+    assert response.status_code == 200
+    assert response.headers['ETag'].startswith('"fr-')
+
+def test_month_availability_invalid_month(client):
+    """Test le rejet d'un mois mal formé"""
+    response = client.get('/availability?month=2025-3')
+    assert response.status_code == 400
+
+def test_language_page_not_modified(client):
+    """Test la réponse 304 d'une page de langue déjà en cache"""
+    response = client.get('/en')
+    assert response.status_code == 200
+    assert response.headers['ETag']
+    assert 'csrf_token' in response.data.decode()
+
+    cached = client.get('/en', headers={'If-None-Match': response.headers['ETag']})
+    assert cached.status_code == 304
+
+def test_storage_unavailable(client, mocker):
+    """Test que les routes de disponibilité signalent une panne du stockage au lieu d'une journée vide"""
+    mocker.patch.object(availability, 'version', side_effect=ConnectionError("stockage indisponible"))
+    mocker.patch.object(availability, 'day_version', side_effect=ConnectionError("stockage indisponible"))
+    response = client.get('/get-unavailable-dates')
+    assert response.status_code == 503
+    assert response.headers['Retry-After']
+    assert response.json == []
+    response = client.get('/availability?month=2025-01')
+    assert response.status_code == 503
+    assert response.json == {'month': '2025-01', 'days': []}
+    response = client.get('/get-slots?date=2025-01-06&lang=en')
+    assert b'temporarily unavailable' in response.data
+
+# Champs de ClientOptions et AsyncClientOptions dans supabase 2.13.0, la version de Pipfile.lock
+SUPABASE_2_13_OPTIONS = {'schema', 'headers', 'auto_refresh_token', 'persist_session', 'storage', 'realtime',
+                         'postgrest_client_timeout', 'storage_client_timeout', 'function_client_timeout',
+                         'flow_type'}
+
+def test_supabase_options_pinned_version(mocker):
+    """Test que les options du client Supabase existent dans la version verrouillée"""
+    import json, os
+    supabase = pytest.importorskip('supabase')
+    lock_path = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'Pipfile.lock')
+    with open(lock_path) as lock:
+        # En cas de mise à jour de supabase, revoir SUPABASE_2_13_OPTIONS
+        assert json.load(lock)['default']['supabase']['version'] == '==2.13.0'
+    from app import supabase_options, SUPABASE_TIMEOUT
+    for asynchronous in (False, True):
+        # Options construites pour de bon avec la version installée
+        assert supabase_options(asynchronous).postgrest_client_timeout.read == SUPABASE_TIMEOUT
+        # Puis arguments comparés aux champs de la version verrouillée
+        factory = mocker.patch.object(supabase, 'AsyncClientOptions' if asynchronous else 'ClientOptions')
+        supabase_options(asynchronous)
+        assert set(factory.call_args.kwargs) <= SUPABASE_2_13_OPTIONS
+        assert not factory.call_args.args
+
+def test_get_slots_not_modified(client, mocker):
+    """Test que /get-slots renvoie 304 tant que les disponibilités du jour ne changent pas"""
+    mocker.patch.object(availability, 'day_version', return_value='v1')
+    slots = mocker.patch('app.get_available_slots_for_date', return_value={'10:00': 1})
+    date = datetime.now().strftime("%Y-%m-%d")
+    response = client.get(f'/get-slots?date={date}')
+    assert response.status_code == 200
+    assert 'max-age' in response.headers['Cache-Control']
+
+    cached = client.get(f'/get-slots?date={date}', headers={'If-None-Match': response.headers['ETag']})
+    assert cached.status_code == 304
+    assert slots.call_count == 1
+
+    availability.day_version.return_value = 'v2'
+    response = client.get(f'/get-slots?date={date}', headers={'If-None-Match': response.headers['ETag']})
+    assert response.status_code == 200
+
+def test_metrics_endpoint(client):
+    """Test l'exposition des métriques au format Prometheus"""
+    client.get('/en')
+    response = client.get('/metrics')
+    assert response.status_code == 200
+    assert response.mimetype == 'text/plain'
+    content = response.data.decode()
+    assert 'jlpt_http_request_duration_seconds_count{method="GET",route="/en",status="200"}' in content
+    assert 'jlpt_template_render_duration_seconds' in content
+
+def test_trusted_proxy(monkeypatch):
+    """Test que l'adresse du client est lue dans X-Forwarded-For derrière un proxy de confiance"""
+    import app as app_module
+    from werkzeug.test import EnvironBuilder
+    environ = EnvironBuilder(headers={'X-Forwarded-For': '203.0.113.7'},
+                             environ_base={'REMOTE_ADDR': '10.0.0.1'}).get_environ()
+    wsgi_app = lambda environ, start_response: environ
+    assert app_module.trusted_proxy(wsgi_app)(dict(environ), None)['REMOTE_ADDR'] == '10.0.0.1'
+    monkeypatch.setattr(app_module, 'PROXY_FIX_HOPS', 1)
+    assert app_module.trusted_proxy(wsgi_app)(dict(environ), None)['REMOTE_ADDR'] == '203.0.113.7'
+
+def test_save_appointment_rate_limited(client, mocker):
+    """Test le refus rapide et traduit au-delà de la limite de codes par email"""
+    from ratelimit import TokenBucketLimiter
+    mocker.patch('app.email_limiter', TokenBucketLimiter(1, 600))
+    send = mocker.patch('app.send_verification_email', return_value=True)
+    data = {
+        'date': (datetime.now() + timedelta(days=1)).strftime("%Y-%m-%d"),
+        'time': '12:00',
+        'name': 'Test User',
+        'phone': '0123456789',
+        'email': 'limited@example.com',
+        'jlpt_level': 'N5',
+        'lang': 'en'
+    }
+    assert client.post('/save-appointment', data=data).status_code == 200
+    # Autre créneau, même email (la même demande répétée serait dédoublonnée)
+    response = client.post('/save-appointment', data=dict(data, time='12:30'))
+    assert response.status_code == 429
+    assert int(response.headers['Retry-After']) > 0
+    assert 'Too many requests' in response.data.decode()
+    assert send.call_count == 1
+
+    holds.release(data['date'], data['time'], 'limited@example.com')
+
+def test_export_requires_token(client):
+    """Test que l'export est refusé sans jeton d'administration"""
+    app.config['ADMIN_TOKEN'] = 'secret'
+    assert client.get('/admin/export').status_code == 403
+    assert client.get('/admin/export', headers={'Authorization': 'Bearer wrong'}).status_code == 403
+
+def test_export_appointments(client, mocker):
+    """Test l'export CSV et NDJSON des rendez-vous, page par page"""
+    app.config['ADMIN_TOKEN'] = 'secret'
+    row = {'id': 1, 'date': '2025-01-06', 'time': '09:30', 'name': 'A', 'phone': '1',
+           'email': 'a@example.com', 'jlpt_level': 'N5', 'created_at': '2025-01-01'}
+    page = mocker.patch('app.storage.appointments_page', side_effect=[[row], []] * 2)
+    mocker.patch('app.EXPORT_PAGE_SIZE', 1)
+    headers = {'Authorization': 'Bearer secret'}
+
+    response = client.get('/admin/export?format=csv&level=N5', headers=headers)
+    assert response.mimetype == 'text/csv'
+    lines = response.data.decode().splitlines()
+    assert lines[0] == 'id,date,time,name,phone,email,jlpt_level,created_at'
+    assert lines[1].startswith('1,2025-01-06,09:30,A')
+    assert page.call_args_list[1].kwargs['after'] == ('2025-01-06', '09:30', 1)
+    assert page.call_args_list[0].kwargs['jlpt_level'] == 'N5'
+
+    response = client.get('/admin/export?format=ndjson', headers=headers)
+    assert response.mimetype == 'application/x-ndjson'
+    assert response.data.decode().splitlines() == ['{"id": 1, "date": "2025-01-06", "time": "09:30", "name": "A", '
+                                                   '"phone": "1", "email": "a@example.com", "jlpt_level": "N5", '
+                                                   '"created_at": "2025-01-01"}']
+
+def test_export_confirmations(client, mocker):
+    """Test l'archive ZIP des confirmations d'un jour, sans renvoi d'email par HTTP"""
+    import zipfile
+    from io import BytesIO
+    app.config['ADMIN_TOKEN'] = 'secret'
+    row = {'id': 7, 'date': '2025-01-06', 'time': '09:30', 'name': 'A', 'phone': '1',
+           'email': 'a@example.com', 'jlpt_level': 'N5', 'created_at': '2025-01-01'}
+    page = mocker.patch('app.storage.appointments_page', return_value=[row])
+    mocker.patch('app.PDF_WORKERS', 1)
+    send = mocker.patch('app.send_confirmation_email', return_value=True)
+    headers = {'Authorization': 'Bearer secret'}
+
+    assert client.get('/admin/confirmations.zip', headers=headers).status_code == 400
+    # resend n'est pas accepté en GET : aucun email ne part
+    response = client.get('/admin/confirmations.zip?date=2025-01-06&resend=1', headers=headers)
+    assert response.mimetype == 'application/zip'
+    archive = zipfile.ZipFile(BytesIO(response.data))
+    assert archive.namelist() == ['confirmation_2025-01-06_09h30_7.pdf']
+    assert page.call_args.kwargs['date_from'] == page.call_args.kwargs['date_to'] == '2025-01-06'
+    send.assert_not_called()
+
+def test_import_without_network():
+    """Test que l'import de app ne charge ni supabase ni les bibliothèques du PDF"""
+    import os, subprocess, sys
+    code = "import sys, app; print([m for m in ('supabase', 'reportlab', 'qrcode', 'PIL') if m in sys.modules])"
+    result = subprocess.run([sys.executable, '-c', code], capture_output=True, text=True, check=True,
+                            cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    assert result.stdout.strip() == '[]'
+
+def test_create_app():
+    """Test la fabrique d'application avec une configuration de test"""
+    from app import create_app
+    other = create_app({'TESTING': True, 'ADMIN_TOKEN': 'other'})
+    assert other is not app
+    assert other.config['ADMIN_TOKEN'] == 'other'
+    assert other.test_client().get('/metrics').status_code == 200
+    assert 'sync-slots' in other.cli.commands
+    # Les extensions du processus restent liées à l'application servie
+    import app as app_module
+    assert app_module.outbox.app is app
+    assert other.extensions['outbox'] is app_module.outbox
+
+def test_send_reminders(mocker):
+    """Test l'envoi des rappels de la veille, traduits et sans doublon à la relance"""
+    from storage import SQLiteStorage
+    from test_reminders import FakeMail
+    local = SQLiteStorage()
+    local.insert_slots([('2025-01-06', '09:30', 2)])
+    booking = {'date': '2025-01-06', 'time': '09:30', 'name': 'Test User', 'phone': '1',
+               'email': 'a@example.com', 'jlpt_level': 'N5'}
+    local.book_slot(dict(booking, lang='en'))
+    local.book_slot(dict(booking, email='b@example.com'))
+    mocker.patch('app.storage', local)
+    fake = FakeMail()
+    mocker.patch('app.mail.connect', fake.connect)
+    runner = app.test_cli_runner()
+
+    result = runner.invoke(args=['send-reminders', '--date', '2025-01-06'])
+    assert result.exit_code == 0
+    assert [m.recipients for m in fake.sent] == [['a@example.com'], ['b@example.com']]
+    assert fake.sent[0].subject == 'Reminder: your JLPT appointment tomorrow'
+    assert 'le 2025-01-06 à 09:30' in fake.sent[1].body
+    assert fake.opened == 1
+
+    result = runner.invoke(args=['send-reminders', '--date', '2025-01-06'])
+    assert '0 rappels envoyés' in result.output
+    assert len(fake.sent) == 2
+
+def test_send_reminders_stops_when_not_recorded(mocker, monkeypatch):
+    """Test qu'un lot de rappels non enregistré arrête l'envoi avec un code d'erreur"""
+    from storage import SQLiteStorage
+    from test_reminders import FakeMail
+    local = SQLiteStorage()
+    local.insert_slots([('2025-01-06', '09:30', 3)])
+    for email in ('a@example.com', 'b@example.com', 'c@example.com'):
+        local.book_slot({'date': '2025-01-06', 'time': '09:30', 'name': 'Test User', 'phone': '1',
+                         'email': email, 'jlpt_level': 'N5'})
+    mocker.patch('app.storage', local)
+    mocker.patch.object(local, 'record_reminders', side_effect=PermissionError('row-level security'))
+    monkeypatch.setattr('app.REMINDER_BATCH_SIZE', 1)
+    fake = FakeMail()
+    mocker.patch('app.mail.connect', fake.connect)
+
+    result = app.test_cli_runner().invoke(args=['send-reminders', '--date', '2025-01-06'])
+    assert result.exit_code != 0
+    assert 'non enregistrés' in result.output
+    # Seul le premier lot est parti
+    assert len(fake.sent) == 1
+
+def test_initialize_slots(mocker, monkeypatch):
     """Test l'initialisation des créneaux"""
+    local = SQLiteStorage()
+    mocker.patch('app.storage', local)
+    monkeypatch.setenv('CALENDAR_FIRST_DAY', '2025-03-03')
+    monkeypatch.setenv('CALENDAR_LAST_DAY', '2025-03-09')
     with app.app_context():  # Ajouter le contexte d'application
-        # D'abord nettoyer la base
-        supabase_client.table('slots').delete().neq('id', 0).execute()
-        
         # Initialiser les slots
         from app import initialize_supabase_slots
         initialize_supabase_slots()
         
-        # Vérifier qu'il y a des slots
-        response = supabase_client.table('slots').select('*').execute()
-        assert len(response.data) > 0
+        # Vérifier qu'il y a des slots (6 jours ouvrés, dimanche fermé)
+        slots = local.load_slots()
+        assert len({slot['date'] for slot in slots}) == 6
+        assert len(slots) == 6 * 15
 
-def test_save_appointment_email_flow(client):
+def test_sync_slots_command(mocker, monkeypatch):
+    """Test que flask sync-slots affiche le résultat et échoue si le stockage échoue"""
+    local = SQLiteStorage()
+    mocker.patch('app.storage', local)
+    monkeypatch.setenv('CALENDAR_FIRST_DAY', '2025-03-03')
+    monkeypatch.setenv('CALENDAR_LAST_DAY', '2025-03-09')
+    runner = app.test_cli_runner()
+
+    result = runner.invoke(args=['sync-slots'])
+    assert result.exit_code == 0
+    assert '90 créneaux ajoutés' in result.output
+
+    mocker.patch.object(local, 'insert_slots', side_effect=ConnectionError('supabase indisponible'))
+    monkeypatch.setenv('CALENDAR_LAST_DAY', '2025-03-10')
+    result = runner.invoke(args=['sync-slots'])
+    assert result.exit_code != 0
+    assert 'supabase indisponible' in result.output
+
+def test_save_appointment_email_flow(client, mocker):
     """Test le flux complet de soumission du formulaire et envoi d'email"""
+    from test_reminders import FakeMail
+    mocker.patch('app.mail.connect', FakeMail().connect)
     data = {
         'date': datetime.now().strftime("%Y-%m-%d"),
         'time': '10:00',
@@ -142,4 +610,25 @@ def test_save_appointment_email_flow(client):
     
     # Vérifier que la page de vérification est affichée
     content = response.data.decode().lower()
-    assert 'vérification' in content 
\ No newline at end of file
+    assert 'vérification' in content
+
+def test_admin_profiles(client, mocker, tmp_path):
+    """Test la liste des captures les plus lentes et leur téléchargement"""
+    app.config['ADMIN_TOKEN'] = 'secret'
+    headers = {'Authorization': 'Bearer secret'}
+    assert client.get('/admin/profiles', headers=headers).status_code == 404
+
+    profiler = RequestProfiler(str(tmp_path))
+    mocker.patch('app.profiler', profiler)
+    for name in ('1700000000000_120000_POST_verify-code.prof', '1700000001000_45000_GET_get-slots.prof',
+                 '1700000002000_300000_POST_verify-code.prof'):
+        (tmp_path / name).write_bytes(b'prof')
+    assert client.get('/admin/profiles').status_code == 403
+    profiles = client.get('/admin/profiles', headers=headers).get_json()['profiles']
+    assert [p['duration_ms'] for p in profiles] == [300.0, 120.0, 45.0]
+    profiles = client.get('/admin/profiles?route=/get-slots', headers=headers).get_json()['profiles']
+    assert [p['route'] for p in profiles] == ['get-slots']
+
+    response = client.get(f"/admin/profiles/{profiles[0]['file']}", headers=headers)
+    assert response.data == b'prof'
+    assert client.get('/admin/profiles/unknown.prof', headers=headers).status_code == 404
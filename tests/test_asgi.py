@@ -0,0 +1,199 @@
+import asyncio
+import threading
+from datetime import datetime, timedelta
+import pytest
+
+pytest.importorskip('asgiref')
+pytest.importorskip('aiosmtplib')
+
+import asgi
+import app as app_module
+from app import app, availability
+from flask_mail import Message
+from outbox import FAILED
+from verifications import Verification
+
+
+class FakeStorage:
+    """Stockage asynchrone en mémoire qui compte les appels"""
+
+    def __init__(self, rows):
+        self.rows = rows
+        self.loads = 0
+        self.bookings = []
+
+    async def load_slots(self):
+        self.loads += 1
+        await asyncio.sleep(0)
+        return self.rows
+
+    async def book_slot(self, data):
+        self.bookings.append(data)
+        return len(self.bookings)
+
+
+@pytest.fixture
+def fake_storage(monkeypatch):
+    app.config['WTF_CSRF_ENABLED'] = False
+    # startup() remplace l'outbox du module app : la remettre après le test
+    monkeypatch.setattr(app_module, 'outbox', app_module.outbox)
+    date = (datetime.now() + timedelta(days=1)).strftime("%Y-%m-%d")
+    storage = FakeStorage([
+        {'id': 1, 'date': date, 'time': '10:00', 'capacity': 1, 'booked': 0},
+        {'id': 2, 'date': date, 'time': '10:30', 'capacity': 1, 'booked': 1},
+    ])
+    asgi._started = None
+    availability.invalidate()
+    yield storage
+    availability.invalidate()
+    asgi._started = None
+
+
+def call(method, path, query=b'', body=b'', headers=(), storage=None):
+    """Envoie une requête à l'application ASGI et renvoie (statut, en-têtes, corps)"""
+    async def scenario():
+        await asgi.ensure_started()
+        if storage is not None:
+            asgi.async_storage = storage
+        messages = []
+        received = iter([{'type': 'http.request', 'body': body, 'more_body': False}])
+
+        async def receive():
+            return next(received)
+
+        async def send(message):
+            messages.append(message)
+
+        scope = {'type': 'http', 'method': method, 'path': path, 'query_string': query,
+                 'http_version': '1.1', 'headers': list(headers), 'client': ('127.0.0.1', 5000)}
+        await asgi.application(scope, receive, send)
+        start = messages[0]
+        return (start['status'], dict(start['headers']),
+                b''.join(message.get('body', b'') for message in messages[1:]).decode())
+    return asyncio.run(scenario())
+
+
+def test_get_slots_async(fake_storage):
+    """Test que /get-slots recharge la grille avec le stockage asynchrone"""
+    date = fake_storage.rows[0]['date']
+    status, headers, body = call('GET', '/get-slots', f'date={date}&lang=fr'.encode(), storage=fake_storage)
+    assert status == 200
+    assert '10:00' in body
+    assert '10:30' not in body
+    assert fake_storage.loads == 1
+
+
+def test_get_slots_reads_holds_off_loop(fake_storage, mocker):
+    """Test que la lecture des retenues (SQLite) de /get-slots ne bloque pas la boucle"""
+    threads = []
+    held_counts = app_module.holds.held_counts
+    mocker.patch.object(app_module.holds, 'held_counts',
+                        side_effect=lambda date: threads.append(threading.current_thread()) or held_counts(date))
+    date = fake_storage.rows[0]['date']
+    status, headers, body = call('GET', '/get-slots', f'date={date}&lang=fr'.encode(), storage=fake_storage)
+    assert status == 200
+    assert threads and all(thread is not threading.main_thread() for thread in threads)
+
+
+def test_flask_routes_unchanged(fake_storage):
+    """Test que les autres routes restent servies par Flask"""
+    status, headers, body = call('GET', '/en', storage=fake_storage)
+    assert status == 200
+    assert headers[b'content-type'].startswith(b'text/html')
+
+
+def test_verify_code_async(fake_storage, mocker):
+    """Test la réservation avec le client asynchrone et la session Flask"""
+    send = mocker.patch('app.send_confirmation_email', return_value=True)
+    row = fake_storage.rows[0]
+    verification_id = app_module.verifications.create(Verification(
+        '123456', row['date'], row['time'], 'Test User', '0123456789', 'test@example.com', 'N5'))
+    cookie = app.session_interface.get_signing_serializer(app).dumps({'verification_id': verification_id})
+    status, headers, body = call(
+        'POST', '/verify-code', body=b'code=123456&lang=fr',
+        headers=[(b'content-type', b'application/x-www-form-urlencoded'),
+                 (b'cookie', f'session={cookie}'.encode())],
+        storage=fake_storage)
+    assert status == 200
+    assert fake_storage.bookings[0]['email'] == 'test@example.com'
+    assert send.call_count == 1
+    # La session est vidée une fois le rendez-vous confirmé
+    assert b'session=' in headers[b'set-cookie']
+
+
+def test_save_appointment_async(fake_storage, mocker):
+    """Test que la demande de code écrit dans le magasin hors de la boucle"""
+    send = mocker.patch('app.send_verification_email', return_value=True)
+    threads = []
+    create = app_module.verifications.create
+    mocker.patch.object(app_module.verifications, 'create',
+                        side_effect=lambda *a, **kw: threads.append(threading.current_thread()) or create(*a, **kw))
+    row = fake_storage.rows[0]
+    body = (f"date={row['date']}&time={row['time']}&name=Test&phone=0123456789"
+            f"&email=async@example.com&jlpt_level=N5&lang=fr").encode()
+    status, headers, content = call('POST', '/save-appointment', body=body,
+                                    headers=[(b'content-type', b'application/x-www-form-urlencoded')],
+                                    storage=fake_storage)
+    assert status == 200
+    assert send.call_count == 1
+    assert fake_storage.loads == 1
+    assert threads and threads[0] is not threading.main_thread()
+    assert b'session=' in headers[b'set-cookie']
+    app_module.holds.release(row['date'], row['time'], 'async@example.com')
+
+
+class FailingStorage(FakeStorage):
+    async def load_slots(self):
+        raise ConnectionError('stockage indisponible')
+
+
+def test_first_load_failure_off_loop(fake_storage, monkeypatch):
+    """Test que, sans grille, le rechargement synchrone de la vue ne bloque pas la boucle"""
+    threads = []
+
+    def loader():
+        threads.append(threading.current_thread())
+        raise ConnectionError('stockage indisponible')
+
+    monkeypatch.setattr(availability, '_loaded', False)
+    monkeypatch.setattr(availability, '_loader', loader)
+    status, headers, body = call('GET', '/get-unavailable-dates', storage=FailingStorage([]))
+    assert status == 503
+    assert threads and all(thread is not threading.main_thread() for thread in threads)
+
+
+def test_lifespan_drains_outbox(fake_storage, mocker):
+    """Test que l'arrêt du worker attend les emails encore en file"""
+    drain = mocker.patch.object(asgi.AsyncOutbox, 'drain', return_value=True)
+
+    async def scenario():
+        messages = iter([{'type': 'lifespan.startup'}, {'type': 'lifespan.shutdown'}])
+        sent = []
+
+        async def receive():
+            return next(messages)
+
+        async def send(message):
+            sent.append(message['type'])
+
+        await asgi.application({'type': 'lifespan'}, receive, send)
+        return sent
+    assert asyncio.run(scenario()) == ['lifespan.startup.complete', 'lifespan.shutdown.complete']
+    drain.assert_called_once_with(app_module.MAIL_DRAIN_TIMEOUT)
+
+
+def test_async_outbox_gives_up():
+    """Test que l'outbox asynchrone abandonne après les nouvelles tentatives"""
+    async def scenario():
+        outbox = asgi.AsyncOutbox(app, asyncio.get_running_loop(), max_retries=1, backoff=0.01)
+        app.config['MAIL_SERVER'], port = '127.0.0.1', app.config['MAIL_PORT']
+        app.config['MAIL_PORT'] = 9
+        try:
+            with app.app_context():
+                job_id = outbox.submit(Message('Test', sender='jlpt@example.com', recipients=['a@example.com']))
+            while outbox.pending():
+                await asyncio.sleep(0.01)
+        finally:
+            app.config['MAIL_PORT'] = port
+        return outbox.status(job_id)
+    assert asyncio.run(scenario()) == FAILED
@@ -0,0 +1,139 @@
+import pytest
+from availability import AvailabilityGrid
+
+
+@pytest.fixture
+def rows():
+    return [
+        {'date': '2025-01-06', 'time': '10:00', 'capacity': 1, 'booked': 0},
+        {'date': '2025-01-06', 'time': '09:30', 'capacity': 1, 'booked': 0},
+        {'date': '2025-01-06', 'time': '10:30', 'capacity': 1, 'booked': 1},
+        {'date': '2025-01-07', 'time': '09:30', 'capacity': 1, 'booked': 1},
+        {'date': '2025-01-07', 'time': '10:00', 'capacity': 1, 'booked': 1},
+    ]
+
+
+def test_available_times_sorted(rows):
+    """Test que les créneaux libres sont renvoyés triés"""
+    grid = AvailabilityGrid(lambda: rows)
+    assert grid.available_times('2025-01-06') == ['09:30', '10:00']
+    assert grid.available_times('2025-01-07') == []
+    assert grid.available_times('2030-01-01') == []
+
+
+def test_unavailable_dates(rows):
+    """Test une entrée par créneau indisponible"""
+    grid = AvailabilityGrid(lambda: rows)
+    assert grid.unavailable_dates() == ['2025-01-06', '2025-01-07', '2025-01-07']
+
+
+def test_loader_called_once_within_ttl(rows):
+    """Test que la grille ne recharge pas avant l'expiration du TTL"""
+    calls = []
+
+    def loader():
+        calls.append(1)
+        return rows
+
+    grid = AvailabilityGrid(loader, ttl=60)
+    grid.available_times('2025-01-06')
+    grid.unavailable_dates()
+    assert len(calls) == 1
+
+    grid.invalidate()
+    grid.available_times('2025-01-06')
+    assert len(calls) == 2
+
+
+def test_book_seat_is_write_through(rows):
+    """Test que la réservation est visible sans rechargement"""
+    calls = []
+
+    def loader():
+        calls.append(1)
+        return rows
+
+    grid = AvailabilityGrid(loader, ttl=60)
+    grid.available_times('2025-01-06')
+    grid.book_seat('2025-01-06', '09:30')
+    assert grid.available_times('2025-01-06') == ['10:00']
+    assert len(calls) == 1
+
+
+def test_month_summary(rows):
+    """Test le nombre de créneaux libres et total par jour du mois"""
+    grid = AvailabilityGrid(lambda: rows + [{'date': '2025-02-03', 'time': '09:30', 'capacity': 1, 'booked': 0}])
+    assert grid.month_summary('2025-01') == [
+        {'date': '2025-01-06', 'free': 2, 'total': 3, 'seats': 2},
+        {'date': '2025-01-07', 'free': 0, 'total': 2, 'seats': 0},
+    ]
+    assert grid.month_summary('2025-03') == []
+
+
+def test_versions_change_on_booking(rows):
+    """Test que les versions changent à chaque réservation"""
+    grid = AvailabilityGrid(lambda: rows)
+    day_before = grid.day_version('2025-01-06')
+    other_day = grid.day_version('2025-01-07')
+    version_before = grid.version()
+    assert grid.version() == version_before
+
+    grid.book_seat('2025-01-06', '09:30')
+    assert grid.day_version('2025-01-06') != day_before
+    assert grid.day_version('2025-01-07') == other_day
+    assert grid.version() != version_before
+
+
+def test_versions_stable_across_grids(rows):
+    """Test que deux workers avec les mêmes données produisent les mêmes versions"""
+    first = AvailabilityGrid(lambda: rows)
+    second = AvailabilityGrid(lambda: list(reversed(rows)))
+    assert first.version() == second.version()
+    assert first.day_version('2025-01-06') == second.day_version('2025-01-06')
+
+
+def test_seats_per_slot():
+    """Test le décompte des places restantes d'un créneau à plusieurs places"""
+    grid = AvailabilityGrid(lambda: [
+        {'date': '2025-01-06', 'time': '09:30', 'capacity': 3, 'booked': 1},
+        {'date': '2025-01-06', 'time': '10:00', 'capacity': 2, 'booked': 2},
+    ])
+    assert grid.remaining_seats('2025-01-06') == {'09:30': 2, '10:00': 0}
+    assert grid.available_times('2025-01-06') == ['09:30']
+    version = grid.day_version('2025-01-06')
+
+    grid.book_seat('2025-01-06', '09:30')
+    assert grid.available_times('2025-01-06') == ['09:30']
+    assert grid.day_version('2025-01-06') != version
+    grid.book_seat('2025-01-06', '09:30')
+    assert grid.available_times('2025-01-06') == []
+    assert grid.month_summary('2025-01') == [{'date': '2025-01-06', 'free': 0, 'total': 2, 'seats': 0}]
+
+
+def test_serves_last_grid_when_storage_fails(rows):
+    """Test que la dernière grille connue reste servie pendant une panne du stockage"""
+    calls = []
+
+    def loader():
+        calls.append(1)
+        if len(calls) > 1:
+            raise ConnectionError("stockage indisponible")
+        return rows
+
+    grid = AvailabilityGrid(loader, ttl=60, stale_retry=60)
+    assert grid.available_times('2025-01-06') == ['09:30', '10:00']
+    grid.invalidate()
+    assert grid.available_times('2025-01-06') == ['09:30', '10:00']
+    # Pas de nouvel essai avant stale_retry
+    grid.unavailable_dates()
+    assert len(calls) == 2
+
+
+def test_storage_failure_without_grid(rows):
+    """Test que l'erreur remonte quand aucune grille n'a encore été chargée"""
+    def loader():
+        raise ConnectionError("stockage indisponible")
+
+    grid = AvailabilityGrid(loader)
+    with pytest.raises(ConnectionError):
+        grid.available_times('2025-01-06')
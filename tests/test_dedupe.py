@@ -0,0 +1,57 @@
+import threading
+from dedupe import DedupeCache
+
+
+class Clock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_first_claim_runs_then_replays():
+    """Test que seule la première demande s'exécute et que les suivantes reçoivent son résultat"""
+    clock = Clock()
+    cache = DedupeCache(ttl=30, clock=clock)
+    owner, entry = cache.claim('k')
+    assert owner
+    assert cache.claim('k')[0] is False
+    cache.finish('k', 'résultat')
+    owner, entry = cache.claim('k')
+    assert not owner
+    assert entry.wait(0) == 'résultat'
+
+    clock.now += 31
+    assert cache.claim('k')[0]
+
+
+def test_waits_for_request_in_flight():
+    """Test qu'une demande simultanée attend le résultat de la première"""
+    cache = DedupeCache()
+    cache.claim('k')
+    results = []
+    waiter = threading.Thread(target=lambda: results.append(cache.claim('k')[1].wait(5)))
+    waiter.start()
+    cache.finish('k', 'résultat')
+    waiter.join()
+    assert results == ['résultat']
+
+
+def test_failure_is_not_kept():
+    """Test qu'une demande en échec libère la clé"""
+    cache = DedupeCache()
+    owner, entry = cache.claim('k')
+    cache.abandon('k')
+    assert entry.wait(0) is None
+    assert cache.claim('k')[0]
+
+
+def test_max_keys():
+    """Test que le nombre de clés gardées est borné"""
+    cache = DedupeCache(max_keys=2)
+    for key in 'abc':
+        cache.claim(key)
+        cache.finish(key, key)
+    assert cache.claim('a')[0]
+    assert not cache.claim('c')[0]
@@ -0,0 +1,92 @@
+from datetime import datetime, timedelta
+from holds import FileSlotHolds, SlotHolds, held_tag
+
+
+class Clock:
+    def __init__(self):
+        self.now = datetime(2025, 1, 6, 9, 0)
+
+    def __call__(self):
+        return self.now
+
+
+def test_hold_blocks_other_candidates():
+    """Test qu'un créneau retenu est refusé aux autres candidats"""
+    clock = Clock()
+    holds = SlotHolds(clock)
+    expires = clock.now + timedelta(minutes=10)
+    assert holds.hold('2025-01-06', '10:00', 'a@example.com', expires)
+    assert not holds.hold('2025-01-06', '10:00', 'b@example.com', expires)
+    # Le même candidat peut renouveler sa demande
+    assert holds.hold('2025-01-06', '10:00', 'a@example.com', expires)
+    assert holds.held_counts('2025-01-06') == {'10:00': 1}
+
+
+def test_hold_expires():
+    """Test l'expiration automatique d'une retenue"""
+    clock = Clock()
+    holds = SlotHolds(clock)
+    holds.hold('2025-01-06', '10:00', 'a@example.com', clock.now + timedelta(minutes=10))
+    clock.now += timedelta(minutes=11)
+    assert holds.held_counts('2025-01-06') == {}
+    assert holds.hold('2025-01-06', '10:00', 'b@example.com', clock.now + timedelta(minutes=10))
+
+
+def test_renewed_hold_outlives_first_expiry():
+    """Test qu'une retenue renouvelée n'expire pas avec l'ancienne échéance"""
+    clock = Clock()
+    holds = SlotHolds(clock)
+    holds.hold('2025-01-06', '10:00', 'a@example.com', clock.now + timedelta(minutes=10))
+    clock.now += timedelta(minutes=5)
+    holds.hold('2025-01-06', '10:00', 'a@example.com', clock.now + timedelta(minutes=10))
+    clock.now += timedelta(minutes=6)
+    assert holds.held_counts('2025-01-06') == {'10:00': 1}
+
+
+def test_release_only_by_owner():
+    """Test que seul le candidat qui retient le créneau peut le libérer"""
+    clock = Clock()
+    holds = SlotHolds(clock)
+    holds.hold('2025-01-06', '10:00', 'a@example.com', clock.now + timedelta(minutes=10))
+    holds.release('2025-01-06', '10:00', 'b@example.com')
+    assert holds.held_counts('2025-01-06') == {'10:00': 1}
+    holds.release('2025-01-06', '10:00', 'a@example.com')
+    assert holds.held_counts('2025-01-06') == {}
+
+
+def test_held_tag():
+    """Test l'empreinte stable des créneaux retenus"""
+    assert held_tag({}) == '0'
+    assert held_tag({'10:00': 1, '09:30': 2}) == held_tag({'09:30': 2, '10:00': 1})
+    assert held_tag({'10:00': 1}) != held_tag({'10:30': 1})
+    assert held_tag({'10:00': 1}) != held_tag({'10:00': 2})
+
+
+def test_hold_up_to_seats():
+    """Test qu'un créneau à plusieurs places peut être retenu par autant de candidats"""
+    clock = Clock()
+    holds = SlotHolds(clock)
+    expires = clock.now + timedelta(minutes=10)
+    assert holds.hold('2025-01-06', '10:00', 'a@example.com', expires, seats=2)
+    assert holds.hold('2025-01-06', '10:00', 'b@example.com', expires, seats=2)
+    assert not holds.hold('2025-01-06', '10:00', 'c@example.com', expires, seats=2)
+    assert holds.held_counts('2025-01-06') == {'10:00': 2}
+    holds.release('2025-01-06', '10:00', 'a@example.com')
+    assert holds.hold('2025-01-06', '10:00', 'c@example.com', expires, seats=2)
+
+
+def test_file_holds_shared_between_workers(tmp_path):
+    """Test que les retenues du fichier SQLite sont vues par tous les workers"""
+    clock = Clock()
+    path = str(tmp_path / 'verifications.db')
+    first, second = FileSlotHolds(path, clock), FileSlotHolds(path, clock)
+    expires = clock.now + timedelta(minutes=10)
+    assert first.hold('2025-01-06', '10:00', 'a@example.com', expires)
+    assert not second.hold('2025-01-06', '10:00', 'b@example.com', expires)
+    assert second.hold('2025-01-06', '10:00', 'a@example.com', expires)
+    assert second.held_counts('2025-01-06') == {'10:00': 1}
+    second.release('2025-01-06', '10:00', 'a@example.com')
+    assert first.hold('2025-01-06', '10:00', 'b@example.com', expires)
+    clock.now += timedelta(minutes=11)
+    assert first.held_counts('2025-01-06') == {}
+    assert second.hold('2025-01-06', '10:00', 'c@example.com', clock.now + timedelta(minutes=10))
@@ -0,0 +1,72 @@
+import io
+import json
+import logging
+import sys
+from logs import BackgroundQueueHandler, JsonFormatter, SamplingFilter, StderrHandler, mask, parse_levels
+
+
+def record(msg='message', level=logging.INFO, **extra):
+    rec = logging.LogRecord('jlpt', level, __file__, 1, msg, (), None)
+    rec.__dict__.update(extra)
+    return rec
+
+
+def test_mask_personal_data():
+    """Test le masquage des données personnelles et des secrets"""
+    assert mask('email', 'test@example.com') == 't***@example.com'
+    assert mask('phone', '0123456789') == '********89'
+    assert mask('name', 'Test User') == 'T***'
+    assert mask('code', '123456') == '***'
+    assert mask('date', '2025-01-06') == '2025-01-06'
+
+
+def test_json_formatter():
+    """Test une ligne JSON avec les champs de `extra` masqués"""
+    line = JsonFormatter().format(record("code envoyé", email='test@example.com', code='123456',
+                                         request_id='abc', duration_ms=1.5))
+    entry = json.loads(line)
+    assert entry['msg'] == "code envoyé"
+    assert entry['level'] == 'INFO'
+    assert entry['request_id'] == 'abc'
+    assert entry['duration_ms'] == 1.5
+    assert entry['email'] == 't***@example.com'
+    assert '123456' not in line
+
+
+def test_sampling_keeps_warnings():
+    """Test que l'échantillonnage n'écarte jamais les avertissements et erreurs"""
+    sampling = SamplingFilter(0)
+    assert not sampling.filter(record(level=logging.INFO))
+    assert sampling.filter(record(level=logging.WARNING))
+    assert SamplingFilter(1).filter(record(level=logging.DEBUG))
+
+
+def test_written_by_background_thread(monkeypatch):
+    """Test que l'écriture a lieu hors du thread appelant, trace comprise"""
+    stderr = io.StringIO()
+    monkeypatch.setattr(sys, 'stderr', stderr)
+    output = StderrHandler()
+    output.setFormatter(JsonFormatter())
+    handler = BackgroundQueueHandler(output)
+    logger = logging.getLogger('test_logs')
+    logger.propagate = False
+    logger.addHandler(handler)
+    try:
+        try:
+            raise ValueError("boom")
+        except ValueError:
+            logger.error("échec %s", 'x', extra={'email': 'a@example.com'})
+            logger.exception("échec")
+    finally:
+        handler.stop()
+        logger.removeHandler(handler)
+    first, second = [json.loads(line) for line in stderr.getvalue().splitlines()]
+    assert first['msg'] == 'échec x'
+    assert first['email'] == 'a***@example.com'
+    assert 'ValueError: boom' in second['exc']
+
+
+def test_parse_levels():
+    """Test la lecture des niveaux par logger"""
+    assert parse_levels('jlpt.outbox=debug, werkzeug=WARNING') == {'jlpt.outbox': 'DEBUG', 'werkzeug': 'WARNING'}
+    assert parse_levels(None) == {}
@@ -0,0 +1,88 @@
+import asyncio
+import os
+from metrics import Registry, TimedCalls
+
+
+def test_counter_render():
+    """Test le format texte d'un compteur avec étiquettes"""
+    registry = Registry()
+    counter = registry.counter('test_events_total', "Événements", ('kind',))
+    counter.inc(kind='a')
+    counter.inc(2, kind='b"x')
+    lines = registry.render().splitlines()
+    assert lines[0] == '# HELP test_events_total Événements'
+    assert lines[1] == '# TYPE test_events_total counter'
+    assert 'test_events_total{kind="a"} 1.0' in lines
+    assert 'test_events_total{kind="b\\"x"} 2.0' in lines
+
+
+def test_histogram_buckets_are_cumulative():
+    """Test les intervalles cumulés, la somme et le nombre d'observations"""
+    registry = Registry()
+    histogram = registry.histogram('test_duration_seconds', "Durée", buckets=(0.1, 1.0))
+    for value in (0.05, 0.1, 0.5, 3.0):
+        histogram.observe(value)
+    lines = registry.render().splitlines()
+    assert 'test_duration_seconds_bucket{le="0.1"} 2' in lines
+    assert 'test_duration_seconds_bucket{le="1.0"} 3' in lines
+    assert 'test_duration_seconds_bucket{le="+Inf"} 4' in lines
+    assert 'test_duration_seconds_sum 3.65' in lines
+    assert 'test_duration_seconds_count 4' in lines
+
+
+def test_histogram_time_decorator():
+    """Test la mesure d'une fonction décorée"""
+    registry = Registry()
+    histogram = registry.histogram('test_call_seconds', "Durée", ('kind',))
+
+    @histogram.time(kind='x')
+    def work():
+        return 42
+
+    assert work() == 42
+    assert work() == 42
+    assert histogram.count(kind='x') == 2
+
+
+def test_timed_calls():
+    """Test la mesure de chaque méthode d'un objet enveloppé"""
+    registry = Registry()
+    histogram = registry.histogram('test_storage_seconds', "Durée", ('operation',))
+
+    class Backend:
+        name = 'sqlite'
+
+        def load(self, value):
+            return value * 2
+
+        async def book(self, value):
+            await asyncio.sleep(0.01)
+            return value
+
+    backend = TimedCalls(Backend(), histogram)
+    assert backend.load(2) == 4
+    assert backend.load(3) == 6
+    assert backend.name == 'sqlite'
+    assert histogram.count(operation='load') == 2
+    # Les méthodes asynchrones sont mesurées jusqu'à la fin de l'attente
+    assert asyncio.run(backend.book(5)) == 5
+    assert histogram._values[('book',)][-1] >= 0.01
+
+
+def test_multiprocess_sums_workers(tmp_path):
+    """Test que le rendu additionne les valeurs écrites par chaque worker"""
+    registry = Registry()
+    counter = registry.counter('test_events_total', "Événements", ('kind',))
+    histogram = registry.histogram('test_duration_seconds', "Durée", buckets=(0.1, 1.0))
+    registry.multiprocess(str(tmp_path), interval=3600)
+    counter.inc(kind='a')
+    histogram.observe(0.5)
+    registry.dump()
+    # Fichier d'un autre worker (ou d'un worker arrêté) : mêmes métriques, autre pid
+    os.replace(tmp_path / f'{os.getpid()}.json', tmp_path / '1.json')
+    counter.inc(kind='a')
+    counter.inc(kind='b')
+    lines = registry.render().splitlines()
+    assert 'test_events_total{kind="a"} 3.0' in lines
+    assert 'test_events_total{kind="b"} 1.0' in lines
+    assert 'test_duration_seconds_count 2' in lines
@@ -0,0 +1,117 @@
+import time
+import pytest
+from flask import Flask
+from flask_mail import Mail, Message
+from outbox import FileStatusStore, Outbox, SENT, FAILED
+
+
+@pytest.fixture
+def flask_app():
+    app = Flask(__name__)
+    app.config['MAIL_SUPPRESS_SEND'] = True
+    app.config['MAIL_DEFAULT_SENDER'] = 'jlpt@example.com'
+    app.extensions['test_mail'] = Mail(app)
+    return app
+
+
+class FlakyMail:
+    """Faux Flask-Mail dont la connexion échoue les premiers envois"""
+
+    def __init__(self, failures):
+        self.failures = failures
+        self.sent = []
+        self.connections = 0
+
+    def connect(self):
+        mail = self
+
+        class Connection:
+            def __enter__(self):
+                mail.connections += 1
+                return self
+
+            def __exit__(self, *args):
+                pass
+
+            def send(self, message):
+                if mail.failures:
+                    mail.failures -= 1
+                    raise ConnectionError('smtp down')
+                mail.sent.append(message)
+
+        return Connection()
+
+
+def wait_for(outbox, job_id, timeout=5):
+    deadline = time.monotonic() + timeout
+    while outbox.status(job_id) not in (SENT, FAILED) and time.monotonic() < deadline:
+        time.sleep(0.01)
+    return outbox.status(job_id)
+
+
+def test_messages_share_one_connection(flask_app):
+    """Test que plusieurs emails passent par la même session SMTP"""
+    mail = FlakyMail(failures=0)
+    outbox = Outbox(flask_app, mail, workers=1)
+    with flask_app.app_context():
+        ids = [outbox.submit(Message('Test', recipients=['a@example.com'])) for _ in range(5)]
+    assert [wait_for(outbox, job_id) for job_id in ids] == [SENT] * 5
+    assert mail.connections == 1
+
+
+def test_retry_with_backoff(flask_app):
+    """Test qu'un envoi en échec est réessayé sur une nouvelle connexion"""
+    mail = FlakyMail(failures=2)
+    outbox = Outbox(flask_app, mail, workers=1, backoff=0.01)
+    with flask_app.app_context():
+        job_id = outbox.submit(Message('Test', recipients=['a@example.com']))
+    assert wait_for(outbox, job_id) == SENT
+    assert mail.connections == 3
+
+
+def test_gives_up_after_max_retries(flask_app):
+    """Test que l'email passe en échec après le nombre maximal de tentatives"""
+    mail = FlakyMail(failures=10)
+    outbox = Outbox(flask_app, mail, workers=1, max_retries=2, backoff=0.01)
+    with flask_app.app_context():
+        job_id = outbox.submit(Message('Test', recipients=['a@example.com']))
+    assert wait_for(outbox, job_id) == FAILED
+    assert mail.sent == []
+
+
+def test_inline_mode_with_flask_mail(flask_app):
+    """Test le mode synchrone avec le vrai Flask-Mail"""
+    mail = flask_app.extensions['test_mail']
+    outbox = Outbox(flask_app, mail, workers=0)
+    with flask_app.app_context(), mail.record_messages() as outgoing:
+        job_id = outbox.submit(Message('Test', recipients=['a@example.com']))
+    assert outbox.status(job_id) == SENT
+    assert len(outgoing) == 1
+
+
+def test_unknown_status(flask_app):
+    """Test le statut d'un identifiant inconnu"""
+    outbox = Outbox(flask_app, FlakyMail(failures=0))
+    assert outbox.status('inconnu') is None
+
+
+def test_drain_waits_for_retries(flask_app):
+    """Test que drain attend aussi les emails en cours de nouvelle tentative"""
+    mail = FlakyMail(failures=1)
+    outbox = Outbox(flask_app, mail, workers=1, backoff=0.05)
+    with flask_app.app_context():
+        job_id = outbox.submit(Message('Test', recipients=['a@example.com']), block=True)
+    assert outbox.drain(timeout=5)
+    assert outbox.status(job_id) == SENT
+
+
+def test_statuses_shared_between_workers(flask_app, tmp_path):
+    """Test que le statut d'un email est lisible depuis un autre worker"""
+    path = str(tmp_path / 'verifications.db')
+    mail = flask_app.extensions['test_mail']
+    sender = Outbox(flask_app, mail, workers=0, statuses=FileStatusStore(path))
+    other = Outbox(flask_app, mail, workers=0, statuses=FileStatusStore(path))
+    with flask_app.app_context():
+        job_id = sender.submit(Message('Test', recipients=['a@example.com']))
+    assert other.status(job_id) == SENT
+    assert other.status('inconnu') is None
@@ -0,0 +1,73 @@
+import os
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+from pdf import ConfirmationRenderer, generate_appointment_pdf, render_many, confirmation_filename, zip_stream
+
+DATA = {
+    'name': 'Test User',
+    'email': 'test@example.com',
+    'phone': '0123456789',
+    'date': '2025-03-01',
+    'time': '10:00',
+    'jlpt_level': 'N5',
+}
+
+
+def test_generate_pdf(tmp_path, monkeypatch):
+    """Test la génération du PDF sans fichier temporaire"""
+    monkeypatch.chdir(tmp_path)
+    content = generate_appointment_pdf(DATA).getvalue()
+    assert content.startswith(b'%PDF')
+    assert content.count(b'/Subtype /Image') == 2
+    # Logo recopié en JPEG, sans recompression des pixels
+    assert content.count(b'/DCTDecode') == 1
+    assert os.listdir(tmp_path) == []
+
+
+def test_static_assets_built_once():
+    """Test que le logo et le QR code sont préparés une seule fois"""
+    renderer = ConfirmationRenderer()
+    renderer.render(DATA)
+    logo, qr = renderer._logo, renderer._qr
+    renderer.render(DATA)
+    assert renderer._logo is logo
+    assert renderer._qr is qr
+
+
+def test_concurrent_renders():
+    """Test que des rendus simultanés produisent des PDF complets"""
+    renderer = ConfirmationRenderer()
+    with ThreadPoolExecutor(max_workers=4) as pool:
+        pdfs = list(pool.map(lambda _: renderer.render(DATA).getvalue(), range(8)))
+    assert all(content.count(b'/Subtype /Image') == 2 for content in pdfs)
+    assert all(content.rstrip().endswith(b'%%EOF') for content in pdfs)
+
+
+def test_render_many_in_processes():
+    """Test le rendu en lot sur plusieurs processus puis l'archive ZIP"""
+    appointments = [dict(DATA, id=i, time=f'1{i}:00') for i in range(3)]
+    rendered = list(render_many(appointments, workers=2))
+    assert [appointment['id'] for appointment, _ in rendered] == [0, 1, 2]
+    assert all(pdf.startswith(b'%PDF') for _, pdf in rendered)
+
+    files = [(confirmation_filename(appointment), pdf) for appointment, pdf in rendered]
+    archive = zipfile.ZipFile(BytesIO(b''.join(zip_stream(files))))
+    assert archive.namelist()[0] == 'confirmation_2025-03-01_10h00_0.pdf'
+    assert archive.read(archive.namelist()[2]) == rendered[2][1]
+
+
+def test_render_many_reads_lazily():
+    """Test que le rendu en lot ne lit que quelques rendez-vous d'avance"""
+    read = []
+
+    def appointments():
+        for i in range(6):
+            read.append(i)
+            yield dict(DATA, id=i)
+
+    rendered = render_many(appointments(), workers=2, window=2)
+    first, _ = next(rendered)
+    assert first['id'] == 0
+    assert len(read) <= 3
+    assert [appointment['id'] for appointment, _ in rendered] == [1, 2, 3, 4, 5]
@@ -0,0 +1,89 @@
+import pstats
+import pytest
+from flask import Flask
+from profiling import RequestProfiler, HEADER, route_slug
+
+
+def busy():
+    return sum(i * i for i in range(1000))
+
+
+@pytest.fixture
+def profiled(tmp_path):
+    def make(**kwargs):
+        app = Flask(__name__)
+        app.secret_key = 'test'
+
+        @app.route('/slow/<int:n>')
+        def slow(n):
+            busy()
+            return 'ok'
+
+        @app.route('/fast')
+        def fast():
+            return 'ok'
+
+        profiler = RequestProfiler(str(tmp_path / 'profiles'), **kwargs)
+        profiler.init_app(app)
+        return app.test_client(), profiler
+    return make
+
+
+def test_route_slug():
+    """Test les noms de route utilisés dans les noms de fichier"""
+    assert route_slug('/admin/export') == 'admin.export'
+    assert route_slug('/') == 'index'
+    assert route_slug('/<lang>') == '_lang_'
+
+
+def test_off_by_default(profiled):
+    """Test qu'aucune requête n'est profilée sans échantillonnage ni en-tête"""
+    client, profiler = profiled()
+    client.get('/slow/1')
+    client.get('/fast', headers={HEADER: 'invalide'})
+    assert profiler.captures() == []
+
+
+def test_sampled_routes_are_written(profiled):
+    """Test l'écriture d'un .prof lisible par pstats pour les routes choisies"""
+    client, profiler = profiled(sample_rate=1.0, routes=['/slow/<int:n>'])
+    client.get('/slow/1')
+    client.get('/fast')
+    captures = profiler.captures()
+    assert [(c['method'], c['route']) for c in captures] == [('GET', 'slow._int_n_')]
+    stats = pstats.Stats(profiler.path(captures[0]['file']))
+    assert any(function == 'busy' for _, _, function in stats.stats)
+
+
+def test_signed_header(profiled):
+    """Test qu'un en-tête X-Profile signé déclenche le profilage d'une seule requête"""
+    client, profiler = profiled()
+    client.get('/fast', headers={HEADER: profiler.token()})
+    client.get('/fast')
+    assert len(profiler.captures()) == 1
+
+
+def test_keeps_latest_files(profiled):
+    """Test que seules les max_files captures les plus récentes sont gardées"""
+    client, profiler = profiled(sample_rate=1.0, max_files=2)
+    for n in range(4):
+        client.get(f'/slow/{n}')
+    assert len(profiler.captures()) == 2
+    assert profiler.path('../secret.prof') is None
+
+
+def test_profile_belongs_to_its_request(profiled):
+    """Test qu'une requête non profilée ne termine pas le profil d'une autre sur le même thread"""
+    client, profiler = profiled()
+    app = client.application
+    profiled_ctx = app.test_request_context('/slow/1', headers={HEADER: profiler.token()})
+    other_ctx = app.test_request_context('/fast')
+    with app.app_context(), profiled_ctx:
+        app.preprocess_request()
+        # Contexte d'application distinct, comme pour une autre tâche asyncio
+        with app.app_context(), other_ctx:
+            app.preprocess_request()
+            app.process_response(app.response_class('ok'))
+        assert profiler.captures() == []
+        app.process_response(app.response_class('ok'))
+    assert [c['route'] for c in profiler.captures()] == ['slow._int_n_']
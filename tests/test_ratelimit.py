@@ -0,0 +1,48 @@
+from ratelimit import TokenBucketLimiter, take_all
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_burst_then_refill():
+    """Test que la limite laisse passer une rafale puis regagne un jeton avec le temps"""
+    clock = Clock()
+    limiter = TokenBucketLimiter(3, 600, clock=clock)
+    assert [limiter.take('a@example.com') for _ in range(3)] == [0, 0, 0]
+    assert limiter.take('a@example.com') == 200
+    clock.now += 200
+    assert limiter.take('a@example.com') == 0
+
+
+def test_keys_are_independent():
+    """Test que chaque email ou adresse IP a son propre seau"""
+    limiter = TokenBucketLimiter(1, 60, clock=Clock())
+    assert limiter.take('a') == 0
+    assert limiter.take('b') == 0
+    assert limiter.take('a') > 0
+
+
+def test_max_keys():
+    """Test que les clés les plus anciennes sont oubliées au-delà de max_keys"""
+    limiter = TokenBucketLimiter(1, 60, clock=Clock(), max_keys=2)
+    for key in ('a', 'b', 'c'):
+        limiter.take(key)
+    assert list(limiter._buckets) == ['b', 'c']
+    assert limiter.take('a') == 0
+
+
+def test_take_all_consumes_nothing_on_refusal():
+    """Test qu'un refus par un seau ne consomme pas de jeton dans les autres"""
+    clock = Clock()
+    ip, email = TokenBucketLimiter(2, 600, clock=clock), TokenBucketLimiter(1, 600, clock=clock)
+    assert take_all((ip, '203.0.113.7'), (email, 'a@example.com')) == (None, 0)
+    refused, wait = take_all((ip, '203.0.113.7'), (email, 'a@example.com'))
+    assert refused == 1 and wait > 0
+    # Le jeton de l'adresse IP n'a pas été pris par la demande refusée
+    assert take_all((ip, '203.0.113.7'), (email, 'b@example.com')) == (None, 0)
+    assert ip.take('203.0.113.7') > 0
@@ -0,0 +1,55 @@
+import time
+from reminders import send_in_batches
+
+
+class FakeConnection:
+    def __init__(self, mail):
+        self.mail = mail
+
+    def __enter__(self):
+        self.mail.opened += 1
+        return self
+
+    def __exit__(self, *exc):
+        self.mail.closed += 1
+
+    def send(self, message):
+        if message in self.mail.failing:
+            raise OSError("connexion perdue")
+        self.mail.sent.append(message)
+
+
+class FakeMail:
+    def __init__(self, failing=()):
+        self.failing = set(failing)
+        self.sent = []
+        self.opened = 0
+        self.closed = 0
+
+    def connect(self):
+        return FakeConnection(self)
+
+
+def test_single_session_in_batches():
+    """Test que tous les rappels partent sur une seule session SMTP, lot par lot"""
+    mail = FakeMail()
+    batches = list(send_in_batches(mail, [(i, f'm{i}') for i in range(5)], batch_size=2))
+    assert batches == [([0, 1], []), ([2, 3], []), ([4], [])]
+    assert mail.sent == ['m0', 'm1', 'm2', 'm3', 'm4']
+    assert mail.opened == mail.closed == 1
+
+
+def test_reconnects_after_failure():
+    """Test qu'un échec ne bloque pas les rappels suivants"""
+    mail = FakeMail(failing={'m1'})
+    batches = list(send_in_batches(mail, [(i, f'm{i}') for i in range(3)], batch_size=10))
+    assert batches == [([0, 2], [1])]
+    assert mail.opened == 2
+
+
+def test_throttling():
+    """Test la limite de débit en emails par seconde"""
+    start = time.monotonic()
+    list(send_in_batches(FakeMail(), [(i, f'm{i}') for i in range(4)], rate=100))
+    # Trois intervalles de 10 ms entre quatre emails
+    assert time.monotonic() - start >= 0.029
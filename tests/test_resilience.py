@@ -0,0 +1,108 @@
+import asyncio
+import pytest
+from resilience import CircuitBreaker, CircuitOpen, ResilientCalls, CLOSED, OPEN, HALF_OPEN
+
+
+class Clock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class FlakyStorage:
+    def __init__(self, failures):
+        self.failures = failures
+        self.calls = []
+
+    def _call(self, name):
+        self.calls.append(name)
+        if self.failures:
+            self.failures -= 1
+            raise ConnectionError("backend lent")
+        return name
+
+    def load_slots(self):
+        return self._call('load_slots')
+
+    def book_slot(self, data):
+        return self._call('book_slot')
+
+
+def test_breaker_opens_then_recovers():
+    """Test l'ouverture après plusieurs échecs, puis un seul appel d'essai"""
+    clock = Clock()
+    breaker = CircuitBreaker(threshold=2, reset_timeout=10, clock=clock)
+    breaker.record_failure()
+    assert breaker.state == CLOSED
+    breaker.record_failure()
+    assert breaker.state == OPEN
+    with pytest.raises(CircuitOpen):
+        breaker.before_call()
+
+    clock.now += 10
+    assert breaker.state == HALF_OPEN
+    breaker.before_call()
+    # Un seul essai à la fois
+    with pytest.raises(CircuitOpen):
+        breaker.before_call()
+    # L'essai échoue : nouvelle ouverture complète
+    breaker.record_failure()
+    assert breaker.state == OPEN
+
+    clock.now += 10
+    breaker.before_call()
+    breaker.record_success()
+    assert breaker.state == CLOSED
+
+
+def test_reads_are_retried():
+    """Test qu'une lecture est relancée après un échec passager"""
+    backend = FlakyStorage(failures=2)
+    storage = ResilientCalls(backend, CircuitBreaker(threshold=5), retry_methods=('load_slots',),
+                             retries=2, backoff=0)
+    assert storage.load_slots() == 'load_slots'
+    assert backend.calls == ['load_slots'] * 3
+
+
+def test_writes_are_not_retried():
+    """Test qu'une réservation n'est jamais rejouée"""
+    backend = FlakyStorage(failures=1)
+    storage = ResilientCalls(backend, CircuitBreaker(threshold=5), retry_methods=('load_slots',),
+                             retries=2, backoff=0)
+    with pytest.raises(ConnectionError):
+        storage.book_slot({})
+    assert backend.calls == ['book_slot']
+
+
+def test_open_breaker_fails_fast():
+    """Test que le disjoncteur ouvert refuse les appels sans contacter le backend"""
+    backend = FlakyStorage(failures=100)
+    storage = ResilientCalls(backend, CircuitBreaker(threshold=2, reset_timeout=60),
+                             retry_methods=('load_slots',), retries=5, backoff=0)
+    with pytest.raises(ConnectionError):
+        storage.load_slots()
+    # Les relances s'arrêtent dès l'ouverture du disjoncteur
+    assert len(backend.calls) == 2
+    with pytest.raises(CircuitOpen):
+        storage.load_slots()
+    assert len(backend.calls) == 2
+
+
+def test_async_reads_are_retried():
+    """Test les relances des méthodes asynchrones (mode ASGI)"""
+    class AsyncBackend:
+        def __init__(self):
+            self.calls = 0
+
+        async def load_slots(self):
+            self.calls += 1
+            if self.calls == 1:
+                raise ConnectionError("backend lent")
+            return []
+
+    backend = AsyncBackend()
+    storage = ResilientCalls(backend, CircuitBreaker(), retry_methods=('load_slots',), backoff=0)
+    assert asyncio.run(storage.load_slots()) == []
+    assert backend.calls == 2
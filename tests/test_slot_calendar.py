@@ -0,0 +1,110 @@
+from datetime import datetime
+import pytest
+from slot_calendar import SlotCalendar, diff_slots
+
+
+def row(id, date, time, capacity=1, booked=0):
+    return {'id': id, 'date': date, 'time': time, 'capacity': capacity, 'booked': booked}
+
+
+def test_default_calendar_skips_sundays():
+    """Test la génération des créneaux d'une semaine"""
+    # Du samedi 4 au lundi 6 janvier 2025
+    slots = SlotCalendar().slots(datetime(2025, 1, 4), datetime(2025, 1, 6))
+    dates = {date for date, _ in slots}
+    assert dates == {'2025-01-04', '2025-01-06'}
+    assert len(slots) == 2 * 15
+    assert slots[('2025-01-06', '09:30')] == 1
+    assert ('2025-01-06', '16:30') in slots
+
+
+def test_calendar_configuration():
+    """Test les horaires, jours fermés, jours fériés et la capacité configurables"""
+    calendar = SlotCalendar(first_time='09:00', last_time='11:00', interval=60,
+                            closed_days=('sat', 'sun'), holidays=('2025-01-07',), capacity=4)
+    slots = calendar.slots(datetime(2025, 1, 4), datetime(2025, 1, 8))
+    assert sorted(slots) == [('2025-01-06', '09:00'), ('2025-01-06', '10:00'), ('2025-01-06', '11:00'),
+                             ('2025-01-08', '09:00'), ('2025-01-08', '10:00'), ('2025-01-08', '11:00')]
+    assert set(slots.values()) == {4}
+
+
+def test_calendar_from_env(monkeypatch):
+    """Test la lecture du calendrier depuis les variables d'environnement"""
+    monkeypatch.setenv('SLOT_INTERVAL', '45')
+    monkeypatch.setenv('CLOSED_DAYS', 'Saturday, Sunday')
+    monkeypatch.setenv('HOLIDAYS', '2025-01-01')
+    monkeypatch.setenv('SLOT_CAPACITY', '3')
+    monkeypatch.setenv('CALENDAR_FIRST_DAY', '2024-12-30')
+    monkeypatch.setenv('CALENDAR_LAST_DAY', '2025-01-05')
+    slots = SlotCalendar.from_env().slots()
+    assert {date for date, _ in slots} == {'2024-12-30', '2024-12-31', '2025-01-02', '2025-01-03'}
+    assert sorted({time for _, time in slots}) == ['09:30', '10:15', '11:00', '11:45', '12:30',
+                                                  '13:15', '14:00', '14:45', '15:30', '16:15']
+    assert set(slots.values()) == {3}
+
+
+def test_diff_inserts_only_missing_slots():
+    """Test que seuls les créneaux absents sont insérés"""
+    wanted = {('2025-01-06', '09:30'): 1, ('2025-01-06', '10:00'): 1}
+    existing = [row(1, '2025-01-06', '09:30')]
+    to_insert, to_delete, to_resize = diff_slots(wanted, existing)
+    assert to_insert == [('2025-01-06', '10:00', 1)]
+    assert to_delete == []
+    assert to_resize == []
+
+
+def test_diff_keeps_booked_slots():
+    """Test que les créneaux réservés hors calendrier sont conservés"""
+    wanted = {('2025-01-06', '09:30'): 1}
+    existing = [
+        row(1, '2025-01-06', '09:30', booked=1),
+        row(2, '2025-01-04', '09:30', booked=1),
+        row(3, '2025-01-04', '10:00'),
+    ]
+    to_insert, to_delete, to_resize = diff_slots(wanted, existing)
+    assert to_insert == []
+    assert to_delete == [3]
+    assert to_resize == []
+
+
+def test_diff_removes_free_duplicates():
+    """Test qu'un doublon libre est supprimé au profit du créneau réservé"""
+    wanted = {('2025-01-06', '09:30'): 1}
+    existing = [
+        row(1, '2025-01-06', '09:30'),
+        row(2, '2025-01-06', '09:30', booked=1),
+    ]
+    to_insert, to_delete, to_resize = diff_slots(wanted, existing)
+    assert to_insert == []
+    assert to_delete == [1]
+
+
+def test_diff_resizes_without_dropping_bookings():
+    """Test que la capacité suit le calendrier sans descendre sous les places prises"""
+    wanted = {('2025-01-06', '09:30'): 2, ('2025-01-06', '10:00'): 2, ('2025-01-06', '10:30'): 2}
+    existing = [
+        row(1, '2025-01-06', '09:30', capacity=1),
+        row(2, '2025-01-06', '10:00', capacity=5, booked=3),
+        row(3, '2025-01-06', '10:30', capacity=2, booked=1),
+    ]
+    to_insert, to_delete, to_resize = diff_slots(wanted, existing)
+    assert to_insert == []
+    assert to_delete == []
+    assert sorted(to_resize) == [(1, 2), (2, 3)]
+
+
+def test_calendar_rejects_empty_interval(monkeypatch):
+    """Test qu'un pas nul ou négatif est refusé au lieu de boucler sans fin"""
+    monkeypatch.setenv('SLOT_INTERVAL', '0')
+    with pytest.raises(ValueError):
+        SlotCalendar.from_env()
+    with pytest.raises(ValueError):
+        SlotCalendar(interval=-30)
+
+
+def test_diff_is_idempotent():
+    """Test qu'une seconde synchronisation ne fait rien"""
+    wanted = SlotCalendar().slots(datetime(2025, 1, 6), datetime(2025, 1, 7))
+    to_insert, _, _ = diff_slots(wanted, [])
+    existing = [row(i, d, t, capacity=c) for i, (d, t, c) in enumerate(to_insert)]
+    assert diff_slots(wanted, existing) == ([], [], [])
@@ -0,0 +1,143 @@
+from concurrent.futures import ThreadPoolExecutor
+import pytest
+import sqlite3
+from storage import SQLiteStorage
+
+
+@pytest.fixture
+def storage():
+    storage = SQLiteStorage()
+    storage.insert_slots([('2025-01-06', '09:30', 1), ('2025-01-06', '10:00', 1), ('2025-01-07', '09:30', 1)])
+    return storage
+
+
+def booking(time='09:30', email='test@example.com'):
+    return {
+        'date': '2025-01-06',
+        'time': time,
+        'name': 'Test User',
+        'phone': '0123456789',
+        'email': email,
+        'jlpt_level': 'N5',
+    }
+
+
+def test_insert_slots_ignores_duplicates(storage):
+    """Test que l'insertion d'un créneau existant est ignorée"""
+    storage.insert_slots([('2025-01-06', '09:30', 1), ('2025-01-08', '09:30', 1)])
+    assert len(storage.load_slots()) == 4
+
+
+def test_book_slot(storage):
+    """Test la réservation d'un créneau libre"""
+    assert storage.book_slot(booking()) is not None
+    assert storage.available_times('2025-01-06') == ['10:00']
+    assert storage.unavailable_dates() == ['2025-01-06']
+
+
+def test_book_slot_already_taken(storage):
+    """Test qu'un créneau ne peut être réservé qu'une fois"""
+    assert storage.book_slot(booking()) is not None
+    assert storage.book_slot(booking(email='other@example.com')) is None
+    appointments = storage._query('SELECT email FROM appointments')
+    assert [row['email'] for row in appointments] == ['test@example.com']
+
+
+def test_concurrent_bookings(storage):
+    """Test les confirmations simultanées du même créneau"""
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        results = list(pool.map(lambda i: storage.book_slot(booking(email=f'{i}@example.com')), range(20)))
+    assert len([r for r in results if r is not None]) == 1
+
+
+def test_delete_free_slots_keeps_booked(storage):
+    """Test que la suppression épargne les créneaux réservés"""
+    storage.book_slot(booking())
+    ids = [slot['id'] for slot in storage.load_slots()]
+    storage.delete_free_slots(ids)
+    assert [(s['date'], s['time']) for s in storage.load_slots()] == [('2025-01-06', '09:30')]
+
+
+def test_book_slot_up_to_capacity(storage):
+    """Test qu'un créneau accepte autant de réservations que de places"""
+    storage.insert_slots([('2025-01-08', '09:30', 3)])
+    day = dict(booking(), date='2025-01-08')
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        results = list(pool.map(lambda i: storage.book_slot(dict(day, email=f'{i}@example.com')), range(10)))
+    assert len([r for r in results if r is not None]) == 3
+    assert storage.available_times('2025-01-08') == []
+    assert storage.unavailable_dates() == ['2025-01-08']
+
+
+def test_resize_slots_keeps_bookings(storage):
+    """Test qu'une capacité ne descend jamais sous le nombre de places prises"""
+    storage.insert_slots([('2025-01-08', '09:30', 3)])
+    day = dict(booking(), date='2025-01-08')
+    storage.book_slot(day)
+    storage.book_slot(dict(day, email='other@example.com'))
+    slot_id = [s['id'] for s in storage.load_slots() if s['date'] == '2025-01-08'][0]
+    storage.resize_slots([(slot_id, 1)])
+    assert [s['capacity'] for s in storage.load_slots() if s['id'] == slot_id] == [3]
+    storage.resize_slots([(slot_id, 2)])
+    assert [s['capacity'] for s in storage.load_slots() if s['id'] == slot_id] == [2]
+    assert storage.available_times('2025-01-08') == []
+
+
+def test_migrates_available_column(tmp_path):
+    """Test la migration d'une base créée avec l'ancienne colonne available"""
+    path = str(tmp_path / 'old.db')
+    conn = sqlite3.connect(path)
+    conn.executescript("""
+        CREATE TABLE slots (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            date TEXT NOT NULL,
+            time TEXT NOT NULL,
+            available INTEGER NOT NULL DEFAULT 1,
+            UNIQUE (date, time)
+        );
+        CREATE INDEX idx_slots_date_available ON slots(date, available);
+        INSERT INTO slots (date, time, available) VALUES ('2025-01-06', '09:30', 0), ('2025-01-06', '10:00', 1);
+    """)
+    conn.close()
+    storage = SQLiteStorage(path)
+    assert [(s['time'], s['capacity'], s['booked']) for s in storage.load_slots()] == [
+        ('09:30', 1, 1), ('10:00', 1, 0)]
+    assert storage.available_times('2025-01-06') == ['10:00']
+    assert storage.book_slot(booking('10:00')) is not None
+    assert storage.available_times('2025-01-06') == []
+
+
+def test_reminders_recorded_once(storage):
+    """Test les rendez-vous d'un jour et l'enregistrement idempotent des rappels"""
+    first = storage.book_slot(dict(booking('10:00'), lang='ja'))
+    second = storage.book_slot(booking('09:30'))
+    day = storage.appointments_on('2025-01-06')
+    assert [(a['id'], a['time'], a['lang']) for a in day] == [(second, '09:30', 'fr'), (first, '10:00', 'ja')]
+    assert storage.reminded_ids([first, second]) == set()
+    storage.record_reminders([first])
+    storage.record_reminders([first, second])
+    assert storage.reminded_ids([first, second]) == {first, second}
+
+
+def test_indexes():
+    """Test la présence des index sur (date, available) et (date, time)"""
+    storage = SQLiteStorage()
+    plan = storage._query("EXPLAIN QUERY PLAN SELECT time FROM slots WHERE date = ? AND available = 1", ('2025-01-06',))
+    assert 'idx_slots_date_available' in plan[0]['detail']
+    plan = storage._query("EXPLAIN QUERY PLAN SELECT id FROM slots WHERE date = ? AND time = ?", ('2025-01-06', '09:30'))
+    assert 'INDEX' in plan[0]['detail']
+
+
+def test_appointments_page(storage):
+    """Test la pagination par clé et les filtres de l'export des rendez-vous"""
+    storage.book_slot(booking('10:00'))
+    storage.book_slot(booking('09:30'))
+    storage.book_slot(dict(booking(), date='2025-01-07', jlpt_level='N3'))
+    first = storage.appointments_page(limit=2)
+    assert [(a['date'], a['time']) for a in first] == [('2025-01-06', '09:30'), ('2025-01-06', '10:00')]
+    last = first[-1]
+    rest = storage.appointments_page(after=(last['date'], last['time'], last['id']), limit=2)
+    assert [(a['date'], a['time']) for a in rest] == [('2025-01-07', '09:30')]
+    assert len(storage.appointments_page(date_from='2025-01-07')) == 1
+    assert len(storage.appointments_page(date_to='2025-01-06')) == 2
+    assert [a['jlpt_level'] for a in storage.appointments_page(jlpt_level='N3')] == ['N3']
@@ -0,0 +1,142 @@
+import pytest
+from verifications import (Verification, MemoryVerificationStore, FileVerificationStore,
+                           VERIFIED, CONSUMED, INVALID, LOCKED, EXPIRED)
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture(params=['memory', 'file'])
+def make_store(request, tmp_path):
+    def make(**kwargs):
+        if request.param == 'memory':
+            return MemoryVerificationStore(**kwargs)
+        return FileVerificationStore(str(tmp_path / 'verifications.db'), **kwargs)
+    return make
+
+
+def record(code='123456', email='test@example.com'):
+    return Verification(code, '2025-03-01', '10:00', 'Test User', '0123456789', email, 'N5', 'en')
+
+
+def test_verified_with_right_code(make_store):
+    """Test qu'une demande est retrouvée par son id avec le bon code"""
+    store = make_store()
+    verification_id = store.create(record())
+    status, found = store.check(verification_id, '123456')
+    assert status == VERIFIED
+    assert found.booking() == {'date': '2025-03-01', 'time': '10:00', 'name': 'Test User',
+                               'phone': '0123456789', 'email': 'test@example.com',
+                               'jlpt_level': 'N5', 'lang': 'en'}
+    store.delete(verification_id)
+    assert store.check(verification_id, '123456') == (EXPIRED, None)
+
+
+def test_locked_after_max_attempts(make_store):
+    """Test que la demande est supprimée après trop de codes incorrects"""
+    store = make_store(max_attempts=3)
+    verification_id = store.create(record())
+    assert store.check(verification_id, '000000')[0] == INVALID
+    assert store.check(verification_id, None)[0] == INVALID
+    assert store.get(verification_id).attempts == 2
+    status, found = store.check(verification_id, '111111')
+    assert status == LOCKED
+    assert found.email == 'test@example.com'
+    assert store.check(verification_id, '123456') == (EXPIRED, None)
+
+
+def test_expires_after_ttl(make_store):
+    """Test qu'une demande expire après le délai et que les demandes expirées sont purgées"""
+    clock = Clock()
+    store = make_store(ttl=600, clock=clock)
+    old = store.create(record())
+    clock.now += 300
+    recent = store.create(record(email='other@example.com'))
+    clock.now += 301
+    assert store.get(old) is None
+    assert store.check(old, '123456') == (EXPIRED, None)
+    assert store.check(recent, '123456')[0] == VERIFIED
+
+
+def test_replaces_previous_request(make_store):
+    """Test qu'une nouvelle demande du même navigateur remplace la précédente"""
+    store = make_store()
+    first = store.create(record())
+    second = store.create(record(code='654321'), replace=first)
+    assert first != second
+    assert store.get(first) is None
+    assert store.get(second).code == '654321'
+
+
+def test_file_store_shared_between_instances(tmp_path):
+    """Test que deux processus (deux instances) voient les mêmes demandes et essais"""
+    path = str(tmp_path / 'verifications.db')
+    first = FileVerificationStore(path, max_attempts=2)
+    second = FileVerificationStore(path, max_attempts=2)
+    verification_id = first.create(record())
+    assert second.check(verification_id, '000000')[0] == INVALID
+    assert first.check(verification_id, '000000')[0] == LOCKED
+    assert second.get(verification_id) is None
+
+
+def test_code_accepted_once(make_store):
+    """Test que le bon code n'est accepté qu'une fois, sauf après reopen"""
+    store = make_store()
+    verification_id = store.create(record())
+    assert store.check(verification_id, '123456')[0] == VERIFIED
+    assert store.check(verification_id, '123456')[0] == CONSUMED
+    store.reopen(verification_id)
+    assert store.check(verification_id, '123456')[0] == VERIFIED
+
+
+def test_file_store_consumed_between_instances(tmp_path):
+    """Test que deux workers ne peuvent pas accepter tous deux le même code"""
+    path = str(tmp_path / 'verifications.db')
+    first, second = FileVerificationStore(path), FileVerificationStore(path)
+    verification_id = first.create(record())
+    assert first.check(verification_id, '123456')[0] == VERIFIED
+    assert second.check(verification_id, '123456')[0] == CONSUMED
+
+
+def test_memory_store_bounded():
+    """Test que les demandes les plus anciennes sont retirées au-delà de max_records"""
+    store = MemoryVerificationStore(max_records=2)
+    ids = [store.create(record()) for _ in range(3)]
+    assert store.get(ids[0]) is None
+    assert store.get(ids[2]) is not None
+
+
+def test_records_have_no_dict():
+    """Test que les demandes n'ont pas de __dict__ (__slots__)"""
+    assert not hasattr(record(), '__dict__')
+
+
+def test_file_store_rolls_back_failed_write(tmp_path):
+    """Test qu'une écriture en échec laisse la connexion utilisable"""
+    store = FileVerificationStore(str(tmp_path / 'verifications.db'))
+    broken = record()
+    broken.code = object()   # non sérialisable en JSON
+    with pytest.raises(TypeError):
+        store.create(broken)
+    verification_id = store.create(record())
+    assert store.check(verification_id, '123456')[0] == VERIFIED
+    assert not store._connection().in_transaction
+
+
+def test_file_store_adds_consumed_column(tmp_path):
+    """Test qu'un fichier créé avant la colonne consumed reste utilisable"""
+    import sqlite3
+    path = str(tmp_path / 'verifications.db')
+    conn = sqlite3.connect(path)
+    conn.execute('CREATE TABLE verifications (id TEXT PRIMARY KEY, expires REAL NOT NULL, '
+                 'attempts INTEGER NOT NULL DEFAULT 0, record TEXT NOT NULL)')
+    conn.close()
+    store = FileVerificationStore(path)
+    verification_id = store.create(record())
+    assert store.check(verification_id, '123456')[0] == VERIFIED
+    assert store.check(verification_id, '123456')[0] == CONSUMED
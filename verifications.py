@@ -0,0 +1,251 @@
+import hmac
+import json
+import os
+import secrets
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+
+VERIFIED = 'verified'
+INVALID = 'invalid'
+LOCKED = 'locked'
+EXPIRED = 'expired'
+# Code déjà accepté une fois : la réservation est faite ou en cours (POST répété, autre worker)
+CONSUMED = 'consumed'
+
+
+class Verification:
+    """Demande de rendez-vous en attente de son code, gardée côté serveur."""
+
+    __slots__ = ('code', 'date', 'time', 'name', 'phone', 'email', 'jlpt_level', 'lang', 'expires', 'attempts',
+                 'consumed')
+
+    def __init__(self, code, date, time, name, phone, email, jlpt_level, lang='fr', expires=0.0, attempts=0,
+                 consumed=False):
+        self.code = code
+        self.date = date
+        self.time = time
+        self.name = name
+        self.phone = phone
+        self.email = email
+        self.jlpt_level = jlpt_level
+        self.lang = lang
+        self.expires = expires
+        self.attempts = attempts
+        self.consumed = consumed
+
+    def booking(self):
+        # Données attendues par book_slot et le PDF de confirmation
+        return {'date': self.date, 'time': self.time, 'name': self.name, 'phone': self.phone,
+                'email': self.email, 'jlpt_level': self.jlpt_level, 'lang': self.lang}
+
+
+class VerificationStore:
+    """Demandes en attente de vérification, désignées par un id opaque (seul contenu du cookie).
+
+    Chaque demande expire après `ttl` secondes et est supprimée après
+    `max_attempts` codes erronés : le code à 6 chiffres ne peut pas être deviné.
+    Le bon code n'est accepté qu'une fois : la demande est marquée consommée
+    en même temps qu'elle est vérifiée, et les vérifications suivantes
+    renvoient CONSUMED jusqu'à son expiration.
+    """
+
+    def __init__(self, ttl=600, max_attempts=5, clock=time.time):
+        self.ttl = ttl
+        self.max_attempts = max_attempts
+        self._clock = clock
+
+    def create(self, record, replace=None):
+        # Enregistre la demande et renvoie son id ; `replace` est l'id d'une demande précédente à effacer
+        raise NotImplementedError
+
+    def get(self, verification_id):
+        # La demande si elle n'a pas expiré, sinon None
+        raise NotImplementedError
+
+    def check(self, verification_id, code):
+        # Renvoie (VERIFIED | CONSUMED | INVALID | LOCKED | EXPIRED, demande ou None)
+        # et compte les essais erronés
+        raise NotImplementedError
+
+    def reopen(self, verification_id):
+        # La réservation a échoué : le code peut de nouveau être utilisé
+        raise NotImplementedError
+
+    def delete(self, verification_id):
+        raise NotImplementedError
+
+    def _matches(self, record, code):
+        return hmac.compare_digest(record.code.encode(), (code or '').encode())
+
+
+class MemoryVerificationStore(VerificationStore):
+    """Backend en mémoire, pour un seul processus (tests, mode ASGI avec un worker)."""
+
+    def __init__(self, ttl=600, max_attempts=5, clock=time.time, max_records=100000):
+        super().__init__(ttl, max_attempts, clock)
+        self.max_records = max_records
+        self._lock = threading.Lock()
+        # Même durée de vie pour toutes : l'ordre d'insertion est l'ordre d'expiration
+        self._records = OrderedDict()
+
+    def _purge(self, now):
+        records = self._records
+        while records:
+            verification_id, record = next(iter(records.items()))
+            if record.expires > now:
+                return
+            del records[verification_id]
+
+    def create(self, record, replace=None):
+        verification_id = secrets.token_urlsafe(16)
+        with self._lock:
+            now = self._clock()
+            self._purge(now)
+            if replace is not None:
+                self._records.pop(replace, None)
+            record.expires = now + self.ttl
+            record.attempts = 0
+            self._records[verification_id] = record
+            while len(self._records) > self.max_records:
+                self._records.popitem(last=False)
+        return verification_id
+
+    def get(self, verification_id):
+        with self._lock:
+            self._purge(self._clock())
+            return self._records.get(verification_id)
+
+    def check(self, verification_id, code):
+        with self._lock:
+            self._purge(self._clock())
+            record = self._records.get(verification_id)
+            if record is None:
+                return EXPIRED, None
+            if self._matches(record, code):
+                if record.consumed:
+                    return CONSUMED, record
+                record.consumed = True
+                return VERIFIED, record
+            record.attempts += 1
+            if record.attempts >= self.max_attempts:
+                del self._records[verification_id]
+                return LOCKED, record
+            return INVALID, record
+
+    def reopen(self, verification_id):
+        with self._lock:
+            record = self._records.get(verification_id)
+            if record is not None:
+                record.consumed = False
+
+    def delete(self, verification_id):
+        with self._lock:
+            self._records.pop(verification_id, None)
+
+
+VERIFICATION_SCHEMA = """
+CREATE TABLE IF NOT EXISTS verifications (
+    id TEXT PRIMARY KEY,
+    expires REAL NOT NULL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    consumed INTEGER NOT NULL DEFAULT 0,
+    record TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_verifications_expires ON verifications(expires);
+"""
+
+# Champs enregistrés, dans l'ordre, sous forme de liste JSON (sans les noms de clés)
+_FIELDS = ('code', 'date', 'time', 'name', 'phone', 'email', 'jlpt_level', 'lang')
+
+
+@contextmanager
+def _immediate(conn):
+    # Transaction d'écriture annulée en cas d'erreur : la connexion du processus reste utilisable
+    conn.execute('BEGIN IMMEDIATE')
+    try:
+        yield conn
+    except BaseException:
+        conn.execute('ROLLBACK')
+        raise
+    conn.execute('COMMIT')
+
+
+class FileVerificationStore(VerificationStore):
+    """Backend dans un fichier SQLite local, partagé par les workers d'une même machine."""
+
+    def __init__(self, path, ttl=600, max_attempts=5, clock=time.time):
+        super().__init__(ttl, max_attempts, clock)
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = None
+        self._pid = None
+
+    def _connection(self):
+        # Une connexion par processus : elle ne doit pas être partagée après un fork
+        if self._pid != os.getpid():
+            conn = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None, timeout=5)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.executescript(VERIFICATION_SCHEMA)
+            # Fichier créé avant la colonne consumed
+            if 'consumed' not in {column[1] for column in conn.execute('PRAGMA table_info(verifications)')}:
+                conn.execute('ALTER TABLE verifications ADD COLUMN consumed INTEGER NOT NULL DEFAULT 0')
+            self._conn, self._pid = conn, os.getpid()
+        return self._conn
+
+    def _record(self, row):
+        return Verification(*json.loads(row[2]), expires=row[0], attempts=row[1], consumed=bool(row[3]))
+
+    def create(self, record, replace=None):
+        verification_id = secrets.token_urlsafe(16)
+        now = self._clock()
+        with self._lock, _immediate(self._connection()) as conn:
+            # Index sur expires : seules les lignes expirées sont parcourues
+            conn.execute('DELETE FROM verifications WHERE expires <= ?', (now,))
+            if replace is not None:
+                conn.execute('DELETE FROM verifications WHERE id = ?', (replace,))
+            conn.execute('INSERT INTO verifications (id, expires, record) VALUES (?, ?, ?)',
+                         (verification_id, now + self.ttl,
+                          json.dumps([getattr(record, field) for field in _FIELDS], separators=(',', ':'))))
+        return verification_id
+
+    def get(self, verification_id):
+        with self._lock:
+            row = self._connection().execute(
+                'SELECT expires, attempts, record, consumed FROM verifications WHERE id = ? AND expires > ?',
+                (verification_id, self._clock())).fetchone()
+        return self._record(row) if row else None
+
+    def check(self, verification_id, code):
+        # Transaction d'écriture : deux workers ne peuvent pas compter le même essai
+        # ni accepter tous deux le même code
+        with self._lock, _immediate(self._connection()) as conn:
+            row = conn.execute(
+                'SELECT expires, attempts, record, consumed FROM verifications WHERE id = ? AND expires > ?',
+                (verification_id, self._clock())).fetchone()
+            if row is None:
+                return EXPIRED, None
+            record = self._record(row)
+            if self._matches(record, code):
+                if record.consumed:
+                    return CONSUMED, record
+                conn.execute('UPDATE verifications SET consumed = 1 WHERE id = ?', (verification_id,))
+                record.consumed = True
+                return VERIFIED, record
+            record.attempts += 1
+            if record.attempts >= self.max_attempts:
+                conn.execute('DELETE FROM verifications WHERE id = ?', (verification_id,))
+                return LOCKED, record
+            conn.execute('UPDATE verifications SET attempts = ? WHERE id = ?',
+                         (record.attempts, verification_id))
+            return INVALID, record
+
+    def reopen(self, verification_id):
+        with self._lock:
+            self._connection().execute('UPDATE verifications SET consumed = 0 WHERE id = ?', (verification_id,))
+
+    def delete(self, verification_id):
+        with self._lock:
+            self._connection().execute('DELETE FROM verifications WHERE id = ?', (verification_id,))